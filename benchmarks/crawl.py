@@ -0,0 +1,375 @@
+"""Benchmarks Crawler.crawl against a generated site on a local server.
+
+Generates a site graph, serves it from a local HTTP server and crawls it
+once per concurrency mode. Reports pages per second, p50/p99 page
+latency, peak RSS and CPU time for each mode.
+
+Usage:
+    python benchmarks/crawl.py
+    python benchmarks/crawl.py --pages 2000 --fan-out 20 --latency lognormal:-4:0.5
+    python benchmarks/crawl.py --modes threads async --json --output results.json
+
+Each mode runs in a fresh process so peak RSS and CPU time are not
+shared between modes. The server runs in this process, so its CPU time
+is not counted. Save the JSON output of two commits to compare them.
+
+Latency distributions:
+    fixed:SECONDS           Every response is delayed the same.
+    uniform:LOW:HIGH        Uniformly between LOW and HIGH seconds.
+    exponential:MEAN        Exponentially with a MEAN seconds.
+    lognormal:MU:SIGMA      Log-normally, ex. lognormal:-4:0.5 is ~18ms.
+
+"""
+import argparse
+import asyncio
+import concurrent.futures as cf
+import http.server
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from bitcrawler import crawler
+
+
+MODES = ("sequential", "threads", "async", "processes")
+
+
+def generate_site(pages, fan_out, page_size, private_fraction=0.0, seed=0):
+    """Generates a site graph of html pages.
+
+    Page 0 is served at "/" and links to page 1, so every page is reachable.
+    The other links point to random pages.
+
+    Args:
+        pages (int): The number of pages.
+        fan_out (int): The number of links per page.
+        page_size (int): The approximate size of each page in bytes.
+        private_fraction (float, optional): The fraction of pages served
+            under "/private/", which robots.txt can disallow. Default 0.
+        seed (int, optional): The random seed. Default 0.
+
+    Returns:
+        dict: The html of each page keyed by path.
+
+    """
+    rng = random.Random(seed)
+    paths = ["/"] + [
+        f"/private/{index}" if rng.random() < private_fraction else f"/page/{index}"
+        for index in range(1, pages)]
+    site = {}
+    for index, path in enumerate(paths):
+        targets = [paths[(index + 1) % pages]] + [
+            rng.choice(paths) for _ in range(fan_out - 1)]
+        links = "".join(f'<li><a href="{target}">{target}</a></li>' for target in targets)
+        html = f"<!doctype html><html><head><title>{path}</title></head><body><ul>{links}</ul>"
+        filler = max(page_size - len(html) - len("</body></html>"), 0)
+        site[path] = f"{html}<p>{'x' * filler}</p></body></html>"
+    return site
+
+
+def parse_latency(spec):
+    """Parses a latency distribution.
+
+    Args:
+        spec (str): The distribution, ex. "uniform:0.01:0.05". See the
+            module docstring.
+
+    Returns:
+        callable: Draws a latency in seconds from a random.Random.
+
+    Raises:
+        ValueError: If the distribution is unknown.
+
+    """
+    name, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if name == "fixed":
+        return lambda rng: params[0]
+    if name == "uniform":
+        return lambda rng: rng.uniform(*params)
+    if name == "exponential":
+        return lambda rng: rng.expovariate(1 / params[0]) if params[0] else 0
+    if name == "lognormal":
+        return lambda rng: rng.lognormvariate(*params)
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+def make_robots(disallow=(), crawl_delay=None):
+    """Builds a robots.txt file.
+
+    Args:
+        disallow (list(str), optional): The disallowed path prefixes.
+        crawl_delay (float, optional): The crawl delay in seconds.
+
+    Returns:
+        str: The robots.txt file.
+
+    """
+    lines = ["User-agent: *"] + [f"Disallow: {path}" for path in disallow]
+    if crawl_delay is not None:
+        lines.append(f"Crawl-delay: {crawl_delay:g}")
+    return "\n".join(lines) + "\n"
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    # Keeps up with crawls that open many connections at once.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class SiteServer:
+    """Serves a generated site from a background thread.
+
+    Attributes:
+        url (str): The start URL of the site.
+        requests (int): The number of requests served.
+
+    """
+    def __init__(self, site, robots_txt, latency, seed=0):
+        """Initializes SiteServer.
+
+        Args:
+            site (dict): The html of each page keyed by path.
+            robots_txt (str): The robots.txt file.
+            latency (callable): Draws the delay of each response.
+                See `parse_latency`.
+            seed (int, optional): The random seed of the latencies. Default 0.
+
+        """
+        self.site = {path: html.encode() for path, html in site.items()}
+        self.robots_txt = robots_txt.encode()
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = None
+        self.url = None
+
+    def _make_handler(self):
+        """Builds the request handler class bound to this server."""
+        site_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # The headers and body are written separately, so Nagle's
+                # algorithm would add a delayed ACK to every response.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                with site_server.lock:
+                    site_server.requests += 1
+                    delay = site_server.latency(site_server.rng)
+                if delay > 0:
+                    time.sleep(delay)
+                if self.path == "/robots.txt":
+                    status, content_type, body = 200, "text/plain", site_server.robots_txt
+                elif self.path in site_server.site:
+                    status, content_type, body = 200, "text/html", site_server.site[self.path]
+                else:
+                    status, content_type, body = 404, "text/plain", b""
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.server = _Server(("127.0.0.1", 0), self._make_handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def peak_rss():
+    """Gets the peak resident set size of this process in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def cpu_time():
+    """Gets the CPU seconds used by this process and its finished children."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def run_mode(mode, url, workers=16, crawl_depth=1000, respect_robots=True,
+             respect_robots_crawl_delay=False, page_timeout=30):
+    """Crawls the site in one concurrency mode.
+
+    Meant to run in a fresh process. See `benchmark`.
+
+    Args:
+        mode (str): One of `MODES`.
+        url (str): The start URL.
+        workers (int, optional): The threads, connections or parse processes
+            of the mode. Default 16.
+        crawl_depth (int, optional): The crawl depth. Default 1000.
+        respect_robots (bool, optional): Respect robots.txt. Default True.
+        respect_robots_crawl_delay (bool, optional): Respect the robots.txt
+            crawl delay. Default False.
+        page_timeout (int, optional): The page timeout in seconds. Default 30.
+
+    Returns:
+        dict: The results of the mode.
+
+    """
+    kwargs = {
+        'crawl_depth': crawl_depth,
+        'respect_robots': respect_robots,
+        'respect_robots_crawl_delay': respect_robots_crawl_delay,
+        'body_retention': 'none',
+    }
+    if mode in ("threads", "processes"):
+        kwargs.update(multithreading=True, max_threads=workers)
+    if mode == "processes":
+        kwargs['parse_processes'] = workers
+    crawl = crawler.Crawler(**kwargs)
+
+    cpu_start = cpu_time()
+    start = time.perf_counter()
+    if mode == "async":
+        pages = asyncio.run(crawl.acrawl(
+            url, page_timeout=page_timeout, max_connections=workers,
+            max_connections_per_host=workers))
+    else:
+        pages = crawl.crawl(url, page_timeout=page_timeout)
+    elapsed = time.perf_counter() - start
+
+    snapshot = crawl.metrics.snapshot(top_hosts=0)
+    fetch = snapshot["stages"].get("fetch", {})
+    return {
+        "pages": len(pages),
+        "errors": sum(page.error is not None for page in pages),
+        "seconds": elapsed,
+        "pages_per_sec": len(pages) / elapsed,
+        "latency_p50": fetch.get("p50"),
+        "latency_p99": fetch.get("p99"),
+        "peak_rss_bytes": peak_rss(),
+        "cpu_seconds": cpu_time() - cpu_start,
+        "bytes": snapshot["counters"].get("bytes_total", 0),
+        "robots_denied": snapshot["counters"].get("robots_denied_total", 0),
+    }
+
+
+def benchmark(url, modes=MODES, **kwargs):
+    """Runs `run_mode` for each mode, each in a fresh process.
+
+    Args:
+        url (str): The start URL.
+        modes (list(str), optional): The modes to run. Default `MODES`.
+        **kwargs: Passed to `run_mode`.
+
+    Returns:
+        dict: The results keyed by mode.
+
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for mode in modes:
+        with cf.ProcessPoolExecutor(1, mp_context=context) as pool:
+            results[mode] = pool.submit(run_mode, mode, url, **kwargs).result()
+    return results
+
+
+def git_commit():
+    """Gets the current git commit, or `None` outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--fan-out", type=int, default=10, help="Links per page.")
+    parser.add_argument("--page-size", type=int, default=20_000, help="Bytes per page.")
+    parser.add_argument(
+        "--latency", default="fixed:0.005",
+        help="Response latency distribution, ex. uniform:0.01:0.05.")
+    parser.add_argument(
+        "--private-fraction", type=float, default=0.1,
+        help="Fraction of pages under /private/.")
+    parser.add_argument(
+        "--disallow", nargs="*", default=["/private/"],
+        help="robots.txt disallowed path prefixes.")
+    parser.add_argument("--crawl-delay", type=float, help="robots.txt crawl delay.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument(
+        "--workers", type=int, default=16,
+        help="Threads, connections or parse processes per mode.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print JSON results.")
+    parser.add_argument("--output", help="Also write the JSON results to this file.")
+    args = parser.parse_args()
+
+    site = generate_site(
+        args.pages, args.fan_out, args.page_size, args.private_fraction, args.seed)
+    robots_txt = make_robots(args.disallow, args.crawl_delay)
+    with SiteServer(site, robots_txt, parse_latency(args.latency), args.seed) as server:
+        results = benchmark(
+            server.url, args.modes, workers=args.workers,
+            respect_robots_crawl_delay=args.crawl_delay is not None)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "site": {
+            "pages": args.pages,
+            "fan_out": args.fan_out,
+            "page_size": args.page_size,
+            "latency": args.latency,
+            "private_fraction": args.private_fraction,
+            "disallow": args.disallow,
+            "crawl_delay": args.crawl_delay,
+            "seed": args.seed,
+        },
+        "workers": args.workers,
+        "modes": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.pages} pages, {args.fan_out} links per page, {args.latency} latency")
+    print(
+        f"{'mode':<12}{'pages':>7}{'pages/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'RSS MB':>9}{'CPU s':>8}")
+    for mode, result in results.items():
+        p50, p99 = (
+            (result[key] or 0) * 1000 for key in ("latency_p50", "latency_p99"))
+        print(
+            f"{mode:<12}{result['pages']:>7}{result['pages_per_sec']:>10.1f}"
+            f"{p50:>9.1f}{p99:>9.1f}{result['peak_rss_bytes'] / 1e6:>9.1f}"
+            f"{result['cpu_seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
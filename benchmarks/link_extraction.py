@@ -0,0 +1,190 @@
+"""Benchmarks the link extraction backends in bitcrawler.parsing.
+
+Runs every installed backend over a corpus of html files and reports
+throughput and how closely each backend's links match the bs4 backend.
+
+Usage:
+    python benchmarks/link_extraction.py --corpus path/to/html/files
+    python benchmarks/link_extraction.py --pages 200 --json
+    python benchmarks/link_extraction.py --processes 4
+
+`--processes` also times the process pool used by
+`Crawler(parse_processes=N)` with 1 to N worker processes.
+
+Save real-world pages into the corpus directory (ex. with
+`wget --recursive --level 1 --accept html`). When no corpus is given a
+synthetic corpus is generated instead.
+
+"""
+import argparse
+import concurrent.futures as cf
+import json
+import multiprocessing
+import pathlib
+import random
+import time
+
+from bitcrawler import parsing
+from bitcrawler import webpage
+
+
+def generate_corpus(pages, seed=0):
+    """Generates html pages resembling a typical content site.
+
+    Args:
+        pages (int): The number of pages to generate.
+        seed (int, optional): The random seed. Default 0.
+
+    Returns:
+        list(str): The html documents.
+
+    """
+    rng = random.Random(seed)
+    documents = []
+    for _ in range(pages):
+        nav = "".join(
+            f'<li><a class="nav" href="/section/{index}">Section {index}</a></li>'
+            for index in range(rng.randint(20, 60)))
+        paragraphs = "".join(
+            "<p>" + " ".join("lorem" for _ in range(rng.randint(40, 120))) +
+            f' <a href="https://example{rng.randint(0, 50)}.com/article/'
+            f'{rng.randint(0, 10 ** 6)}?ref=home&amp;page={rng.randint(0, 9)}">more</a></p>'
+            for _ in range(rng.randint(10, 40)))
+        script = "<script>var template = '<a href=\"/js\">';</script>" * rng.randint(1, 5)
+        documents.append(
+            "<!doctype html><html><head><title>Page</title>"
+            '<link rel="canonical" href="/canonical">'
+            f"{script}</head><body><!-- comment --><ul>{nav}</ul>"
+            f"<div>{paragraphs}</div></body></html>")
+    return documents
+
+
+def load_corpus(directory):
+    """Loads every .html and .htm file in a directory tree.
+
+    Args:
+        directory (str): The corpus directory.
+
+    Returns:
+        list(str): The html documents.
+
+    """
+    paths = sorted(
+        path for path in pathlib.Path(directory).rglob("*")
+        if path.suffix.lower() in (".html", ".htm"))
+    return [path.read_text(encoding="utf-8", errors="replace") for path in paths]
+
+
+def run(documents, repeat=3):
+    """Times each installed backend over the documents.
+
+    Args:
+        documents (list(str)): The html documents.
+        repeat (int, optional): Runs per backend. The fastest is reported. Default 3.
+
+    Returns:
+        dict: Results keyed by backend name.
+
+    """
+    total_bytes = sum(len(document.encode("utf-8")) for document in documents)
+    reference = [
+        set(parsing.BeautifulSoupLinkExtractor.get_links(document))
+        for document in documents]
+    results = {}
+    for name, extractor in parsing.LINK_EXTRACTORS.items():
+        if not extractor.is_available():
+            continue
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            links = [extractor.get_links(document) for document in documents]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        matching = sum(
+            set(found) == expected for found, expected in zip(links, reference))
+        results[name] = {
+            "seconds": best,
+            "pages_per_sec": len(documents) / best,
+            "mb_per_sec": total_bytes / best / 1e6,
+            "links": sum(len(found) for found in links),
+            "pages_matching_bs4": matching,
+        }
+    return results
+
+
+def run_processes(documents, processes, engine="bs4"):
+    """Times link extraction in process pools of 1 to `processes` workers.
+
+    Args:
+        documents (list(str)): The html documents.
+        processes (int): The max number of worker processes.
+        engine (str, optional): The link extraction backend. Default "bs4".
+
+    Returns:
+        dict: Results keyed by the number of worker processes.
+
+    """
+    headers = {"Content-Type": "text/html; charset=utf-8"}
+    bodies = [document.encode("utf-8") for document in documents]
+    results = {}
+    for workers in range(1, processes + 1):
+        with cf.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Warm up the workers so process start up is not timed.
+            list(pool.map(webpage.extract_links, ["http://example.com"] * workers,
+                          [b""] * workers, [headers] * workers))
+            start = time.perf_counter()
+            futures = [
+                pool.submit(
+                    webpage.extract_links, "http://example.com/", body,
+                    headers, "utf-8", engine)
+                for body in bodies]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+        results[workers] = {
+            "seconds": elapsed,
+            "pages_per_sec": len(documents) / elapsed,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--corpus", help="Directory of html files.")
+    parser.add_argument(
+        "--pages", type=int, default=200,
+        help="Synthetic pages to generate when no corpus is given.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print JSON results.")
+    parser.add_argument(
+        "--processes", type=int, default=0,
+        help="Also time process pools of 1 to this many workers.")
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus) if args.corpus else generate_corpus(args.pages)
+    if not documents:
+        parser.error("The corpus contains no html files.")
+    results = run(documents, args.repeat)
+    process_results = run_processes(documents, args.processes) if args.processes else {}
+    if args.json:
+        print(json.dumps({
+            "pages": len(documents),
+            "backends": results,
+            "processes": process_results,
+        }, indent=2))
+        return
+    print(f"{len(documents)} pages")
+    print(f"{'backend':<12}{'pages/s':>10}{'MB/s':>8}{'links':>9}{'match bs4':>11}")
+    for name, result in sorted(results.items(), key=lambda item: item[1]["seconds"]):
+        print(
+            f"{name:<12}{result['pages_per_sec']:>10.1f}{result['mb_per_sec']:>8.2f}"
+            f"{result['links']:>9}{result['pages_matching_bs4']:>11}")
+    if process_results:
+        print(f"\n{'processes':<12}{'pages/s':>10}")
+        for workers, result in process_results.items():
+            print(f"{workers:<12}{result['pages_per_sec']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
+from . import aio
+from . import cache
+from . import checkpoint
+from . import concurrency
+from . import deadline
+from . import dns
 from . import link_utils
+from . import metrics
 from . import parsing
 from . import crawler
+from . import distributed
+from . import frontier
+from . import http2
 from . import robots
+from . import sessions
+from . import visited
 from . import webpage
 
 
 from .crawler import Crawler
 from .webpage import WebpageBuilder
 from .webpage import Webpage
+from .webpage import PageRecord
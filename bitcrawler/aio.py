@@ -0,0 +1,393 @@
+"""Provides asyncio page fetching for `Crawler.acrawl`.
+
+Requires the optional aiohttp dependency (`pip install bitcrawler[async]`).
+
+"""
+import asyncio
+import functools
+import logging
+import socket
+import time
+
+import requests
+import requests.structures
+import reppy.exceptions
+from reppy.robots import Robots
+
+from . import robots
+from . import webpage
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+log = logging.getLogger('bitcrawler')
+
+
+def require_aiohttp():
+    """Raises an ImportError if aiohttp is not installed.
+
+    Raises:
+        ImportError: If aiohttp is not installed.
+
+    """
+    if aiohttp is None:
+        raise ImportError(
+            "The asyncio engine requires aiohttp. "
+            "Install it with `pip install bitcrawler[async]`.")
+
+
+def to_aiohttp_kwargs(request_kwargs):
+    """Translates requests library kwargs into aiohttp request kwargs.
+
+    Supports `headers`, `params`, `cookies`, `allow_redirects`, `timeout`
+    and `verify`. Other kwargs are ignored with a warning.
+
+    Args:
+        request_kwargs (dict): The requests library kwargs.
+
+    Returns:
+        dict: The equivalent aiohttp kwargs.
+
+    Examples:
+        >>> to_aiohttp_kwargs({'timeout': 5, 'verify': False})
+        {'timeout': aiohttp.ClientTimeout(total=5), 'ssl': False}
+
+    """
+    aiohttp_kwargs = {}
+    for key, value in (request_kwargs or {}).items():
+        if key in ('headers', 'params', 'cookies', 'allow_redirects'):
+            aiohttp_kwargs[key] = value
+        elif key == 'timeout':
+            if isinstance(value, tuple):
+                connect, read = value
+                aiohttp_kwargs[key] = aiohttp.ClientTimeout(
+                    sock_connect=connect, sock_read=read)
+            else:
+                aiohttp_kwargs[key] = aiohttp.ClientTimeout(total=value)
+        elif key == 'verify':
+            if value is False:
+                aiohttp_kwargs['ssl'] = False
+        else:
+            log.warning("Request kwarg `%s` is not supported by acrawl.", key)
+    return aiohttp_kwargs
+
+
+async def read_body(
+        response,
+        allowed_content_types=None,
+        max_body_size=None,
+        max_download_time=None):
+    """Reads an aiohttp response body, aborting if a download limit is hit.
+
+    The asyncio counterpart of webpage.Webpage.download.
+
+    Args:
+        response (`obj` aiohttp.ClientResponse): The aiohttp response.
+        allowed_content_types (list(str), optional): The content types to
+            download. `None` allows all.
+        max_body_size (int, optional): The max body size in bytes.
+            `None` for no limit.
+        max_download_time (float, optional): The max seconds to spend
+            reading the body. `None` for no limit.
+
+    Returns:
+        tuple(bytes, str): The body and the reason the download was aborted.
+            The body is empty if aborted. The reason is `None` if the whole
+            body was read.
+
+    """
+    page_class = webpage.Webpage
+    if allowed_content_types:
+        allowed_content_types = [
+            content_type.lower() for content_type in allowed_content_types]
+    reason = page_class.check_headers(
+        response.headers, allowed_content_types, max_body_size)
+    if reason:
+        response.close()
+        return b"", reason
+
+    sniff = bool(allowed_content_types) and 'content-type' not in response.headers
+    start = time.monotonic()
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(page_class.CHUNK_SIZE):
+        if sniff:
+            sniff = False
+            content_type = page_class.sniff_content_type(chunk)
+            if content_type and content_type not in allowed_content_types:
+                reason = f"Content type {content_type} is not allowed"
+        body += chunk
+        if max_body_size and len(body) > max_body_size:
+            reason = f"Body exceeds the max body size of {max_body_size} bytes"
+        elif max_download_time and time.monotonic() - start > max_download_time:
+            reason = f"Download exceeded the max download time of {max_download_time} sec"
+        if reason:
+            response.close()
+            return b"", reason
+    return bytes(body), None
+
+
+async def to_requests_response(response, body=None):
+    """Reads an aiohttp response into a requests.Response.
+
+    Lets Webpage handle pages fetched by either engine the same way.
+
+    Args:
+        response (`obj` aiohttp.ClientResponse): The aiohttp response.
+        body (bytes, optional): The body if it was already read.
+
+    Returns:
+        requests.Response: A response holding the status, headers and body.
+
+    """
+    if body is None:
+        body = await response.read()
+    converted = requests.Response()
+    converted.status_code = response.status
+    converted.reason = response.reason
+    converted.url = str(response.url)
+    converted.headers = requests.structures.CaseInsensitiveDict(response.headers)
+    converted.encoding = response.charset
+    converted._content = body
+    return converted
+
+
+class DnsCacheResolver:
+    """An aiohttp resolver that looks hosts up in a dns.DnsCache.
+
+    Lookups run in the default executor, so they do not block the event
+    loop, and share the cache with the threaded crawler.
+
+    """
+    def __init__(self, dns_cache, metrics=None):
+        """Initializes DnsCacheResolver.
+
+        Args:
+            dns_cache (dns.DnsCache): The cache to resolve with.
+            metrics (metrics.Metrics, optional): Records the lookups.
+                Default the cache's `metrics`.
+
+        """
+        self.dns_cache = dns_cache
+        self.metrics = metrics
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        """Resolves a host.
+
+        Returns:
+            list(dict): The addresses as aiohttp resolve results.
+
+        Raises:
+            OSError: If the host cannot be resolved.
+
+        """
+        loop = asyncio.get_running_loop()
+        infos = await loop.run_in_executor(
+            None, functools.partial(
+                self.dns_cache.getaddrinfo, host, port, family, metrics=self.metrics))
+        return [
+            {"hostname": host, "host": sockaddr[0], "port": sockaddr[1],
+             "family": info_family, "proto": proto,
+             "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV}
+            for info_family, _, proto, _, sockaddr in infos]
+
+    async def close(self):
+        """Does nothing. The cache outlives the connector."""
+
+
+class AsyncRobotsCache:
+    """An asyncio robots.txt cache.
+
+    Concurrent lookups for the same robots.txt share one fetch. Entries are
+    kept in a robots.RobotsCache, so capacity, expiry, error handling and
+    persistence follow its settings and the threaded crawler shares them.
+
+    """
+    def __init__(self, session, robots_cache, request_kwargs=None):
+        """Initializes AsyncRobotsCache.
+
+        Args:
+            session (`obj` aiohttp.ClientSession): The session to fetch with.
+            robots_cache (robots.RobotsCache): The cache to store entries in.
+            request_kwargs (dict, optional): aiohttp request kwargs.
+
+        """
+        self.session = session
+        self.robots_cache = robots_cache
+        self.request_kwargs = request_kwargs or {}
+        self._pending = {}
+
+    async def _fetch(self, robots_url):
+        """Fetches and parses a robots.txt file.
+
+        Args:
+            robots_url (str): The robots.txt URL.
+
+        Returns:
+            robots.RobotsEntry: The fetched entry. The robots object is an
+                exception if the cache policy reraises errors.
+
+        """
+        try:
+            async with self.session.get(robots_url, **self.request_kwargs) as res:
+                content = bytearray()
+                async for chunk in res.content.iter_chunked(65536):
+                    content += chunk
+                    if len(content) > robots.MAX_ROBOTS_SIZE:
+                        raise reppy.exceptions.ContentTooLong(
+                            f"Content larger than {robots.MAX_ROBOTS_SIZE} bytes")
+                expires = self.robots_cache.ttl_policy.expires(res)
+                content = bytes(content)
+                robots_obj = robots.ReppyUtils.parse_robots(
+                    robots_url, res.status, content, expires)
+                return robots.RobotsEntry(expires, robots_obj, (res.status, content))
+        except Exception as err:
+            log.error("Error fetching robots.txt %s: %s", robots_url, err)
+            expires, robots_obj = self.robots_cache.cache_policy.exception(robots_url, err)
+            return robots.RobotsEntry(expires, robots_obj, None)
+
+    def _store(self, robots_url, task):
+        """Moves a finished fetch from the pending fetches into the cache."""
+        del self._pending[robots_url]
+        if not task.cancelled():
+            self.robots_cache.store_entry(robots_url, task.result())
+
+    async def get(self, url):
+        """Gets the robots object for the URL.
+
+        Args:
+            url (str): A URL on the host.
+
+        Returns:
+            reppy.Robots: The parsed robots.txt.
+
+        Raises:
+            Exception: The fetch error, if the cache policy reraises errors.
+
+        """
+        robots_url = Robots.robots_url(url)
+        entry = self.robots_cache.get_entry(robots_url)
+        if entry is None:
+            task = self._pending.get(robots_url)
+            if task is None:
+                task = asyncio.ensure_future(self._fetch(robots_url))
+                self._pending[robots_url] = task
+                task.add_done_callback(functools.partial(self._store, robots_url))
+            # Shielded so a cancelled page does not cancel the shared fetch.
+            entry = await asyncio.shield(task)
+        if isinstance(entry.robots, BaseException):
+            raise entry.robots
+        return entry.robots
+
+    def cached_crawl_delay(self, url, user_agent):
+        """Gets a crawl delay only if the robots.txt file is already cached.
+
+        Args:
+            url (str): The target URL.
+            user_agent (str): The user agent.
+
+        Returns:
+            int: The crawl delay in seconds. `None` if the robots.txt file is
+                not cached or has expired. 0 if it could not be fetched.
+
+        """
+        return self.robots_cache.cached_crawl_delay(url, user_agent)
+
+    async def allowed(self, url, user_agent):
+        """Determines if a URL is crawlable for a given user agent.
+
+        Args:
+            url (str): The url to check for crawlability.
+            user_agent (str): The user agent to check for in robots.txt.
+
+        Returns:
+            bool: True if the page is allowed to be crawled.
+
+        """
+        robots_obj = await self.get(url)
+        return robots_obj.allowed(url, user_agent)
+
+
+class AsyncWebpageBuilder:
+    """Builds a Webpage with aiohttp. The asyncio counterpart of
+    webpage.WebpageBuilder.
+    """
+    webpage_class = webpage.Webpage
+
+    @classmethod
+    async def build(
+            cls,
+            url,
+            user_agent,
+            session,
+            request_kwargs=None,
+            respect_robots=True,
+            robots_cache=None,
+            allowed_content_types=None,
+            max_body_size=None,
+            max_download_time=None,
+            metrics=None):
+        """Builds a Webpage by fetching the provided URL.
+
+        Args:
+            url (str): The url for the webpage.
+            user_agent (str): The user_agent to use during requests.
+            session (`obj` aiohttp.ClientSession): The session to fetch with.
+            request_kwargs (dict, optional): aiohttp request kwargs.
+            respect_robots (bool): If true, robots.txt will be honored.
+            robots_cache (AsyncRobotsCache, optional): The robots cache.
+            allowed_content_types (list(str), optional): The content types to
+                download. `None` allows all.
+            max_body_size (int, optional): The max body size in bytes.
+                `None` for no limit.
+            max_download_time (float, optional): The max seconds to spend
+                reading the body. `None` for no limit.
+            metrics (metrics.Metrics, optional): Records the robots.txt,
+                time to first byte and download latencies and the bytes read.
+        Returns:
+            webpage.Webpage: The fetched webpage.
+
+        """
+        page = cls.webpage_class()
+        page.url = url
+        if respect_robots and robots_cache is not None:
+            start = time.perf_counter()
+            try:
+                page.allowed_by_robots = await robots_cache.allowed(url, user_agent)
+            except Exception as err:
+                log.exception(err)
+                page.allowed_by_robots = True
+            if metrics is not None:
+                metrics.observe("robots", time.perf_counter() - start)
+
+        # Only False should prevent crawling (None should allow.)
+        if page.allowed_by_robots is False:
+            page.message = f"URL {page.url} is restricted by robots.txt"
+            return page
+        try:
+            start = time.perf_counter()
+            async with session.get(url, **(request_kwargs or {})) as response:
+                headers_read = time.perf_counter()
+                body, reason = await read_body(
+                    response, allowed_content_types, max_body_size,
+                    max_download_time)
+                page.response = await to_requests_response(response, body)
+            if metrics is not None:
+                metrics.observe("ttfb", headers_read - start)
+                metrics.observe("download", time.perf_counter() - headers_read)
+                if body:
+                    metrics.inc("bytes_total", len(body))
+            if reason:
+                page.message = f"Aborted fetching {page.url}: {reason}"
+                log.info(page.message)
+        except Exception as err:
+            page.message = (
+                "An error occurred while attempting to fetch "
+                f"{page.url}: {err!r}")
+            log.error(page.message)
+            page.error = err
+        if page.response is not None and not page.response.ok and not page.message:
+            page.message = (
+                f"URL {page.url} returned a {page.response.status_code} status code.")
+        return page
@@ -0,0 +1,326 @@
+"""Provides an on-disk HTTP cache for recrawls.
+
+Pages are stored with their validators (ETag and Last-Modified) and the
+links extracted from them. On a recrawl a fresh entry (per Cache-Control
+max-age or Expires) is served without a request, and a stale entry is
+revalidated with `If-None-Match` and `If-Modified-Since`. A 304 response
+rebuilds the page from the cache without downloading or parsing it.
+
+"""
+import collections
+import email.utils
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+import requests.structures
+import requests.utils
+
+from . import webpage
+
+
+CacheEntry = collections.namedtuple(
+    "CacheEntry", [
+        "url", "status_code", "headers", "body", "links",
+        "canonical_url", "etag", "last_modified", "expires"])
+
+
+class HttpCache:
+    """A SQLite backed HTTP cache of crawled pages.
+
+    Safe to share between crawler threads.
+
+    Attributes:
+        path (str): The SQLite database path.
+        store_body (bool): If true, page bodies are stored zlib compressed
+            so pages served from the cache keep their body.
+        hits (int): Pages served from a fresh entry without a request.
+        revalidated (int): Pages rebuilt from the cache after a 304 response.
+        misses (int): Lookups with no entry.
+        stored (int): Pages written to the cache.
+
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            status_code INTEGER,
+            headers TEXT,
+            body BLOB,
+            links TEXT,
+            canonical_url TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            expires REAL
+        )
+    """
+
+    def __init__(self, path, store_body=True):
+        """Initializes HttpCache.
+
+        Args:
+            path (str): The SQLite database path. Created if missing.
+            store_body (bool, optional): Store page bodies. Default True.
+
+        """
+        self.path = path
+        self.store_body = store_body
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(self._SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    @classmethod
+    def parse_cache_control(cls, value):
+        """Parses a Cache-Control header.
+
+        Args:
+            value (str): The header value.
+
+        Returns:
+            dict: Maps lower case directives to their value, or True for
+                directives without one.
+
+        Examples:
+            >>> parse_cache_control("public, max-age=600")
+            {"public": True, "max-age": "600"}
+
+        """
+        directives = {}
+        for directive in (value or "").split(","):
+            name, _, argument = directive.strip().partition("=")
+            if name:
+                directives[name.lower()] = argument.strip('"') or True
+        return directives
+
+    @classmethod
+    def get_expires(cls, headers, now=None):
+        """Gets the time a response stops being fresh.
+
+        Uses Cache-Control max-age, then the Expires header. A response
+        without either must be revalidated on every recrawl.
+
+        Args:
+            headers (dict): The response headers.
+            now (float, optional): The current `time.time()`.
+
+        Returns:
+            float: The expiration timestamp. `None` if the response must
+                not be stored.
+
+        """
+        if now is None:
+            now = time.time()
+        directives = cls.parse_cache_control(headers.get("cache-control"))
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return now
+        max_age = directives.get("max-age")
+        if isinstance(max_age, str) and max_age.isdigit():
+            return now + int(max_age)
+        expires = headers.get("expires")
+        if expires:
+            try:
+                return email.utils.parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                return now
+        return now
+
+    def get(self, url):
+        """Gets the cache entry for a URL.
+
+        Args:
+            url (str): The page URL.
+
+        Returns:
+            CacheEntry: The entry. `None` if the URL is not cached.
+
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, status_code, headers, body, links, canonical_url, "
+                "etag, last_modified, expires FROM pages WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                self.misses += 1
+        if row is None:
+            return None
+        body = zlib.decompress(row[3]) if row[3] is not None else None
+        return CacheEntry(
+            row[0], row[1], json.loads(row[2]), body, json.loads(row[4]),
+            row[5], row[6], row[7], row[8])
+
+    @classmethod
+    def is_fresh(cls, entry, now=None):
+        """Determines if an entry can be used without a request.
+
+        Args:
+            entry (CacheEntry): A cache entry.
+            now (float, optional): The current `time.time()`.
+
+        Returns:
+            bool: True if the entry has not expired.
+
+        """
+        if now is None:
+            now = time.time()
+        return entry.expires > now
+
+    @classmethod
+    def conditional_headers(cls, entry):
+        """Gets the request headers that revalidate an entry.
+
+        Args:
+            entry (CacheEntry): A cache entry.
+
+        Returns:
+            dict: The `If-None-Match` and `If-Modified-Since` headers.
+
+        """
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, page, now=None):
+        """Stores a fetched page and its extracted links.
+
+        Only complete 200 responses that are allowed to be stored are kept.
+
+        Args:
+            page (webpage.Webpage): A webpage whose links have been extracted.
+            now (float, optional): The current `time.time()`.
+
+        Returns:
+            bool: True if the page was stored.
+
+        """
+        response = page.response
+        if (response is None or response.status_code != 200 or
+                page.error is not None or page.message):
+            return False
+        expires = self.get_expires(response.headers, now)
+        if expires is None:
+            return False
+        headers = dict(response.headers)
+        body = zlib.compress(response.content) if self.store_body else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (page.url, response.status_code, json.dumps(headers), body,
+                 json.dumps(page.links or []), page.canonical_url,
+                 response.headers.get("etag"),
+                 response.headers.get("last-modified"), expires))
+            self.stored += 1
+        return True
+
+    def revalidate(self, entry, response, now=None):
+        """Refreshes an entry from a 304 response and rebuilds its page.
+
+        Args:
+            entry (CacheEntry): The entry that was revalidated.
+            response (`obj` requests.Response): The 304 response.
+            now (float, optional): The current `time.time()`.
+
+        Returns:
+            webpage.Webpage: The page rebuilt from the cache.
+
+        """
+        headers = requests.structures.CaseInsensitiveDict(entry.headers)
+        headers.update(response.headers)
+        # Headers describing the 304 itself do not apply to the stored body.
+        for header in ("content-length", "content-encoding", "transfer-encoding"):
+            if header in entry.headers:
+                headers[header] = entry.headers[header]
+            else:
+                headers.pop(header, None)
+        expires = self.get_expires(headers, now)
+        if expires is None:
+            expires = time.time() if now is None else now
+        entry = entry._replace(
+            headers=dict(headers),
+            etag=headers.get("etag", entry.etag),
+            last_modified=headers.get("last-modified", entry.last_modified),
+            expires=expires)
+        with self._lock:
+            self._connection.execute(
+                "UPDATE pages SET headers = ?, etag = ?, last_modified = ?, "
+                "expires = ? WHERE url = ?",
+                (json.dumps(entry.headers), entry.etag, entry.last_modified,
+                 entry.expires, entry.url))
+            self.revalidated += 1
+        return self.to_webpage(entry)
+
+    def fresh_page(self, entry):
+        """Builds the page for a fresh entry, counting it as a hit.
+
+        Args:
+            entry (CacheEntry): A fresh cache entry.
+
+        Returns:
+            webpage.Webpage: The page rebuilt from the cache.
+
+        """
+        with self._lock:
+            self.hits += 1
+        return self.to_webpage(entry)
+
+    @classmethod
+    def to_webpage(cls, entry):
+        """Rebuilds a webpage from a cache entry.
+
+        Args:
+            entry (CacheEntry): A cache entry.
+
+        Returns:
+            webpage.Webpage: The page with a response holding the stored
+                status, headers and body (empty if bodies are not stored),
+                and the stored links.
+
+        """
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.url = entry.url
+        response.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = entry.body if entry.body is not None else b""
+        page = webpage.Webpage()
+        page.url = entry.url
+        page.response = response
+        page.links = list(entry.links)
+        page.canonical_url = entry.canonical_url
+        return page
+
+    def stats(self):
+        """Gets the cache counters.
+
+        Returns:
+            dict: The hits, revalidated, misses and stored counts.
+
+        """
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "stored": self.stored,
+        }
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,195 @@
+"""Provides crawl checkpoints so an interrupted crawl can be resumed.
+
+Every scheduled URL, finished URL and per-host fetch time is recorded in
+a SQLite database as the crawl runs. Writes are queued and committed in
+batches by a background thread, so the crawl workers never wait on disk.
+
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from . import link_utils
+
+
+class Checkpoint:
+    """An incrementally written checkpoint of a crawl.
+
+    Each URL is stored with a state: `QUEUED` once it is scheduled, `DONE`
+    once its page is finished and its links are scheduled, or `SEEN` if it
+    is only known (ex. a canonical URL) and is never fetched. A resumed
+    crawl refetches the `QUEUED` URLs only.
+
+    Attributes:
+        path (str): The SQLite database path.
+        batch_size (int): The max number of writes committed at once.
+
+    """
+    QUEUED = 0
+    DONE = 1
+    SEEN = 2
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+        "CREATE TABLE IF NOT EXISTS urls "
+        "(url TEXT PRIMARY KEY, depth INTEGER, state INTEGER)",
+        "CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, last_fetch REAL)",
+    )
+    _STOP = object()
+
+    def __init__(self, path, batch_size=1000):
+        """Initializes Checkpoint and starts its writer thread.
+
+        Args:
+            path (str): The SQLite database path. Created if missing.
+            batch_size (int, optional): The max number of writes committed
+                at once. Default 1000.
+
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                for statement in self._SCHEMA:
+                    connection.execute(statement)
+        finally:
+            connection.close()
+        self._writer = threading.Thread(
+            target=self._write, name="bitcrawler-checkpoint", daemon=True)
+        self._writer.start()
+
+    def _write(self):
+        """Commits queued writes in batches until the checkpoint is closed."""
+        connection = sqlite3.connect(self.path)
+        try:
+            stop = False
+            while not stop:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                flushed = []
+                with connection:
+                    for write in batch:
+                        if write is self._STOP:
+                            stop = True
+                        elif isinstance(write, threading.Event):
+                            flushed.append(write)
+                        else:
+                            connection.execute(*write)
+                for event in flushed:
+                    event.set()
+        finally:
+            connection.close()
+
+    def _read(self, statement):
+        """Runs a read query on a connection of its own."""
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(statement).fetchall()
+        finally:
+            connection.close()
+
+    def get_meta(self):
+        """Gets the crawl settings recorded by `start`.
+
+        Returns:
+            dict: The settings. `None` if the checkpoint is new.
+
+        """
+        rows = self._read("SELECT key, value FROM meta")
+        if not rows:
+            return None
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_urls(self):
+        """Gets every recorded URL.
+
+        Returns:
+            list(tuple(str, int, int)): The (url, depth, state) of each URL.
+
+        """
+        return self._read("SELECT url, depth, state FROM urls")
+
+    def get_hosts(self):
+        """Gets the time each host was last fetched.
+
+        Returns:
+            dict: Maps hosts to their last fetch `time.time()`.
+
+        """
+        return dict(self._read("SELECT host, last_fetch FROM hosts"))
+
+    def start(self, meta):
+        """Records the crawl settings needed to resume.
+
+        Args:
+            meta (dict): JSON serializable settings.
+
+        """
+        for key, value in meta.items():
+            self._queue.put((
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                (key, json.dumps(value))))
+
+    def scheduled(self, url, depth):
+        """Records a URL added to the frontier.
+
+        Args:
+            url (str): The URL.
+            depth (int): The depth the URL was discovered at.
+
+        """
+        self._queue.put((
+            "INSERT OR IGNORE INTO urls VALUES (?, ?, ?)",
+            (url, depth, self.QUEUED)))
+
+    def seen(self, url):
+        """Records a URL that is visited but never fetched.
+
+        Args:
+            url (str): The URL.
+
+        """
+        self._queue.put((
+            "INSERT OR IGNORE INTO urls VALUES (?, NULL, ?)", (url, self.SEEN)))
+
+    def done(self, url):
+        """Records a finished URL and the fetch time of its host.
+
+        Args:
+            url (str): The URL.
+
+        """
+        self._queue.put((
+            "UPDATE urls SET state = ? WHERE url = ?", (self.DONE, url)))
+        self._queue.put((
+            "INSERT OR REPLACE INTO hosts VALUES (?, ?)",
+            (link_utils.LinkUtils.get_host(url), time.time())))
+
+    def flush(self, timeout=None):
+        """Waits until every queued write is committed.
+
+        Args:
+            timeout (float, optional): Max seconds to wait.
+
+        Returns:
+            bool: True if the writes were committed in time.
+
+        """
+        event = threading.Event()
+        self._queue.put(event)
+        return event.wait(timeout)
+
+    def close(self):
+        """Commits the queued writes and stops the writer thread."""
+        if self._writer.is_alive():
+            self._queue.put(self._STOP)
+            self._writer.join()
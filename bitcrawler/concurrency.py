@@ -0,0 +1,204 @@
+"""Provides adaptive per-host concurrency.
+
+Sets the number of requests in flight to each host from how the host
+responds, using additive increase/multiplicative decrease (AIMD).
+
+"""
+import email.utils
+import time
+
+
+class _HostState:
+    """The concurrency state of a single host."""
+    __slots__ = ("limit", "latency", "baseline", "since_decrease")
+
+    def __init__(self, limit):
+        self.limit = limit
+        # Smoothed (EWMA) latency and the lowest it has been.
+        self.latency = None
+        self.baseline = None
+        # Responses since the limit was last decreased. A new host may
+        # decrease on its first response.
+        self.since_decrease = limit
+
+
+class AdaptiveConcurrency:
+    """Adapts the number of requests in flight to each host.
+
+    Each successful response raises a host's limit by `increase / limit`,
+    about `increase` per round of requests. A congested response (429,
+    502, 503, 504, a timeout or a refused connection) or a latency more
+    than `latency_tolerance` times the host's best smoothed latency
+    multiplies the limit by `decrease`. The limit is decreased at most
+    once per round, so the requests already in flight when a host slows
+    down do not collapse it.
+
+    Not thread-safe. The crawler calls it from the thread that schedules
+    requests.
+
+    Examples:
+        >>> concurrency = AdaptiveConcurrency(min_limit=1, max_limit=8)
+        >>> concurrency.limit("python.org")
+        2
+        >>> concurrency.observe("python.org", latency=0.1, status_code=200)
+        >>> concurrency.observe("python.org", status_code=429, retry_after="30")
+        30.0
+
+    """
+    CONGESTED_STATUS_CODES = frozenset((429, 502, 503, 504))
+
+    def __init__(
+            self,
+            min_limit=1,
+            max_limit=16,
+            initial_limit=2,
+            increase=1.0,
+            decrease=0.5,
+            latency_tolerance=2.0,
+            smoothing=0.2,
+            max_retry_after=300):
+        """Initializes AdaptiveConcurrency.
+
+        Args:
+            min_limit (int, optional): The lowest limit of a host. Default 1.
+            max_limit (int, optional): The highest limit of a host. Default 16.
+            initial_limit (int, optional): The limit of a new host. Clamped to
+                `min_limit` and `max_limit`. Default 2.
+            increase (float, optional): The limit added per round of successful
+                requests. Default 1.
+            decrease (float, optional): The limit multiplier on congestion.
+                Default 0.5.
+            latency_tolerance (float, optional): The multiple of a host's best
+                smoothed latency treated as congestion. `None` ignores latency.
+                Default 2.
+            smoothing (float, optional): The weight of each new latency in the
+                smoothed latency. Default 0.2.
+            max_retry_after (float, optional): The longest `Retry-After` honored,
+                in seconds. Default 300.
+
+        Raises:
+            ValueError: If the limits are not 1 <= min_limit <= max_limit.
+
+        """
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(
+                f"Limits must be 1 <= min_limit <= max_limit, not {min_limit} and {max_limit}")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.initial_limit = min(max(initial_limit, min_limit), max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.max_retry_after = max_retry_after
+        self._hosts = {}
+
+    def _get_state(self, host):
+        """Gets the state of a host, creating it if needed."""
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(float(self.initial_limit))
+        return state
+
+    def limit(self, host):
+        """Gets the max number of requests in flight to a host.
+
+        Args:
+            host (str): The host.
+
+        Returns:
+            int: The limit.
+
+        """
+        state = self._hosts.get(host)
+        if state is None:
+            return self.initial_limit
+        return int(state.limit)
+
+    def limits(self):
+        """Gets the limit of every host seen.
+
+        Returns:
+            dict: The limit of each host.
+
+        """
+        return {host: int(state.limit) for host, state in self._hosts.items()}
+
+    @classmethod
+    def parse_retry_after(cls, value, now=None):
+        """Parses a `Retry-After` header.
+
+        Args:
+            value (str): Seconds or an HTTP date.
+            now (float, optional): The current `time.time()`.
+
+        Returns:
+            float: Seconds to wait. `None` if the value is missing or invalid.
+
+        Examples:
+            >>> AdaptiveConcurrency.parse_retry_after("120")
+            120.0
+
+        """
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if now is None:
+            now = time.time()
+        return max(retry_at.timestamp() - now, 0.0)
+
+    def observe(
+            self, host, latency=None, status_code=None, congested=False,
+            retry_after=None):
+        """Adjusts a host's limit from a finished request.
+
+        Args:
+            host (str): The host.
+            latency (float, optional): The seconds the request took.
+            status_code (int, optional): The response status code.
+            congested (bool, optional): The request failed in a way that
+                suggests the host is overloaded, ex. a timeout. Default False.
+            retry_after (str, optional): The `Retry-After` header.
+
+        Returns:
+            float: Seconds to wait before the next request to the host, from
+                `Retry-After`. `None` if there is no wait.
+
+        """
+        state = self._get_state(host)
+        state.since_decrease += 1
+        congested = congested or status_code in self.CONGESTED_STATUS_CODES
+        if latency is not None and not congested:
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency += self.smoothing * (latency - state.latency)
+            if state.baseline is None or state.latency < state.baseline:
+                state.baseline = state.latency
+            else:
+                # Drifts up so a host that stays slower is not throttled forever.
+                state.baseline += self.smoothing * 0.1 * (state.latency - state.baseline)
+            if (self.latency_tolerance is not None and
+                    state.latency > state.baseline * self.latency_tolerance):
+                congested = True
+
+        if congested:
+            # Responses to requests sent before the last decrease are ignored.
+            if state.since_decrease >= state.limit:
+                state.limit = max(state.limit * self.decrease, self.min_limit)
+                state.since_decrease = 0
+        else:
+            state.limit = min(state.limit + self.increase / state.limit, self.max_limit)
+
+        if retry_after is None or status_code not in (429, 503):
+            return None
+        delay = self.parse_retry_after(retry_after)
+        if delay is None:
+            return None
+        return min(delay, self.max_retry_after)
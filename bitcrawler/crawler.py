@@ -1,12 +1,29 @@
 """ This module provides functionality for crawling the web.
 
 """
+import asyncio
 import logging
+import multiprocessing
 import time
 import concurrent.futures as cf
+import urllib.parse
 
+import requests
+
+from . import aio
+from . import cache
+from . import checkpoint
+from . import concurrency
+from . import deadline
+from . import dns
+from . import frontier
+from . import http2 as http2_transport
 from . import link_utils
+from . import metrics
+from . import parsing
 from . import robots
+from . import sessions
+from . import visited
 from . import webpage
 
 
@@ -31,49 +48,240 @@ class Crawler:
             multithreading=False,
             max_threads=100,
             webpage_builder=webpage.WebpageBuilder,
+            async_webpage_builder=aio.AsyncWebpageBuilder,
             request_kwargs=None,
             reppy_cache_capacity=100,
             reppy_cache_policy=None,
             reppy_ttl_policy=None,
-            reppy_args=tuple()):
+            reppy_args=tuple(),
+            visited_mode="exact",
+            bloom_capacity=10_000_000,
+            bloom_error_rate=0.001,
+            canonicalize_urls=True,
+            strip_query_params=link_utils.Canonicalizer.DEFAULT_STRIP_PARAMS,
+            respect_canonical=False,
+            body_retention="response",
+            link_extractor="bs4",
+            record_headers=webpage.PageRecord.DEFAULT_HEADERS,
+            allowed_content_types=None,
+            max_body_size=None,
+            max_download_time=None,
+            http_cache=None,
+            parse_processes=0,
+            robots_cache_path=None,
+            metrics_log_interval=None,
+            adaptive_concurrency=False,
+            min_host_concurrency=1,
+            max_host_concurrency=None,
+            priority=None,
+            max_pages=None,
+            max_bytes=None,
+            max_time=None,
+            max_pages_per_host=None,
+            connect_timeout=10,
+            read_timeout=30,
+            http2=False,
+            http2_prior_knowledge=False,
+            dns_cache=True,
+            dns_ttl=300,
+            dns_negative_ttl=30):
         """ Initializs Crawler.
 
         Args:
             user_agent (str): The user_agent to use during requests.
                 Note: This param overrides any user agent kwargs.
-            crawl_delay (int, optional): Seconds to wait between page requests. Default 0.
-                Disabled if multithreading is True.
+            crawl_delay (int, optional): Seconds to wait between requests to the
+                same host. Each host is delayed independently. Default 0.
             crawl_depth (bool, optional): Depth of pages to crawl. Default 5.
             cross_site (bool, optional): Allow crawling across domains. Default False.
             respect_robots (bool, optional): Respect robots.txt. Default True.
             respect_robots_crawl_delay (bool, optional): Respect robots.txt crawl delay.
-                Disabled if multithreading is True.
+                The larger of the robots.txt delay and `crawl_delay` is used
+                for each host.
             multithreading (bool, optional): Crawl using multithreading. Default False.
             max_threads (int, optional): Max number of treads. Default 100.
                 Set to 1 if multithreading is False.
             webpage_class (`obj` webpage.Webpage, optional): The webpage.Webpage class to use
                 for fetching and storing relevant webpage info.
                 Allows for the extension of the class. Default webpage.Webpage.
+            async_webpage_builder (`obj` aio.AsyncWebpageBuilder, optional): The
+                builder used by `acrawl`. Default aio.AsyncWebpageBuilder.
             request_kwargs (dict, optional): The page retrieval request kwargs. Default `None`
             reppy_cache_capacity (int, optional): The number of reppy.Robots objects to
                 store in cache. Default 100.
-            reppy_cache_policy (`obj`, optional): The reppy ttl policy.
-                If `None` default is reppy.cache.policy.ReraiseExceptionPolicy(ttl=600).
+            reppy_cache_policy (`obj`, optional): The reppy cache policy for
+                robots.txt fetch errors. If `None` default is
+                reppy.cache.RobotsCache.DEFAULT_CACHE_POLICY.
                 See reppy for more details (https://github.com/seomoz/reppy).
             reppy_ttl_policy (`obj`, optional): The reppy ttl policy.
                 If `None` default is reppy.Robots.DEFAULT_TTL_POLICY.
                 See reppy for more details (https://github.com/seomoz/reppy).
             reppy_args (tuple, optional): Additional args passed to the
-                reppy.cache.RobotsCache initialization.
+                robots.RobotsCache initialization.
+            robots_cache_path (str, optional): A SQLite database that robots.txt
+                files are persisted to, so later runs skip fetching them until
+                they expire. Default `None`.
+            visited_mode (str, optional): How scheduled URLs are remembered.
+                "exact" stores a 64 bit fingerprint per URL. "bloom" uses a
+                fixed size Bloom filter. Default "exact".
+            bloom_capacity (int, optional): The number of URLs the Bloom filter
+                is sized for. Only used when `visited_mode` is "bloom".
+                Default 10,000,000.
+            bloom_error_rate (float, optional): The Bloom filter false-positive
+                rate at capacity. A false positive skips a new URL. Only used
+                when `visited_mode` is "bloom". Default 0.001.
+            canonicalize_urls (bool, optional): Canonicalize start URLs and
+                discovered links before they are deduplicated and scheduled.
+                See link_utils.Canonicalizer. Default True.
+            strip_query_params (list(str), optional): Query parameters removed
+                during canonicalization. Supports shell-style wildcards.
+                Default link_utils.Canonicalizer.DEFAULT_STRIP_PARAMS.
+            respect_canonical (bool, optional): Treat the URL declared by a page's
+                `<link rel="canonical">` tag as visited so it is not fetched
+                again. Default False.
+            body_retention (str, optional): What is kept of each page once its
+                links are extracted. "response" keeps the webpage.Webpage with
+                its full requests.Response. "full", "compressed" and "none"
+                produce a compact webpage.PageRecord that keeps the body,
+                keeps it zlib compressed or drops it. Default "response".
+            link_extractor (str, optional): The link extraction backend. "bs4"
+                builds a BeautifulSoup tree, "stream" is a tokenizer that does not
+                build a tree, and "lxml" and "selectolax" require those packages.
+                See parsing.get_link_extractor. Default "bs4".
+            record_headers (list(str), optional): The response headers kept by
+                a webpage.PageRecord. Default webpage.PageRecord.DEFAULT_HEADERS.
+            allowed_content_types (list(str), optional): The content types to
+                download, ex. ["text/html"]. Other bodies are abandoned after
+                the headers (or first bytes) arrive. Default `None` allows all.
+            max_body_size (int, optional): The max body size in bytes. Larger
+                bodies are abandoned. Default `None` for no limit.
+            max_download_time (float, optional): The max seconds to spend reading
+                a body. Default `None` for no limit.
+            http_cache (str or `obj` cache.HttpCache, optional): An on-disk HTTP
+                cache, or the path of one. Pages still fresh per Cache-Control are
+                served from it without a request (or robots.txt check), and stale
+                pages are revalidated with conditional requests. Default `None`.
+            parse_processes (int, optional): The number of worker processes that
+                extract links. Pages are still fetched by threads (or asyncio),
+                but parsing runs outside the GIL so it scales with cores. Only
+                the body and headers are sent to a process, so a custom
+                webpage.Webpage link extraction is not used. Default 0 parses
+                in the fetching threads.
+            metrics_log_interval (float, optional): Seconds between crawl metrics
+                log lines while crawling. The metrics are always recorded in
+                `Crawler.metrics`, see metrics.Metrics. Default `None` only
+                logs them when the crawl ends.
+            adaptive_concurrency (bool or `obj` concurrency.AdaptiveConcurrency,
+                optional): Adapt the number of requests in flight to each host
+                from its latency, errors and `Retry-After` headers. The limits
+                chosen are in `Crawler.host_concurrency.limits()`. Default False
+                lets each host use every worker.
+            min_host_concurrency (int, optional): The lowest limit of a host
+                when `adaptive_concurrency` is True. Default 1.
+            max_host_concurrency (int, optional): The highest limit of a host
+                when `adaptive_concurrency` is True. Default `None` uses
+                `max_threads`.
+            priority (callable, optional): Scores each URL before it is queued,
+                called with the URL, its depth and the webpage it was found on
+                (`None` for start URLs). Higher scores are crawled first. See
+                frontier.UrlPatternPriority. Default `None` crawls breadth-first.
+            max_pages (int, optional): The max number of pages to fetch.
+                Default `None` for no limit.
+            max_bytes (int, optional): The max number of body bytes to download,
+                as counted in the `bytes_total` metric by the webpage builder.
+                Default `None` for no limit.
+            max_time (float, optional): The max seconds to crawl for. Pages
+                still in flight are cut off when it passes. Default `None` for
+                no limit.
+            max_pages_per_host (int, optional): The max number of pages to
+                fetch from each host. Default `None` for no limit.
+            connect_timeout (float, optional): Seconds to wait for a connection.
+                Default 10.
+            read_timeout (float, optional): Seconds to wait for each read from
+                the server. Default 30.
+            http2 (bool, optional): Fetch pages and robots.txt files with the
+                HTTP/2 transport, multiplexing the requests to a host over a
+                few connections. HTTPS servers without HTTP/2 are fetched with
+                HTTP/1.1. Requires httpx and h2. Default False.
+            http2_prior_knowledge (bool, optional): With `http2`, also speak
+                HTTP/2 to plain HTTP servers, falling back to HTTP/1.1 for
+                those that refuse it. Default False.
+            dns_cache (bool or `obj` dns.DnsCache, optional): Resolve hosts
+                through a DNS cache shared by every worker and by the robots.txt
+                fetches. A DnsCache may be passed to share it between crawlers.
+                The hit rate is reported as `dns_hit_rate` in the crawl metrics.
+                Not used by the HTTP/2 transport. Default True.
+            dns_ttl (float, optional): Seconds to cache a resolved host.
+                Default 300.
+            dns_negative_ttl (float, optional): Seconds to cache a host that
+                failed to resolve. Default 30.
+
+            Once `max_pages`, `max_bytes` or `max_time` is reached no more
+            pages are started, the pages in flight finish (`max_time` cuts them
+            off) and the crawl returns the pages fetched so far. The reason is kept in
+            `Crawler.budget_exhausted`.
+
+            `connect_timeout` and `read_timeout` are used unless
+            `request_kwargs` has a `timeout`. Every page also has a deadline
+            of `page_timeout` seconds, enforced inside the fetch.
 
         """
         self.webpage_builder = webpage_builder
+        self.async_webpage_builder = async_webpage_builder
         self.user_agent = user_agent
         self.crawl_depth = crawl_depth
         self.cross_site = cross_site
         self.respect_robots = respect_robots
         self.multithreading = multithreading
-
+        if visited_mode not in ("exact", "bloom"):
+            raise ValueError(
+                f"visited_mode must be 'exact' or 'bloom', not {visited_mode!r}")
+        self.visited_mode = visited_mode
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.visited = None
+        # Links skipped by the scheduler because robots.txt disallows them.
+        self.robots_disallowed = 0
+        self.canonicalize_urls = canonicalize_urls
+        self.canonicalizer = link_utils.Canonicalizer(strip_query_params)
+        self.respect_canonical = respect_canonical
+        if (body_retention != "response" and
+                body_retention not in webpage.PageRecord.RETENTION_POLICIES):
+            raise ValueError(
+                "body_retention must be 'response' or one of "
+                f"{webpage.PageRecord.RETENTION_POLICIES}, not {body_retention!r}")
+        self.body_retention = body_retention
+        # Fails early if the backend is unknown or not installed.
+        parsing.get_link_extractor(link_extractor)
+        self.link_extractor = link_extractor
+        self.record_headers = tuple(header.lower() for header in record_headers)
+        self.allowed_content_types = allowed_content_types
+        self.max_body_size = max_body_size
+        self.max_download_time = max_download_time
+        if isinstance(http_cache, str):
+            http_cache = cache.HttpCache(http_cache)
+        self.http_cache = http_cache
+        self.parse_processes = parse_processes
+        self._process_pool = None
+        # Reset when a crawl starts.
+        self.metrics = metrics.Metrics()
+        self.metrics_log_interval = metrics_log_interval
+        if dns_cache is True:
+            dns_cache = dns.DnsCache(dns_ttl, dns_negative_ttl)
+        elif dns_cache is False:
+            dns_cache = None
+        # Lookups are recorded in this crawler's metrics even if the cache is shared.
+        self.dns_cache = dns_cache
+        self.priority = priority
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_time = max_time
+        self.max_pages_per_host = max_pages_per_host
+        # The budget that stopped the last crawl. `None` if it finished.
+        self.budget_exhausted = None
+        self._pages_started = 0
+        self._crawl_started = None
+        self._host_pages = {}
 
         if not request_kwargs:
             request_kwargs = {}
@@ -85,32 +293,49 @@ class Crawler:
             request_kwargs['headers'] = {**request_kwargs['headers'], **user_agent_header}
         else:
             request_kwargs['headers'] = user_agent_header
+        request_kwargs.setdefault('timeout', (connect_timeout, read_timeout))
 
         self.request_kwargs = request_kwargs
-        self.reppy = robots.RobotsCache(
-	       reppy_cache_capacity, reppy_cache_policy,
-           reppy_ttl_policy, *reppy_args, **self.request_kwargs)
 
+        self.crawl_delay = crawl_delay
+        self.respect_robots_crawl_delay = respect_robots_crawl_delay
         if multithreading:
-            if crawl_delay or respect_robots_crawl_delay:
-                log.warning(
-                    "Field `crawl_delay` and `respect_robots_crawl_delay` "
-                    "are disabled when multithreading is True.")
             self.max_threads = max_threads
         else:
             log.warning(
                 "multithreading is set to False. Defaulting "
                 "max_threads to 1.")
             self.max_threads = 1
-            self.crawl_delay = crawl_delay
-            self.respect_robots_crawl_delay = respect_robots_crawl_delay
+
+        if adaptive_concurrency is True:
+            adaptive_concurrency = concurrency.AdaptiveConcurrency(
+                min_host_concurrency,
+                max(max_host_concurrency or self.max_threads, min_host_concurrency))
+        self.host_concurrency = adaptive_concurrency or None
+
+        if http2:
+            # One multiplexing session shared by every worker.
+            self.session_pool = http2_transport.Http2SessionPool(
+                prior_knowledge=http2_prior_knowledge,
+                verify=self.request_kwargs.get('verify', True))
+        else:
+            # One keep-alive session per worker, shared by page and robots fetches.
+            self.session_pool = sessions.SessionPool(
+                size=self.max_threads, dns_cache=self.dns_cache, metrics=self.metrics)
+        self.reppy = robots.RobotsCache(
+            reppy_cache_capacity, reppy_cache_policy,
+            reppy_ttl_policy, *reppy_args,
+            session_pool=self.session_pool,
+            persist_path=robots_cache_path,
+            **self.request_kwargs)
 
 
     def parse(self, webpages):
         """Parses the webpages. Meant to be Overridden.
 
         Args:
-            webpages (list(webpage.Webpage)): A list of webpages.
+            webpages (list(webpage.Webpage)): A list of webpages. Compact
+                webpage.PageRecord objects when `body_retention` is not "response".
 
         Returns:
             list(webpage.Webpage): The crawled webpages.
@@ -119,21 +344,22 @@ class Crawler:
         return list(webpages)
 
 
-    def _wait_crawl_delay(self, url, reppy):
-        """Sleeps for the crawl delay.
+    def _host_crawl_delay(self, url):
+        """Gets the robots.txt crawl delay for the URL's host without fetching.
+
+        Used by the frontier to space out requests to each host.
 
         Args:
-            url (str): The current URL.
-            reppy (:obj: `robots.RobotParser`): A reppy object.
+            url (str): A URL on the host.
+
+        Returns:
+            float: The crawl delay in seconds. `None` if the robots.txt
+                file has not been fetched yet.
 
         """
-        if not self.multithreading:
-            if self.respect_robots_crawl_delay:
-                robots_crawl_delay = reppy.crawl_delay(url, self.user_agent)
-                delay = max(robots_crawl_delay, self.crawl_delay)
-            else:
-                delay = self.crawl_delay
-            time.sleep(delay)
+        if not self.respect_robots_crawl_delay:
+            return 0
+        return self.reppy.cached_crawl_delay(url, self.user_agent)
 
 
     def _is_crawlable_domain(
@@ -141,16 +367,19 @@ class Crawler:
         """Checks if a domain is crawlable.
 
         If the domain is the same as the original url, it is crawlable.
-        Crawlable if `cross_site` is True and the url domain is in `allowed_domains`.
-        Crawlable if `cross_site` is True and the url domain is in `disallowed_domains`.
+        Crawlable if `cross_site` is True and the url host is in `allowed_domains`.
+        Crawlable if `cross_site` is True and the url host is not in `disallowed_domains`.
+        A listed domain covers its subdomains, and "*.python.org" covers
+        only the subdomains. See link_utils.DomainMatcher.
 
         Args:
             url (str): The URL to be crawled.
-            original_domains (list(str)): The domain from the original URL.
-            allowed_domains (list(str)): A list of allowed domains.
-                Disabled when `cross_site` is False.
-            disallowed_domains (list(str)): A list of disallowed domains.
-                Disabled when `cross_site` is False. Disabled when
+            original_domains (set(str)): The domain from the original URL.
+            allowed_domains (link_utils.DomainMatcher): The allowed domains.
+                Disabled when `cross_site` is False. A list is indexed on
+                every call, so crawls index it once with `_compile_domains`.
+            disallowed_domains (link_utils.DomainMatcher): The disallowed
+                domains. Disabled when `cross_site` is False. Disabled when
                 allowed domains is not empty/null.
 
         Returns:
@@ -172,9 +401,10 @@ class Crawler:
             crawlable = True
         elif self.cross_site:
             if allowed_domains:
-                crawlable = url in allowed_domains
+                crawlable = link_utils.DomainMatcher.compile(allowed_domains).matches(url)
             elif disallowed_domains:
-                crawlable = url not in disallowed_domains
+                crawlable = not link_utils.DomainMatcher.compile(
+                    disallowed_domains).matches(url)
             else:
                 crawlable = True
         else:
@@ -183,30 +413,482 @@ class Crawler:
         return crawlable
 
 
-    def crawl(
-        self, urls, allowed_domains=None,
-        disallowed_domains=None, page_timeout=10):
-        """Crawls webpages by traversing links.
+    @staticmethod
+    def _compile_domains(original_domains, allowed_domains, disallowed_domains):
+        """Indexes the domain lists of a crawl for `_is_crawlable_domain`.
 
         Args:
-            urls list(str): The URL or list of start URLs to be crawled.
-            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
-                Original URL domain takes precidence. `cross_site` must be
-                enabled.
-            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
-                Original URL domain takes precidence. `cross_site` must be
-                enabled and `allowed_domains` must be empty/null.
-            page_timeout (int, optional): Number of seconds to allow for page retrieval. Default 10.
+            original_domains (list(str)): The domains of the start URLs.
+            allowed_domains (list(str)): A list of allowed domains.
+            disallowed_domains (list(str)): A list of disallowed domains.
 
         Returns:
-            self.parse(webpages): Returns a call to the overidable parse function.
-                Supplies the webpages as input.
+            tuple:
+                set(str): The domains of the start URLs.
+                link_utils.DomainMatcher: The allowed domains.
+                link_utils.DomainMatcher: The disallowed domains.
+
+        """
+        return (
+            set(original_domains),
+            link_utils.DomainMatcher.compile(allowed_domains),
+            link_utils.DomainMatcher.compile(disallowed_domains))
+
+
+    def _new_visited_set(self):
+        """Creates the set used to remember scheduled URLs.
+
+        Returns:
+            visited.VisitedSet: An empty visited set for `visited_mode`.
+
+        """
+        if self.visited_mode == "bloom":
+            return visited.BloomVisitedSet(
+                self.bloom_capacity, self.bloom_error_rate)
+        return visited.VisitedSet()
+
+
+    def _canonicalize(self, url):
+        """Canonicalizes a URL if `canonicalize_urls` is enabled.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            str: The canonical URL.
+
+        """
+        if self.canonicalize_urls:
+            return self.canonicalizer.canonicalize(url)
+        return url
+
+
+    def _start_process_pool(self):
+        """Starts the link extraction process pool if `parse_processes` is set."""
+        if self.parse_processes and self._process_pool is None:
+            # Spawned, since forking a process that runs threads is unsafe.
+            self._process_pool = cf.ProcessPoolExecutor(
+                max_workers=self.parse_processes,
+                mp_context=multiprocessing.get_context("spawn"))
+
+
+    def _stop_process_pool(self):
+        """Shuts down the link extraction process pool."""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._process_pool = None
+
+
+    def _fetch_page(self, url, page_timeout=None):
+        """Builds the webpage for a URL and extracts its links.
+
+        Runs inside a worker thread. The builder enforces the page deadline,
+        so the worker is free again soon after it passes.
+
+        Args:
+            url (str): The URL to fetch.
+            page_timeout (float, optional): Seconds to allow for the fetch.
+                Capped at the time left of `max_time`.
+
+        Returns:
+            webpage.Webpage: The fetched webpage with its links populated, or
+                a webpage describing the timeout if the deadline passed.
+
+        """
+        entry, request_kwargs = self._get_cache_entry(url, self.request_kwargs)
+        if entry is not None and self.http_cache.is_fresh(entry):
+            return self._compact_page(self.http_cache.fresh_page(entry))
+        page_deadline = self._page_deadline(page_timeout)
+        with self.metrics.time("fetch"):
+            page = self.webpage_builder.build(
+                url,
+                respect_robots=self.respect_robots,
+                user_agent=self.user_agent,
+                request_kwargs=request_kwargs,
+                reppy=self.reppy,
+                session_pool=self.session_pool,
+                allowed_content_types=self.allowed_content_types,
+                max_body_size=self.max_body_size,
+                max_download_time=self.max_download_time,
+                metrics=self.metrics,
+                deadline=page_deadline)
+        if page_deadline is not None and page_deadline.expired():
+            return self._timeout_page(url, page_timeout)
+        if self.respect_robots_crawl_delay:
+            # Loads robots.txt so the frontier knows the host's crawl delay.
+            try:
+                self.reppy.crawl_delay(url, self.user_agent)
+            except Exception as err:
+                log.exception(err)
+        return self._extract_links(page, entry)
+
+
+    def _get_cache_entry(self, url, request_kwargs):
+        """Looks up a URL in the HTTP cache.
+
+        Args:
+            url (str): The URL to fetch.
+            request_kwargs (dict): The page retrieval request kwargs.
+
+        Returns:
+            tuple:
+                cache.CacheEntry: The cached entry. `None` if there is no
+                    HTTP cache or the URL is not cached.
+                dict: The request kwargs, with conditional request headers
+                    added when there is an entry.
+
+        """
+        if self.http_cache is None:
+            return None, request_kwargs
+        entry = self.http_cache.get(url)
+        if entry is None:
+            return None, request_kwargs
+        headers = {
+            **request_kwargs.get('headers', {}),
+            **self.http_cache.conditional_headers(entry)}
+        return entry, {**request_kwargs, 'headers': headers}
+
+
+    def _extract_links(self, page, entry=None):
+        """Extracts the links (and canonical link if requested) from a page.
+
+        A 304 response for a cached page is rebuilt from the HTTP cache
+        instead. Other pages are stored in the HTTP cache once their links
+        are extracted.
+
+        Args:
+            page (webpage.Webpage): A fetched webpage.
+            entry (cache.CacheEntry, optional): The HTTP cache entry the page
+                was revalidated against.
+
+        Returns:
+            webpage.Webpage: The webpage with its links populated.
+
+        """
+        if (entry is not None and page.response is not None and
+                page.response.status_code == 304):
+            return self._compact_page(
+                self.http_cache.revalidate(entry, page.response))
+        start = time.perf_counter()
+        # Only HTML has links, so other bodies are not sent to the pool.
+        if (self._process_pool is not None and
+                not isinstance(page, webpage.PageRecord) and
+                page.response is not None and page.response.ok and
+                webpage.Webpage.parse_mime_type(
+                    page.response.headers.get('content-type'))[0] == 'text/html'):
+            response = page.response
+            page.links, canonical_url = self._process_pool.submit(
+                webpage.extract_links, page.url, response.content,
+                dict(response.headers), response.encoding,
+                self.link_extractor, self.respect_canonical).result()
+            if self.respect_canonical:
+                page.canonical_url = canonical_url
+        else:
+            page.get_page_links(self.link_extractor)
+            if self.respect_canonical:
+                page.get_canonical_link(self.link_extractor)
+        self.metrics.observe("parse", time.perf_counter() - start)
+        if self.http_cache is not None and not isinstance(page, webpage.PageRecord):
+            self.http_cache.store(page)
+        return self._compact_page(page)
+
+
+    def _compact_page(self, page):
+        """Applies the body retention policy to a page.
+
+        Args:
+            page (webpage.Webpage): A webpage whose links have been extracted.
+
+        Returns:
+            webpage.Webpage or webpage.PageRecord: The page, or a compact
+                record of it if `body_retention` is not "response".
+
+        """
+        if self.body_retention == "response" or isinstance(page, webpage.PageRecord):
+            return page
+        return webpage.PageRecord.from_webpage(
+            page, self.body_retention, self.record_headers)
+
+
+    @staticmethod
+    def _get_future_page(future, url):
+        """Gets the webpage from a completed future.
+
+        Args:
+            future (`obj` concurrent.futures.Future): A completed page future.
+            url (str): The URL the future was fetching.
+
+        Returns:
+            webpage.Webpage: The fetched webpage, or a placeholder webpage
+                describing the error if the fetch raised.
+
+        """
+        try:
+            return future.result()
+        except Exception as err:
+            page = webpage.Webpage()
+            page.url = url
+            page.links = []
+            page.message = (
+                f"An unexpected error occurred while attempting to "
+                f"fetch url ({page.url}) - {err}")
+            page.error = err
+            log.error(page.message)
+            return page
+
+
+    @staticmethod
+    def _timeout_page(url, page_timeout):
+        """Builds a placeholder webpage for a URL that timed out.
+
+        Args:
+            url (str): The URL that timed out.
+            page_timeout (int): The timeout that was exceeded.
+
+        Returns:
+            webpage.Webpage: A webpage describing the timeout.
+
+        """
+        page = webpage.Webpage()
+        page.url = url
+        page.links = []
+        page.message = (
+            f"A timeout ({page_timeout} sec) occurred while "
+            f"attempting to fetch url ({page.url})")
+        page.error = cf.TimeoutError(page.message)
+        log.error(page.message)
+        return page
+
+
+    def _record_page(self, page):
+        """Counts a finished page in the crawl metrics.
+
+        Args:
+            page (webpage.Webpage): A finished webpage or webpage.PageRecord.
+
+        """
+        self.metrics.inc("pages_total")
+        self.metrics.inc_host(urllib.parse.urlsplit(page.url).netloc)
+        status_code = (
+            page.status_code if isinstance(page, webpage.PageRecord)
+            else page.response.status_code if page.response is not None
+            else None)
+        if status_code is not None:
+            self.metrics.inc("responses_total", status=status_code)
+        if page.allowed_by_robots is False:
+            self.metrics.inc("robots_denied_total")
+        if page.error is not None:
+            self.metrics.inc("errors_total", type=type(page.error).__name__)
+            if isinstance(page.error, (TimeoutError, requests.Timeout)):
+                self.metrics.inc("timeouts_total")
+
+
+    def _record_queue(self, to_crawl, in_flight):
+        """Sets the queue depth and active worker gauges.
+
+        Args:
+            to_crawl (frontier.Frontier): The crawl frontier.
+            in_flight (dict): The running fetches.
+
+        """
+        self.metrics.set_gauge("queue_depth", len(to_crawl))
+        self.metrics.set_gauge("active_workers", len(in_flight))
+
+
+    def _adapt_concurrency(self, page, to_crawl, latency):
+        """Adjusts the concurrency limit of a finished page's host.
+
+        Does nothing unless `adaptive_concurrency` is enabled.
+
+        Args:
+            page (webpage.Webpage): A finished webpage or webpage.PageRecord.
+            to_crawl (frontier.Frontier): The crawl frontier.
+            latency (float): The seconds the page took.
+
+        """
+        # Nothing was requested for a page disallowed by robots.txt.
+        if self.host_concurrency is None or page.allowed_by_robots is False:
+            return
+        if isinstance(page, webpage.PageRecord):
+            status_code, retry_after = page.status_code, page.headers.get("retry-after")
+        elif page.response is not None:
+            status_code = page.response.status_code
+            retry_after = page.response.headers.get("retry-after")
+        else:
+            status_code, retry_after = None, None
+        congested = isinstance(
+            page.error, (TimeoutError, requests.Timeout, requests.ConnectionError))
+        host = link_utils.LinkUtils.get_host(page.url)
+        delay = self.host_concurrency.observe(
+            host, None if page.error is not None else latency, status_code,
+            congested, retry_after)
+        if delay:
+            log.info("Waiting %.1f sec before crawling %s again (Retry-After).", delay, host)
+            to_crawl.delay_host(host, delay)
+        self.metrics.set_gauge(
+            "host_concurrency", self.host_concurrency.limit(host), host=host)
+
+
+    def _score(self, url, depth, page=None):
+        """Scores a URL for the frontier with `priority`.
+
+        Args:
+            url (str): The URL.
+            depth (int): The depth the URL was discovered at.
+            page (webpage.Webpage, optional): The page the URL was found on.
+
+        Returns:
+            float: The score. 0 if there is no `priority`.
+
+        """
+        if self.priority is None:
+            return 0
+        return self.priority(url, depth, page)
+
+
+    def _take_host_quota(self, url):
+        """Counts a URL against its host's `max_pages_per_host` quota.
+
+        Args:
+            url (str): A URL about to be queued.
+
+        Returns:
+            bool: True if the URL may be queued.
+
+        """
+        if self.max_pages_per_host is None:
+            return True
+        host = link_utils.LinkUtils.get_host(url)
+        pages = self._host_pages.get(host, 0)
+        if pages >= self.max_pages_per_host:
+            return False
+        self._host_pages[host] = pages + 1
+        return True
+
+
+    def _check_budget(self):
+        """Checks if the crawl budget is exhausted.
+
+        Sets `budget_exhausted` to the budget that ran out.
+
+        Returns:
+            bool: True if no more pages should be started.
+
+        """
+        if self.budget_exhausted is not None:
+            return True
+        if self.max_pages is not None and self._pages_started >= self.max_pages:
+            self.budget_exhausted = "max_pages"
+        elif (self.max_bytes is not None and
+                self.metrics.get_counter("bytes_total") >= self.max_bytes):
+            self.budget_exhausted = "max_bytes"
+        elif self.max_time is not None and self._time_left() <= 0:
+            self.budget_exhausted = "max_time"
+        else:
+            return False
+        log.info(
+            "Crawl budget %s exhausted. No more pages will be started.",
+            self.budget_exhausted)
+        return True
+
+
+    def _reset_budget(self):
+        """Resets the crawl budgets when a crawl starts."""
+        self.budget_exhausted = None
+        self._pages_started = 0
+        self._crawl_started = time.monotonic()
+        self._host_pages = {}
+
+
+    def _time_left(self):
+        """Gets the seconds left of `max_time`. `None` if there is no limit."""
+        if self.max_time is None:
+            return None
+        return self.max_time - (time.monotonic() - self._crawl_started)
+
+
+    def _page_time_limit(self, page_timeout):
+        """Caps a page's timeout at the time left of `max_time`."""
+        time_left = self._time_left()
+        if time_left is None:
+            return page_timeout
+        if page_timeout is None:
+            return max(time_left, 0)
+        return max(min(page_timeout, time_left), 0)
+
+
+    def _page_deadline(self, page_timeout):
+        """Gets the deadline of a page started now. `None` if it has none."""
+        time_limit = self._page_time_limit(page_timeout)
+        if time_limit is None:
+            return None
+        return deadline.Deadline.after(time_limit)
+
+
+    def _sleep_time(self, wait):
+        """Caps a wait for the frontier at the time left of `max_time`."""
+        time_left = self._time_left()
+        if time_left is None:
+            return wait or 0
+        return max(min(wait if wait is not None else time_left, time_left), 0)
+
+
+    def _new_frontier(self, host_delay):
+        """Creates an empty frontier.
+
+        Args:
+            host_delay (callable): Gets the robots.txt crawl delay for a URL's
+                host. See frontier.Frontier.
+
+        Returns:
+            frontier.Frontier: The frontier.
+
+        """
+        host_limit = (
+            self.host_concurrency.limit if self.host_concurrency is not None else None)
+        return frontier.Frontier(self.crawl_delay, host_delay, host_limit)
+
+
+    def _start_frontier(
+            self, urls, allowed_domains, disallowed_domains, host_delay,
+            crawl_checkpoint=None):
+        """Creates the visited set and a frontier holding the start URLs.
+
+        If the checkpoint holds an earlier run, the visited set and frontier
+        are restored from it instead.
+
+        Args:
+            urls (list(str)): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl.
+            disallowed_domains (list(str)): A list of disallowed domains to crawl.
+            host_delay (callable): Gets the robots.txt crawl delay for a URL's
+                host. See frontier.Frontier.
+            crawl_checkpoint (checkpoint.Checkpoint, optional): The checkpoint
+                to resume from and record the crawl in.
+
+        Returns:
+            tuple:
+                frontier.Frontier: The frontier holding the start URLs.
+                list(str): The domains of the start URLs.
+
         """
+        # Each URL is only scheduled once across all depths.
+        # Kept on the crawler so memory use can be inspected after the crawl.
+        self.visited = self._new_visited_set()
+        self.robots_disallowed = 0
+        self.metrics.reset()
+        self._reset_budget()
+        to_crawl = self._new_frontier(host_delay)
+        meta = crawl_checkpoint.get_meta() if crawl_checkpoint is not None else None
+        if meta is not None:
+            self._resume_frontier(to_crawl, crawl_checkpoint)
+            return to_crawl, [link_utils.LinkUtils.get_domain(url) for url in meta["urls"]]
+
         if isinstance(urls, str):
             urls = [urls]
+        urls = [self._canonicalize(url) for url in urls]
         original_domains = [link_utils.LinkUtils.get_domain(url) for url in urls]
 
-        crawled_urls = {}
         if not self.cross_site and (allowed_domains or disallowed_domains):
             log.warning(
                 "Fields `allowed_domains` and `disallowed_domains` "
@@ -216,65 +898,476 @@ class Crawler:
                 "Fields `allowed_domains` and `disallowed_domains` cannot be "
                 "enabled at the same time. `allowed_domains` takes priority.")
 
-        def _crawl(urls, depth=0):
-            """"Functionality for crawling a set of urls."""
-            # depth starts at 0 so >= terminates
-            if depth >= self.crawl_depth:
-                return
-            futures = []
+        if crawl_checkpoint is not None:
+            crawl_checkpoint.start({"urls": urls, "original_domains": original_domains})
+        for url in urls:
+            if (self.crawl_depth > 0 and self.visited.add(url) and
+                    self._take_host_quota(url)):
+                to_crawl.put(url, 0, self._score(url, 0))
+                if crawl_checkpoint is not None:
+                    crawl_checkpoint.scheduled(url, 0)
+        return to_crawl, original_domains
+
+
+    def _resume_frontier(self, to_crawl, crawl_checkpoint):
+        """Restores the visited set and frontier from a checkpoint.
+
+        Args:
+            to_crawl (frontier.Frontier): An empty frontier.
+            crawl_checkpoint (checkpoint.Checkpoint): The checkpoint.
+
+        """
+        # Hosts fetched just before the interruption still wait out their delay.
+        now = time.time()
+        for host, last_fetch in crawl_checkpoint.get_hosts().items():
+            remaining = last_fetch + self.crawl_delay - now
+            if remaining > 0:
+                to_crawl.delay_host(host, remaining)
+        for url, depth, state in crawl_checkpoint.get_urls():
+            self.visited.add(url)
+            if state != checkpoint.Checkpoint.SEEN:
+                self._take_host_quota(url)
+            if state == checkpoint.Checkpoint.QUEUED:
+                to_crawl.put(url, depth, self._score(url, depth))
+        log.info(
+            "Resumed crawl from %s with %d visited and %d queued urls.",
+            crawl_checkpoint.path, len(self.visited), len(to_crawl))
+
+
+    def _schedule_links(
+            self, page, depth, to_crawl, original_domains,
+            allowed_domains, disallowed_domains, crawl_checkpoint=None):
+        """Adds the unvisited, crawlable links of a fetched page to the frontier.
+
+        Args:
+            page (webpage.Webpage): A fetched webpage.
+            depth (int): The depth the page was fetched at.
+            to_crawl (frontier.Frontier): The crawl frontier.
+            original_domains (list(str)): The domains of the start URLs.
+            allowed_domains (list(str)): A list of allowed domains to crawl.
+            disallowed_domains (list(str)): A list of disallowed domains to crawl.
+            crawl_checkpoint (checkpoint.Checkpoint, optional): The checkpoint
+                to record the scheduled links in.
+
+        """
+        if page.canonical_url:
+            canonical_url = self._canonicalize(page.canonical_url)
+            if self.visited.add(canonical_url) and crawl_checkpoint is not None:
+                crawl_checkpoint.seen(canonical_url)
+
+        # depth starts at 0 so >= terminates
+        if depth + 1 >= self.crawl_depth:
+            return
+        start = time.perf_counter()
+        links = []
+        for link in page.links or []:
+            link = self._canonicalize(link)
+            if link in self.visited:
+                continue
+            if self._is_crawlable_domain(
+                    link, original_domains,
+                    allowed_domains,
+                    disallowed_domains):
+                self.visited.add(link)
+                links.append(link)
+        self.metrics.observe("link_filter", time.perf_counter() - start)
+        for link in self._filter_robots(links, crawl_checkpoint):
+            if not self._take_host_quota(link):
+                if crawl_checkpoint is not None:
+                    crawl_checkpoint.seen(link)
+                continue
+            to_crawl.put(link, depth + 1, self._score(link, depth + 1, page))
+            if crawl_checkpoint is not None:
+                crawl_checkpoint.scheduled(link, depth + 1)
+
+
+    def _filter_robots(self, links, crawl_checkpoint=None):
+        """Drops links disallowed by the cached robots.txt rules of their hosts.
+
+        Links are checked in bulk before they reach the frontier, so they
+        do not take up a worker. Links on hosts whose robots.txt is not
+        cached yet are kept and checked when fetched.
+
+        Args:
+            links (list(str)): Links that have been added to the visited set.
+            crawl_checkpoint (checkpoint.Checkpoint, optional): The checkpoint
+                to record the disallowed links in.
+
+        Returns:
+            list(str): The links that may be crawled.
+
+        """
+        if not self.respect_robots or not links:
+            return links
+        with self.metrics.time("robots_filter"):
+            links, disallowed = self.reppy.partition_allowed(links, self.user_agent)
+        if disallowed:
+            self.robots_disallowed += len(disallowed)
+            self.metrics.inc("robots_denied_total", len(disallowed))
+            log.debug("Skipped %d links disallowed by robots.txt.", len(disallowed))
+            if crawl_checkpoint is not None:
+                for link in disallowed:
+                    crawl_checkpoint.seen(link)
+        return links
+
+
+    def _log_visited(self):
+        """Logs the size of the visited set."""
+        log.info(
+            "Visited set holds %d urls in %d bytes (%.1f bytes per url).",
+            len(self.visited), self.visited.memory_usage(),
+            self.visited.bytes_per_url)
+        if self.robots_disallowed:
+            log.info(
+                "Skipped %d links disallowed by robots.txt.", self.robots_disallowed)
+        if self.host_concurrency is not None:
+            log.info("Host concurrency limits: %s", self.host_concurrency.limits())
+        log.info("Crawl metrics: %s", self.metrics.log_line())
+
+
+    def iter_crawl(
+        self, urls, allowed_domains=None,
+        disallowed_domains=None, page_timeout=10, resume_from=None):
+        """Crawls webpages by traversing links, yielding each page as it finishes.
+
+        A page is yielded once it is fetched and its links are scheduled.
+        The crawl only advances while the generator is being consumed, so a
+        slow consumer bounds how far ahead the crawler runs: at most
+        `max_threads` pages are in flight or waiting to be yielded.
+
+        Args:
+            urls list(str): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+                Original URL domain takes precidence. `cross_site` must be
+                enabled.
+            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+                Original URL domain takes precidence. `cross_site` must be
+                enabled and `allowed_domains` must be empty/null.
+            page_timeout (int, optional): Number of seconds to allow for page retrieval.
+                Pages still fetching then are cut off. Default 10.
+            resume_from (str, optional): The path of a checkpoint database.
+                The crawl is recorded in it as it runs. If it holds an earlier
+                run, that run is resumed: `urls` is ignored and only the pages
+                it had not finished are fetched. Default None.
+
+        Yields:
+            webpage.Webpage: Each crawled webpage.
+
+        Examples:
+            >>> for page in Crawler().iter_crawl("http://python.org"):
+            >>>     print(page.url, page.links)
+        """
+        crawl_checkpoint = checkpoint.Checkpoint(resume_from) if resume_from else None
+        self._start_process_pool()
+        if self.metrics_log_interval:
+            self.metrics.start_logging(self.metrics_log_interval)
+        try:
+            to_crawl, original_domains = self._start_frontier(
+                urls, allowed_domains, disallowed_domains, self._host_crawl_delay,
+                crawl_checkpoint)
+            original_domains, allowed_domains, disallowed_domains = self._compile_domains(
+                original_domains, allowed_domains, disallowed_domains)
+
+            # Maps each running future to its (url, depth, start time).
+            in_flight = {}
             with cf.ThreadPoolExecutor(max_workers=self.max_threads) as tpe:
-                for url in urls:
-                    log.debug("Fetching url %s", url)
-                    self._wait_crawl_delay(url, self.reppy)
-                    futures.append(
-                        tpe.submit(
-                            self.webpage_builder.build,
-                            url,
-                            respect_robots=self.respect_robots,
-                            user_agent=self.user_agent,
-                            request_kwargs=self.request_kwargs,
-                            reppy=self.reppy))
-
-                # Get the results from the concurrent page requests.
-                fetched_pages = []
-                for index, future in enumerate(futures):
-                    try:
-                        page = future.result(timeout=page_timeout)
-                    except cf.TimeoutError as err:
-                        page = webpage.Webpage()
-                        page.url = urls[index]
-                        page.message = (
-                            f"A timeout ({page_timeout} sec) occurred while "
-                            f"attempting to fetch url ({page.url})")
-                        page.error = err
-                        log.error(page.message)
-                    except Exception as err:
-                        page = webpage.Webpage()
-                        page.url = urls[index]
-                        page.message = (
-                            f"An unexpected error occurred while attempting to "
-                            f"fetch url ({page.url}) - {err}")
-                        page.error = err
-                        log.error(page.message)
-                    finally:
-                        fetched_pages.append(page)
-                        crawled_urls[page.url] = page
-
-                # Get all links from pages that were just fetched.
-                links_to_crawl = []
-                for page in fetched_pages:
-                    page_links = page.get_page_links()
-                    valid_links = [
-                        link for link in page_links
-                        if self._is_crawlable_domain(
-                            link, original_domains,
-                            allowed_domains,
-                            disallowed_domains)]
-                    links_to_crawl.extend(valid_links)
-                links_to_crawl = list(set(links_to_crawl))
-
-                # crawl links discovered on pages that were just crawled.
-                _crawl(links_to_crawl, depth=depth+1)
-
-        _crawl(urls)
-        return self.parse(crawled_urls.values())
+                while in_flight or (to_crawl and not self._check_budget()):
+                    # Keep every worker busy while a host is ready to be crawled.
+                    while (len(in_flight) < self.max_threads and to_crawl and
+                            not self._check_budget()):
+                        item = to_crawl.get()
+                        if item is None:
+                            break
+                        self._pages_started += 1
+                        url, depth = item
+                        log.debug("Fetching url %s", url)
+                        future = tpe.submit(self._fetch_page, url, page_timeout)
+                        in_flight[future] = (url, depth, time.monotonic())
+                    self._record_queue(to_crawl, in_flight)
+
+                    now = time.monotonic()
+                    # With every worker busy (or the budget spent) only a
+                    # finished page lets another start.
+                    wait = (
+                        to_crawl.wait_time(now)
+                        if len(in_flight) < self.max_threads and not self.budget_exhausted
+                        else None)
+                    if in_flight:
+                        # Fetches end by their deadline, so waiting is bounded.
+                        done, _ = cf.wait(
+                            in_flight, timeout=wait, return_when=cf.FIRST_COMPLETED)
+                    else:
+                        # Every queued host is waiting out its crawl delay.
+                        time.sleep(self._sleep_time(wait))
+                        continue
+
+                    now = time.monotonic()
+                    for future, (url, depth, started) in list(in_flight.items()):
+                        if future not in done:
+                            continue
+                        page = self._get_future_page(future, url)
+                        del in_flight[future]
+                        to_crawl.done(url)
+                        self._record_page(page)
+                        self._adapt_concurrency(page, to_crawl, now - started)
+                        page = self._compact_page(page)
+                        self._schedule_links(
+                            page, depth, to_crawl, original_domains,
+                            allowed_domains, disallowed_domains, crawl_checkpoint)
+                        if crawl_checkpoint is not None:
+                            crawl_checkpoint.done(url)
+                        yield page
+        finally:
+            self._stop_process_pool()
+            self.metrics.stop_logging()
+            if crawl_checkpoint is not None:
+                crawl_checkpoint.close()
+
+        self._log_visited()
+
+
+    def crawl(
+        self, urls, allowed_domains=None,
+        disallowed_domains=None, page_timeout=10, resume_from=None):
+        """Crawls webpages by traversing links.
+
+        Collects the pages from `iter_crawl` and passes them to `parse`.
+
+        Args:
+            urls list(str): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+                Original URL domain takes precidence. `cross_site` must be
+                enabled.
+            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+                Original URL domain takes precidence. `cross_site` must be
+                enabled and `allowed_domains` must be empty/null.
+            page_timeout (int, optional): Number of seconds to allow for page retrieval.
+                Pages still fetching then are cut off. Default 10.
+            resume_from (str, optional): The path of a checkpoint database.
+                The crawl is recorded in it as it runs. If it holds an earlier
+                run, that run is resumed: `urls` is ignored and only the pages
+                it had not finished are fetched. Default None.
+
+        Returns:
+            self.parse(webpages): Returns a call to the overidable parse function.
+                Supplies the webpages as input. A resumed crawl only supplies
+                the pages fetched by this run.
+        """
+        return self.parse(list(self.iter_crawl(
+            urls, allowed_domains, disallowed_domains, page_timeout, resume_from)))
+
+
+    async def _async_fetch_page(
+            self, url, session, robots_cache, request_kwargs, page_timeout):
+        """Builds the webpage for a URL and extracts its links.
+
+        HTTP cache lookups and link extraction run in the event loop's
+        default executor so they do not block other requests.
+
+        Args:
+            url (str): The URL to fetch.
+            session (`obj` aiohttp.ClientSession): The session to fetch with.
+            robots_cache (aio.AsyncRobotsCache): The asyncio robots cache.
+            request_kwargs (dict): aiohttp request kwargs.
+            page_timeout (int): Number of seconds to allow for page retrieval.
+
+        Returns:
+            webpage.Webpage: The fetched webpage with its links populated.
+
+        """
+        loop = asyncio.get_running_loop()
+        entry = None
+        if self.http_cache is not None:
+            entry, request_kwargs = await loop.run_in_executor(
+                None, self._get_cache_entry, url, request_kwargs)
+            if entry is not None and self.http_cache.is_fresh(entry):
+                return self._compact_page(self.http_cache.fresh_page(entry))
+        start = time.perf_counter()
+        try:
+            page = await asyncio.wait_for(
+                self.async_webpage_builder.build(
+                    url,
+                    self.user_agent,
+                    session,
+                    request_kwargs=request_kwargs,
+                    respect_robots=self.respect_robots,
+                    robots_cache=robots_cache,
+                    allowed_content_types=self.allowed_content_types,
+                    max_body_size=self.max_body_size,
+                    max_download_time=self.max_download_time,
+                    metrics=self.metrics),
+                self._page_time_limit(page_timeout))
+        except asyncio.TimeoutError:
+            return self._timeout_page(url, page_timeout)
+        self.metrics.observe("fetch", time.perf_counter() - start)
+        if self.respect_robots_crawl_delay:
+            # Loads robots.txt so the frontier knows the host's crawl delay.
+            try:
+                await robots_cache.get(url)
+            except Exception as err:
+                log.exception(err)
+        return await loop.run_in_executor(None, self._extract_links, page, entry)
+
+
+    async def aiter_crawl(
+        self, urls, allowed_domains=None, disallowed_domains=None,
+        page_timeout=10, max_connections=1000, max_connections_per_host=10,
+        resume_from=None):
+        """Crawls webpages using asyncio, yielding each page as it finishes.
+
+        The asyncio counterpart of `iter_crawl`. Requests are made with
+        aiohttp, so thousands of pages can be in flight from a single thread.
+        Requires the optional aiohttp dependency.
+
+        Args:
+            urls list(str): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+                Original URL domain takes precidence. `cross_site` must be
+                enabled.
+            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+                Original URL domain takes precidence. `cross_site` must be
+                enabled and `allowed_domains` must be empty/null.
+            page_timeout (int, optional): Number of seconds to allow for page retrieval.
+                Pages that exceed it are cancelled. Default 10.
+            max_connections (int, optional): Max number of pages in flight and
+                open connections. Default 1000.
+            max_connections_per_host (int, optional): Max number of open
+                connections to a single host. Default 10.
+            resume_from (str, optional): The path of a checkpoint database.
+                The crawl is recorded in it as it runs. If it holds an earlier
+                run, that run is resumed: `urls` is ignored and only the pages
+                it had not finished are fetched. Default None.
+
+        Yields:
+            webpage.Webpage: Each crawled webpage.
+
+        Raises:
+            ImportError: If aiohttp is not installed.
+
+        Examples:
+            >>> async for page in Crawler().aiter_crawl("http://python.org"):
+            >>>     print(page.url, page.links)
+
+        """
+        aio.require_aiohttp()
+        request_kwargs = aio.to_aiohttp_kwargs(self.request_kwargs)
+
+        connector_kwargs = {}
+        if self.dns_cache is not None:
+            connector_kwargs = {
+                'resolver': aio.DnsCacheResolver(self.dns_cache, self.metrics),
+                'use_dns_cache': False}
+        connector = aio.aiohttp.TCPConnector(
+            limit=max_connections, limit_per_host=max_connections_per_host,
+            **connector_kwargs)
+        crawl_checkpoint = checkpoint.Checkpoint(resume_from) if resume_from else None
+        self._start_process_pool()
+        if self.metrics_log_interval:
+            self.metrics.start_logging(self.metrics_log_interval)
+        try:
+            async with aio.aiohttp.ClientSession(connector=connector) as session:
+                robots_cache = aio.AsyncRobotsCache(session, self.reppy, request_kwargs)
+
+                def host_delay(url):
+                    if not self.respect_robots_crawl_delay:
+                        return 0
+                    return robots_cache.cached_crawl_delay(url, self.user_agent)
+
+                to_crawl, original_domains = self._start_frontier(
+                    urls, allowed_domains, disallowed_domains, host_delay,
+                    crawl_checkpoint)
+                original_domains, allowed_domains, disallowed_domains = (
+                    self._compile_domains(
+                        original_domains, allowed_domains, disallowed_domains))
+                # Maps each running task to its (url, depth, start time).
+                in_flight = {}
+                while in_flight or (to_crawl and not self._check_budget()):
+                    while (len(in_flight) < max_connections and to_crawl and
+                            not self._check_budget()):
+                        item = to_crawl.get()
+                        if item is None:
+                            break
+                        self._pages_started += 1
+                        url, depth = item
+                        log.debug("Fetching url %s", url)
+                        task = asyncio.ensure_future(self._async_fetch_page(
+                            url, session, robots_cache, request_kwargs, page_timeout))
+                        in_flight[task] = (url, depth, time.monotonic())
+                    self._record_queue(to_crawl, in_flight)
+
+                    wait = (
+                        to_crawl.wait_time()
+                        if len(in_flight) < max_connections and not self.budget_exhausted
+                        else None)
+                    if not in_flight:
+                        # Every queued host is waiting out its crawl delay.
+                        await asyncio.sleep(self._sleep_time(wait))
+                        continue
+                    done, _ = await asyncio.wait(
+                        in_flight, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        url, depth, started = in_flight.pop(task)
+                        to_crawl.done(url)
+                        page = self._get_future_page(task, url)
+                        self._record_page(page)
+                        self._adapt_concurrency(
+                            page, to_crawl, time.monotonic() - started)
+                        page = self._compact_page(page)
+                        self._schedule_links(
+                            page, depth, to_crawl, original_domains,
+                            allowed_domains, disallowed_domains, crawl_checkpoint)
+                        if crawl_checkpoint is not None:
+                            crawl_checkpoint.done(url)
+                        yield page
+        finally:
+            self._stop_process_pool()
+            self.metrics.stop_logging()
+            if crawl_checkpoint is not None:
+                crawl_checkpoint.close()
+
+        self._log_visited()
+
+
+    async def acrawl(
+        self, urls, allowed_domains=None, disallowed_domains=None,
+        page_timeout=10, max_connections=1000, max_connections_per_host=10,
+        resume_from=None):
+        """Crawls webpages by traversing links using asyncio.
+
+        Collects the pages from `aiter_crawl` and passes them to `parse`.
+        Requires the optional aiohttp dependency.
+
+        Args:
+            urls list(str): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+                Original URL domain takes precidence. `cross_site` must be
+                enabled.
+            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+                Original URL domain takes precidence. `cross_site` must be
+                enabled and `allowed_domains` must be empty/null.
+            page_timeout (int, optional): Number of seconds to allow for page retrieval.
+                Pages that exceed it are cancelled. Default 10.
+            max_connections (int, optional): Max number of pages in flight and
+                open connections. Default 1000.
+            max_connections_per_host (int, optional): Max number of open
+                connections to a single host. Default 10.
+            resume_from (str, optional): The path of a checkpoint database.
+                The crawl is recorded in it as it runs. If it holds an earlier
+                run, that run is resumed: `urls` is ignored and only the pages
+                it had not finished are fetched. Default None.
+
+        Returns:
+            self.parse(webpages): Returns a call to the overidable parse function.
+                Supplies the webpages as input.
+
+        Raises:
+            ImportError: If aiohttp is not installed.
+
+        Examples:
+            >>> asyncio.run(Crawler().acrawl("http://python.org"))
+
+        """
+        pages = [page async for page in self.aiter_crawl(
+            urls, allowed_domains, disallowed_domains, page_timeout,
+            max_connections, max_connections_per_host, resume_from)]
+        return self.parse(pages)
@@ -0,0 +1,331 @@
+"""Provides page fetch deadlines.
+
+A deadline bounds the whole fetch of a page: the robots.txt check,
+connecting, waiting for the headers and reading the body. Request timeouts
+are capped at the time left, and the socket of a request still running
+when the deadline passes is shut down, so a stuck request fails at once
+and frees its worker.
+
+"""
+import contextlib
+import heapq
+import itertools
+import logging
+import socket
+import threading
+import time
+
+import requests
+import requests.adapters
+import urllib3
+import urllib3.connection
+
+
+log = logging.getLogger('bitcrawler')
+
+
+class Deadline:
+    """A point in time by which a fetch must finish.
+
+    Examples:
+        >>> deadline = Deadline.after(10, now=0)
+        >>> deadline.cap_timeout((5, 30), now=0)
+        (5, 10)
+
+    """
+    __slots__ = ("at",)
+
+    def __init__(self, at):
+        """Initializes Deadline.
+
+        Args:
+            at (float): The `time.monotonic()` the fetch must finish by.
+
+        """
+        self.at = at
+
+    @classmethod
+    def after(cls, seconds, now=None):
+        """Creates a deadline a number of seconds from now.
+
+        Args:
+            seconds (float): Seconds until the deadline.
+            now (float, optional): The current `time.monotonic()`.
+
+        Returns:
+            Deadline: The deadline.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        return cls(now + seconds)
+
+    def remaining(self, now=None):
+        """Gets the seconds left until the deadline, at least 0."""
+        if now is None:
+            now = time.monotonic()
+        return max(self.at - now, 0.0)
+
+    def expired(self, now=None):
+        """Checks if the deadline has passed."""
+        return self.remaining(now) <= 0
+
+    def cap_timeout(self, timeout, now=None):
+        """Caps a requests library timeout at the time left.
+
+        Args:
+            timeout (float or tuple(float, float)): The timeout, or a
+                (connect, read) timeout. `None` for no timeout.
+            now (float, optional): The current `time.monotonic()`.
+
+        Returns:
+            float or tuple(float, float): The capped timeout.
+
+        """
+        remaining = self.remaining(now)
+        if isinstance(timeout, tuple):
+            return tuple(
+                remaining if part is None else min(part, remaining) for part in timeout)
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+
+class _Watch:
+    """The connection or response a watched fetch is reading from."""
+    __slots__ = ("target",)
+
+    def __init__(self, target=None):
+        self.target = target
+
+
+class Watchdog:
+    """Shuts down the connections of fetches that pass their deadline.
+
+    A single daemon thread serves every fetch in the process. It is started
+    on first use.
+
+    A fetch is watched before its request is sent. Connections made by
+    `WatchedAdapter` attach themselves to the watch of the fetch running on
+    their thread, so connecting and reading the headers are cut off at the
+    deadline as well as reading the body.
+
+    """
+    # Seconds between checks for a socket to shut down, while connecting.
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        """Initializes Watchdog."""
+        # Heap of (deadline, handle, watch).
+        self._heap = []
+        # Maps the handles of the active watches to their watch.
+        self._watches = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._thread = None
+
+    def watch(self, deadline, target=None):
+        """Watches a fetch until `cancel` is called.
+
+        Args:
+            deadline (Deadline): The deadline of the fetch.
+            target (`obj`, optional): The urllib3 connection or streamed
+                requests.Response to shut down. May be attached later.
+
+        Returns:
+            int: The handle to pass to `attach` and `cancel`.
+
+        """
+        handle = next(self._sequence)
+        with self._condition:
+            self._watches[handle] = watch = _Watch(target)
+            heapq.heappush(self._heap, (deadline.at, handle, watch))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="bitcrawler-watchdog", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return handle
+
+    def attach(self, handle, target):
+        """Sets what to shut down when a watched fetch passes its deadline.
+
+        Args:
+            handle (int): The handle returned by `watch`.
+            target (`obj`): The urllib3 connection or streamed requests.Response.
+
+        """
+        with self._condition:
+            watch = self._watches.get(handle)
+            if watch is not None:
+                watch.target = target
+
+    def attach_current(self, target):
+        """Attaches a target to the fetch `watching` on this thread, if any.
+
+        Args:
+            target (`obj`): The urllib3 connection or streamed requests.Response.
+
+        """
+        handle = getattr(self._local, "handle", None)
+        if handle is not None:
+            self.attach(handle, target)
+
+    def cancel(self, handle):
+        """Stops watching a fetch, releasing its target.
+
+        Args:
+            handle (int): The handle returned by `watch`.
+
+        """
+        with self._condition:
+            watch = self._watches.pop(handle, None)
+            if watch is not None:
+                watch.target = None
+
+    @contextlib.contextmanager
+    def watching(self, deadline):
+        """Watches the fetch made on this thread for the duration of a with block.
+
+        Args:
+            deadline (Deadline): The deadline of the fetch. `None` does nothing.
+
+        Yields:
+            int: The watch handle. `None` if there is no deadline.
+
+        """
+        if deadline is None:
+            yield None
+            return
+        handle = self.watch(deadline)
+        previous = getattr(self._local, "handle", None)
+        self._local.handle = handle
+        try:
+            yield handle
+        finally:
+            self._local.handle = previous
+            self.cancel(handle)
+
+    def _run(self):
+        """Shuts down the fetches whose deadline has passed."""
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                at, handle, watch = self._heap[0]
+                if handle not in self._watches:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = at - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                # Under the lock so a fetch that just finished can cancel first.
+                if self.shutdown(watch.target):
+                    del self._watches[handle]
+                else:
+                    # Not connected yet. Checked again shortly.
+                    heapq.heappush(
+                        self._heap, (time.monotonic() + self.POLL_INTERVAL, handle, watch))
+
+    @classmethod
+    def _get_socket(cls, target):
+        """Gets the socket a connection or streamed response reads from. `None` if unknown."""
+        sock = getattr(target, "sock", None)
+        if sock is not None:
+            return sock
+        raw = getattr(target, "raw", None)
+        sock = getattr(getattr(raw, "_connection", None), "sock", None)
+        if sock is None:
+            # The http.client response reads from a file over the socket.
+            file = getattr(getattr(raw, "_fp", None), "fp", None)
+            sock = getattr(getattr(file, "raw", None), "_sock", None)
+        return sock
+
+    @classmethod
+    def shutdown(cls, target):
+        """Shuts down the connection of a fetch, failing any blocked read.
+
+        Closing a socket does not wake a thread blocked reading it, but
+        shutting it down does. A response whose socket cannot be found is
+        closed instead.
+
+        Args:
+            target (`obj`): A urllib3 connection or streamed requests.Response.
+
+        Returns:
+            bool: False if there was nothing to shut down yet.
+
+        """
+        sock = cls._get_socket(target)
+        if sock is None:
+            if not isinstance(target, requests.Response):
+                return False
+            target.close()
+            return True
+        log.debug("Shutting down a connection past its deadline")
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return True
+
+
+class WatchedConnection:
+    """Makes a urllib3 connection attach itself to the watch on its thread."""
+    def request(self, *args, **kwargs):
+        watchdog.attach_current(self)
+        return super().request(*args, **kwargs)
+
+
+def connection_pool_classes(*mixins):
+    """Creates urllib3 connection pool classes whose connections have mixins.
+
+    Args:
+        *mixins (type): Classes the HTTP and HTTPS connections extend.
+
+    Returns:
+        dict: The HTTP and HTTPS connection pool classes by scheme, for
+            `urllib3.PoolManager.pool_classes_by_scheme`.
+
+    """
+    http_connection = type(
+        "HTTPConnection", (*mixins, urllib3.connection.HTTPConnection), {})
+    https_connection = type(
+        "HTTPSConnection", (*mixins, urllib3.connection.HTTPSConnection), {})
+    return {
+        "http": type(
+            "HTTPConnectionPool", (urllib3.HTTPConnectionPool,),
+            {"ConnectionCls": http_connection}),
+        "https": type(
+            "HTTPSConnectionPool", (urllib3.HTTPSConnectionPool,),
+            {"ConnectionCls": https_connection}),
+    }
+
+
+class WatchedAdapter(requests.adapters.HTTPAdapter):
+    """A requests transport adapter whose connections are watched.
+
+    Its connections attach to the watch of the fetch that uses them, so the
+    watchdog can cut off connecting and reading the headers.
+
+    """
+    def connection_mixins(self):
+        """Gets the classes the adapter's connections extend.
+
+        Returns:
+            tuple(type): The mixins.
+
+        """
+        return (WatchedConnection,)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = connection_pool_classes(
+            *self.connection_mixins())
+
+
+# Shared by every fetch in the process.
+watchdog = Watchdog()
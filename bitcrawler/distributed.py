@@ -0,0 +1,531 @@
+"""Provides distributed crawling across several worker processes or nodes.
+
+Each worker owns a shard of the domains, assigned by consistent hashing
+on `LinkUtils.get_domain`. A worker only fetches URLs in its shard, so
+politeness (per-host delays) and deduplication (the visited set) stay
+local to one worker and need no shared lock. Links to another shard are
+sent to its owner through a coordination backend.
+
+`SqliteBackend` coordinates workers on one machine (or a shared disk).
+Other backends (ex. Redis) can be added by implementing `Backend`.
+
+Examples:
+    >>> backend = SqliteBackend("crawl.db")
+    >>> results = run_local("http://python.org", 4, backend, crawler_kwargs={
+    >>>     'cross_site': True, 'body_retention': 'none'})
+
+"""
+import bisect
+import concurrent.futures as cf
+import contextlib
+import hashlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from . import crawler
+from . import link_utils
+from . import visited
+
+
+log = logging.getLogger('bitcrawler')
+
+
+class HashRing:
+    """A consistent hash ring that assigns domains to shards.
+
+    Each shard is placed on the ring `replicas` times. Adding a shard only
+    moves about `1 / shards` of the domains.
+
+    """
+    def __init__(self, shards, replicas=100):
+        """Initializes HashRing.
+
+        Args:
+            shards (int): The number of shards.
+            replicas (int, optional): The points per shard on the ring.
+                Default 100.
+
+        Raises:
+            ValueError: If `shards` is not positive.
+
+        """
+        if shards <= 0:
+            raise ValueError("shards must be greater than 0.")
+        self.shards = shards
+        self.replicas = replicas
+        ring = sorted(
+            (self._hash(f"{shard}-{replica}"), shard)
+            for shard in range(shards) for replica in range(replicas))
+        self._points = [point for point, _ in ring]
+        self._shards = [shard for _, shard in ring]
+
+    @staticmethod
+    def _hash(key):
+        """Hashes a key to a 64 bit ring position."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def get_shard(self, url):
+        """Gets the shard that owns a URL's domain.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            int: The shard number.
+
+        """
+        point = self._hash(link_utils.LinkUtils.get_domain(url) or "")
+        index = bisect.bisect(self._points, point) % len(self._points)
+        return self._shards[index]
+
+
+class Backend:
+    """The coordination between shard workers. Meant to be extended.
+
+    A backend holds an inbox of (url, depth) items per shard, and tracks
+    which shards are idle so the workers can tell when the crawl is done.
+
+    """
+    def register(self, shard):
+        """Registers a worker for a shard as busy.
+
+        Args:
+            shard (int): The shard number.
+
+        """
+        raise NotImplementedError
+
+    def push(self, shard, items):
+        """Adds items to the inbox of a shard.
+
+        Args:
+            shard (int): The shard number.
+            items (list(tuple(str, int))): The (url, depth) items.
+
+        """
+        raise NotImplementedError
+
+    def pop(self, shard, limit):
+        """Removes items from the inbox of a shard and marks it busy.
+
+        Args:
+            shard (int): The shard number.
+            limit (int): The max number of items.
+
+        Returns:
+            list(tuple(str, int)): The (url, depth) items.
+
+        """
+        raise NotImplementedError
+
+    def set_idle(self, shard):
+        """Marks a shard idle if its inbox is empty.
+
+        Args:
+            shard (int): The shard number.
+
+        Returns:
+            bool: True if the shard was marked idle.
+
+        """
+        raise NotImplementedError
+
+    def is_finished(self, shards):
+        """Determines if the crawl is done.
+
+        The crawl is done once every shard is registered and idle, and
+        every inbox is empty.
+
+        Args:
+            shards (int): The number of shards.
+
+        Returns:
+            bool: True if the crawl is done.
+
+        """
+        raise NotImplementedError
+
+
+class SqliteBackend(Backend):
+    """A coordination backend in a SQLite database.
+
+    Can be shared by worker processes on one machine. Each process opens
+    its own connection, so the backend can be passed to other processes.
+    Use a new database for each crawl.
+
+    """
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS inbox "
+        "(id INTEGER PRIMARY KEY AUTOINCREMENT, shard INTEGER, url TEXT, depth INTEGER)",
+        "CREATE INDEX IF NOT EXISTS inbox_shard ON inbox (shard, id)",
+        "CREATE TABLE IF NOT EXISTS shards (shard INTEGER PRIMARY KEY, idle INTEGER)",
+    )
+
+    def __init__(self, path, timeout=30):
+        """Initializes SqliteBackend.
+
+        Args:
+            path (str): The SQLite database path. Created if missing.
+            timeout (float, optional): Seconds to wait for a locked database.
+                Default 30.
+
+        """
+        self.path = path
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def connection(self):
+        """`obj` sqlite3.Connection: The connection of the current process."""
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None,
+                check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self._SCHEMA:
+                self._connection.execute(statement)
+            self._pid = os.getpid()
+        return self._connection
+
+    @contextlib.contextmanager
+    def _write(self):
+        """Runs the statements of a with block in one write transaction."""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def register(self, shard):
+        with self._write() as connection:
+            connection.execute("INSERT OR REPLACE INTO shards VALUES (?, 0)", (shard,))
+
+    def push(self, shard, items):
+        if not items:
+            return
+        with self._write() as connection:
+            connection.executemany(
+                "INSERT INTO inbox (shard, url, depth) VALUES (?, ?, ?)",
+                [(shard, url, depth) for url, depth in items])
+
+    def pop(self, shard, limit):
+        with self._write() as connection:
+            rows = connection.execute(
+                "SELECT id, url, depth FROM inbox WHERE shard = ? "
+                "ORDER BY id LIMIT ?", (shard, limit)).fetchall()
+            if rows:
+                connection.execute(
+                    "DELETE FROM inbox WHERE shard = ? AND id <= ?",
+                    (shard, rows[-1][0]))
+                connection.execute(
+                    "UPDATE shards SET idle = 0 WHERE shard = ?", (shard,))
+        return [(url, depth) for _, url, depth in rows]
+
+    def set_idle(self, shard):
+        with self._write() as connection:
+            pending = connection.execute(
+                "SELECT 1 FROM inbox WHERE shard = ? LIMIT 1", (shard,)).fetchone()
+            if pending is None:
+                connection.execute(
+                    "UPDATE shards SET idle = 1 WHERE shard = ?", (shard,))
+        return pending is None
+
+    def is_finished(self, shards):
+        # Read in one transaction so the shards and inboxes are consistent.
+        with self._write() as connection:
+            idle, registered = connection.execute(
+                "SELECT COALESCE(SUM(idle), 0), COUNT(*) FROM shards").fetchone()
+            pending = connection.execute("SELECT 1 FROM inbox LIMIT 1").fetchone()
+        return registered >= shards and idle == registered and pending is None
+
+
+class ShardWorker:
+    """Crawls the shard of domains owned by one worker.
+
+    Uses the fetching, robots.txt, politeness and parsing settings of a
+    crawler.Crawler. Links are filtered by domain before being sent, and
+    each worker remembers what it has sent so a link is sent at most once
+    per worker.
+
+    The crawler's budgets (`max_pages`, `max_bytes`, `max_time` and
+    `max_pages_per_host`) apply to each worker separately. A worker whose
+    budget is spent finishes its pages in flight and then only drains its
+    inbox until every shard is done.
+
+    """
+    def __init__(
+            self,
+            crawler,
+            shard,
+            shards,
+            backend,
+            replicas=100,
+            batch_size=1000,
+            poll_interval=0.1):
+        """Initializes ShardWorker.
+
+        Args:
+            crawler (crawler.Crawler): The crawler to fetch and parse with.
+            shard (int): The shard this worker owns.
+            shards (int): The number of shards.
+            backend (Backend): The coordination backend.
+            replicas (int, optional): The points per shard on the hash ring.
+                Must match across workers. Default 100.
+            batch_size (int, optional): The max number of items taken from
+                the inbox at once. Default 1000.
+            poll_interval (float, optional): Seconds between inbox checks
+                while the worker is idle. Default 0.1.
+
+        Raises:
+            ValueError: If `shard` is not a shard of the ring.
+
+        """
+        if not 0 <= shard < shards:
+            raise ValueError(f"shard must be between 0 and {shards - 1}.")
+        self.crawler = crawler
+        self.shard = shard
+        self.ring = HashRing(shards, replicas)
+        self.backend = backend
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.sent = visited.VisitedSet()
+
+    def _accept(self, items, to_crawl):
+        """Adds unvisited items of this shard to the frontier."""
+        crawl = self.crawler
+        for url, depth in items:
+            if crawl.visited.add(url) and crawl._take_host_quota(url):
+                to_crawl.put(url, depth, crawl._score(url, depth))
+
+    def _route_links(
+            self, page, depth, to_crawl, original_domains,
+            allowed_domains, disallowed_domains):
+        """Schedules this shard's links and sends the rest to their owners."""
+        crawl = self.crawler
+        if page.canonical_url:
+            canonical_url = crawl._canonicalize(page.canonical_url)
+            if self.ring.get_shard(canonical_url) == self.shard:
+                crawl.visited.add(canonical_url)
+
+        # depth starts at 0 so >= terminates
+        if depth + 1 >= crawl.crawl_depth:
+            return
+        outbox = {}
+        links = []
+        for link in page.links or []:
+            link = crawl._canonicalize(link)
+            if link in crawl.visited or not crawl._is_crawlable_domain(
+                    link, original_domains, allowed_domains, disallowed_domains):
+                continue
+            shard = self.ring.get_shard(link)
+            if shard == self.shard:
+                links.append(link)
+            elif self.sent.add(link):
+                outbox.setdefault(shard, []).append((link, depth + 1))
+        links = [link for link in links if crawl.visited.add(link)]
+        for link in crawl._filter_robots(links):
+            if crawl._take_host_quota(link):
+                to_crawl.put(link, depth + 1, crawl._score(link, depth + 1, page))
+        for shard, items in outbox.items():
+            self.backend.push(shard, items)
+
+    def iter_crawl(
+        self, urls, allowed_domains=None,
+        disallowed_domains=None, page_timeout=10):
+        """Crawls this worker's shard, yielding each page as it finishes.
+
+        Every worker is given the same start URLs and fetches the ones in
+        its shard. Returns once every shard is idle with an empty inbox.
+
+        Args:
+            urls list(str): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+                See crawler.Crawler.crawl.
+            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+                See crawler.Crawler.crawl.
+            page_timeout (int, optional): Number of seconds to allow for page retrieval. Default 10.
+
+        Yields:
+            webpage.Webpage: Each webpage crawled by this worker.
+
+        """
+        crawl = self.crawler
+        if isinstance(urls, str):
+            urls = [urls]
+        urls = [crawl._canonicalize(url) for url in urls]
+        original_domains, allowed_domains, disallowed_domains = crawl._compile_domains(
+            [link_utils.LinkUtils.get_domain(url) for url in urls],
+            allowed_domains, disallowed_domains)
+        crawl.visited = crawl._new_visited_set()
+        crawl.robots_disallowed = 0
+        crawl.metrics.reset()
+        crawl._reset_budget()
+        to_crawl = crawl._new_frontier(crawl._host_crawl_delay)
+        self.backend.register(self.shard)
+        if crawl.crawl_depth > 0:
+            self._accept(
+                [(url, 0) for url in urls if self.ring.get_shard(url) == self.shard],
+                to_crawl)
+
+        crawl._start_process_pool()
+        if crawl.metrics_log_interval:
+            crawl.metrics.start_logging(crawl.metrics_log_interval)
+        try:
+            # Maps each running future to its (url, depth, start time).
+            in_flight = {}
+            with cf.ThreadPoolExecutor(max_workers=crawl.max_threads) as tpe:
+                while True:
+                    self._accept(self.backend.pop(self.shard, self.batch_size), to_crawl)
+                    while (len(in_flight) < crawl.max_threads and to_crawl and
+                            not crawl._check_budget()):
+                        item = to_crawl.get()
+                        if item is None:
+                            break
+                        crawl._pages_started += 1
+                        url, depth = item
+                        log.debug("Shard %d fetching url %s", self.shard, url)
+                        future = tpe.submit(crawl._fetch_page, url, page_timeout)
+                        in_flight[future] = (url, depth, time.monotonic())
+                    crawl._record_queue(to_crawl, in_flight)
+
+                    now = time.monotonic()
+                    # With every worker busy (or the budget spent) only a
+                    # finished page lets another start.
+                    wait = (
+                        to_crawl.wait_time(now)
+                        if len(in_flight) < crawl.max_threads and not crawl.budget_exhausted
+                        else None)
+                    wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+                    if not in_flight:
+                        # A worker whose budget is spent stays idle so the others finish.
+                        if ((not to_crawl or crawl.budget_exhausted) and
+                                self.backend.set_idle(self.shard)):
+                            if self.backend.is_finished(self.ring.shards):
+                                break
+                        time.sleep(wait)
+                        continue
+                    done, _ = cf.wait(
+                        in_flight, timeout=wait, return_when=cf.FIRST_COMPLETED)
+
+                    now = time.monotonic()
+                    for future, (url, depth, started) in list(in_flight.items()):
+                        if future not in done:
+                            continue
+                        page = crawl._get_future_page(future, url)
+                        del in_flight[future]
+                        to_crawl.done(url)
+                        crawl._record_page(page)
+                        crawl._adapt_concurrency(page, to_crawl, now - started)
+                        page = crawl._compact_page(page)
+                        self._route_links(
+                            page, depth, to_crawl, original_domains,
+                            allowed_domains, disallowed_domains)
+                        yield page
+        finally:
+            crawl._stop_process_pool()
+            crawl.metrics.stop_logging()
+
+        crawl._log_visited()
+
+    def crawl(
+        self, urls, allowed_domains=None,
+        disallowed_domains=None, page_timeout=10):
+        """Crawls this worker's shard.
+
+        Args:
+            urls list(str): The URL or list of start URLs to be crawled.
+            allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+            disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+            page_timeout (int, optional): Number of seconds to allow for page retrieval. Default 10.
+
+        Returns:
+            crawler.parse(webpages): The crawler's parse of this worker's pages.
+
+        """
+        return self.crawler.parse(list(self.iter_crawl(
+            urls, allowed_domains, disallowed_domains, page_timeout)))
+
+
+def crawl_shard(
+        shard,
+        shards,
+        backend,
+        urls,
+        crawler_class=crawler.Crawler,
+        crawler_kwargs=None,
+        allowed_domains=None,
+        disallowed_domains=None,
+        page_timeout=10):
+    """Creates a crawler and crawls one shard. Runs in a worker process.
+
+    Args:
+        shard (int): The shard to crawl.
+        shards (int): The number of shards.
+        backend (Backend): The coordination backend.
+        urls list(str): The URL or list of start URLs to be crawled.
+        crawler_class (class, optional): The crawler.Crawler class to create.
+        crawler_kwargs (dict, optional): The crawler initialization kwargs.
+        allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+        disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+        page_timeout (int, optional): Number of seconds to allow for page retrieval. Default 10.
+
+    Returns:
+        The crawler's parse of the shard's pages.
+
+    """
+    worker = ShardWorker(
+        crawler_class(**(crawler_kwargs or {})), shard, shards, backend)
+    return worker.crawl(urls, allowed_domains, disallowed_domains, page_timeout)
+
+
+def run_local(
+        urls,
+        shards,
+        backend,
+        crawler_class=crawler.Crawler,
+        crawler_kwargs=None,
+        allowed_domains=None,
+        disallowed_domains=None,
+        page_timeout=10):
+    """Crawls with one worker process per shard on this machine.
+
+    The crawler class must be importable by the worker processes, and its
+    parse results must be picklable.
+
+    Args:
+        urls list(str): The URL or list of start URLs to be crawled.
+        shards (int): The number of worker processes.
+        backend (Backend): The coordination backend.
+        crawler_class (class, optional): The crawler.Crawler class to create
+            in each worker. Default crawler.Crawler.
+        crawler_kwargs (dict, optional): The crawler initialization kwargs.
+        allowed_domains (list(str)): A list of allowed domains to crawl. Default None
+        disallowed_domains (list(str)): A list of allowed domains to crawl. Default None.
+        page_timeout (int, optional): Number of seconds to allow for page retrieval. Default 10.
+
+    Returns:
+        list: The parse results of each shard, in shard order.
+
+    """
+    with cf.ProcessPoolExecutor(
+            shards, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(
+                crawl_shard, shard, shards, backend, urls, crawler_class,
+                crawler_kwargs, allowed_domains, disallowed_domains, page_timeout)
+            for shard in range(shards)]
+        return [future.result() for future in futures]
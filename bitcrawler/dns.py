@@ -0,0 +1,253 @@
+"""Provides a DNS cache shared by the crawl workers.
+
+Every new connection would otherwise resolve its host through the system
+resolver, so a crawl of a few hosts repeats the same lookups thousands of
+times. The cache keeps each answer for a TTL, remembers failed lookups
+for a shorter one, and lets concurrent lookups of a host share a single
+resolver call.
+
+"""
+import collections
+import logging
+import socket
+import threading
+import time
+
+import urllib3.exceptions
+
+from . import deadline
+
+
+log = logging.getLogger('bitcrawler')
+
+
+class _Entry:
+    """A cached lookup result or error."""
+    __slots__ = ("infos", "error", "expires")
+
+    def __init__(self, infos, error, expires):
+        self.infos = infos
+        self.error = error
+        self.expires = expires
+
+    def result(self):
+        """Returns the addresses or raises the lookup error."""
+        if self.error is not None:
+            raise self.error
+        return self.infos
+
+
+class _Flight:
+    """A lookup in progress that other threads wait for."""
+    __slots__ = ("done", "entry")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+class DnsCache:
+    """A thread-safe cache of `socket.getaddrinfo` results.
+
+    The system resolver does not report record TTLs, so answers are kept
+    for `ttl` seconds and failures for `negative_ttl` seconds. Lookups are
+    counted by result ("hit", "miss", "negative_hit" or "shared" for a
+    lookup that waited on another thread's) in `stats` and in the
+    `dns_lookups_total` counter of the Metrics passed to `getaddrinfo`, or
+    else of `metrics`. Resolver calls are timed as the "dns" stage. So
+    crawlers sharing a cache each report their own lookups.
+
+    Examples:
+        >>> dns_cache = DnsCache(ttl=300)
+        >>> infos = dns_cache.getaddrinfo("python.org", 443)
+        >>> infos = dns_cache.getaddrinfo("python.org", 443)
+        >>> dns_cache.stats()["hit_rate"]
+        0.5
+
+    """
+    RESULTS = ("hit", "miss", "negative_hit", "shared")
+
+    def __init__(self, ttl=300, negative_ttl=30, max_size=10000, metrics=None):
+        """Initializes DnsCache.
+
+        Args:
+            ttl (float, optional): Seconds to keep an answer. Default 300.
+            negative_ttl (float, optional): Seconds to keep a failed lookup.
+                Default 30.
+            max_size (int, optional): The max number of cached lookups. The
+                least recently used are dropped first. Default 10000.
+            metrics (metrics.Metrics, optional): Records the lookups that
+                are not given their own Metrics.
+
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.metrics = metrics
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._counts = dict.fromkeys(self.RESULTS, 0)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, result, metrics):
+        """Counts a lookup. Called with the lock held."""
+        self._counts[result] += 1
+        if metrics is not None:
+            metrics.inc("dns_lookups_total", result=result)
+
+    def getaddrinfo(self, host, port, family=0, type=socket.SOCK_STREAM, metrics=None):
+        """Resolves a host like `socket.getaddrinfo`, using the cache.
+
+        Args:
+            host (str): The hostname.
+            port (int): The port.
+            family (int, optional): The address family. Default 0 for any.
+            type (int, optional): The socket type. Default SOCK_STREAM.
+            metrics (metrics.Metrics, optional): Records the lookup.
+                Default `metrics`.
+
+        Returns:
+            list(tuple): The (family, type, proto, canonname, sockaddr) tuples.
+
+        Raises:
+            socket.gaierror: If the host cannot be resolved, now or within
+                the last `negative_ttl` seconds.
+
+        """
+        key = (host.lower(), port, family, type)
+        if metrics is None:
+            metrics = self.metrics
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count("negative_hit" if entry.error is not None else "hit", metrics)
+                return entry.result()
+            flight = self._pending.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._pending[key] = _Flight()
+            else:
+                self._count("shared", metrics)
+        if not leader:
+            flight.done.wait()
+            return flight.entry.result()
+
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(host, port, family, type)
+            entry = _Entry(infos, None, time.monotonic() + self.ttl)
+        except socket.gaierror as err:
+            log.debug("Could not resolve %s: %s", host, err)
+            entry = _Entry(None, err, time.monotonic() + self.negative_ttl)
+        except Exception as err:
+            # Not a resolver answer, so it is passed on but not cached.
+            entry = _Entry(None, err, 0)
+        if metrics is not None:
+            metrics.observe("dns", time.perf_counter() - start)
+        with self._lock:
+            if entry.expires:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            del self._pending[key]
+            self._count("miss", metrics)
+        flight.entry = entry
+        flight.done.set()
+        return entry.result()
+
+    def stats(self):
+        """Gets the lookup counts.
+
+        Returns:
+            dict: The number of lookups of each result, the total and the
+                hit rate (the share of lookups that did not call the resolver).
+                The hit rate is `None` before the first lookup.
+
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        counts["total"] = total
+        counts["hit_rate"] = (total - counts["miss"]) / total if total else None
+        return counts
+
+    def clear(self):
+        """Drops every cached lookup."""
+        with self._lock:
+            self._entries.clear()
+
+
+class _CachedDnsConnection:
+    """Makes a urllib3 connection resolve its host with `dns_cache`.
+
+    Each cached address is tried in turn. TLS and the Host header still use
+    the hostname. Lookups are recorded in `dns_metrics`.
+
+    """
+    dns_cache = None
+    dns_metrics = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            infos = self.dns_cache.getaddrinfo(host, self.port, metrics=self.dns_metrics)
+        except socket.gaierror as err:
+            name_resolution_error = getattr(urllib3.exceptions, "NameResolutionError", None)
+            if name_resolution_error is not None:
+                raise name_resolution_error(self.host, self, err) from err
+            raise urllib3.exceptions.NewConnectionError(
+                self, f"Failed to resolve {host}: {err}") from err
+
+        addresses = list(dict.fromkeys(sockaddr[0] for *_, sockaddr in infos))
+        error = None
+        for address in addresses:
+            # urllib3 connects to `_dns_host`. The system resolver returns an
+            # IP address as is without a lookup.
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (urllib3.exceptions.NewConnectionError,
+                    urllib3.exceptions.ConnectTimeoutError) as err:
+                error = err
+            finally:
+                self._dns_host = host
+        raise error
+
+
+class DnsCachingAdapter(deadline.WatchedAdapter):
+    """A requests transport adapter that resolves hosts with a DnsCache."""
+    def __init__(self, dns_cache, metrics=None, **kwargs):
+        """Initializes DnsCachingAdapter.
+
+        Args:
+            dns_cache (DnsCache): The cache to resolve with.
+            metrics (metrics.Metrics, optional): Records the lookups.
+                Default the cache's `metrics`.
+            **kwargs: requests.adapters.HTTPAdapter kwargs.
+
+        """
+        self.dns_cache = dns_cache
+        self.metrics = metrics
+        super().__init__(**kwargs)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["dns_cache"] = self.dns_cache
+        state["metrics"] = self.metrics
+        return state
+
+    def __setstate__(self, state):
+        self.dns_cache = state["dns_cache"]
+        self.metrics = state["metrics"]
+        super().__setstate__(state)
+
+    def connection_mixins(self):
+        cached_dns = type(
+            "CachedDnsConnection", (_CachedDnsConnection,),
+            {"dns_cache": self.dns_cache, "dns_metrics": self.metrics})
+        return (*super().connection_mixins(), cached_dns)
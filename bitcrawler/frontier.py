@@ -0,0 +1,305 @@
+"""Provides the crawl frontier.
+
+The frontier holds the URLs that have been discovered but not yet fetched.
+
+"""
+import heapq
+import itertools
+import re
+import time
+
+from . import link_utils
+
+
+class _HostQueue:
+    """The queued URLs and politeness state of a single host."""
+    __slots__ = ("items", "ready_at", "in_flight", "held", "token", "ready")
+
+    def __init__(self):
+        # Heap of (-score, sequence, url, depth).
+        self.items = []
+        # Monotonic time the next request to the host may start.
+        self.ready_at = 0.0
+        self.in_flight = 0
+        # True while the host's crawl delay is unknown.
+        self.held = False
+        # Identifies the host's current heap entry. `None` if it has none.
+        self.token = None
+        # True while the entry is in the ready heap rather than the waiting heap.
+        self.ready = False
+
+
+class Frontier:
+    """A queue of (url, depth) items waiting to be crawled, kept per host.
+
+    Each item has a score, and higher scores are crawled first: `get`
+    returns the best item of the best-scoring host that is ready. Items
+    with equal scores are crawled in the order they were added, so with
+    the default score of 0 the crawl is breadth-first.
+
+    Each host has its own next-allowed time, so a long crawl delay on one
+    host does not hold back the others. The delay for a host is the larger
+    of `crawl_delay` and the value returned by `host_delay` (ex. the
+    robots.txt crawl delay). When `host_delay` returns `None` the delay is
+    not known yet, and the host is held after its first request until
+    `done` is called for it.
+
+    `host_limit` caps the number of requests in flight to a host. A host
+    at its limit is skipped until `done` is called for one of its URLs.
+
+    """
+    def __init__(self, crawl_delay=0, host_delay=None, host_limit=None):
+        """Initializes Frontier.
+
+        Args:
+            crawl_delay (float, optional): Seconds to wait between requests to
+                the same host. Default 0.
+            host_delay (callable, optional): Called with a URL. Returns the crawl
+                delay for its host, or `None` if it is not known yet.
+            host_limit (callable, optional): Called with a host. Returns the max
+                number of requests in flight to it. Default `None` for no limit.
+
+        """
+        self.crawl_delay = crawl_delay
+        self.host_delay = host_delay
+        self.host_limit = host_limit
+        self._hosts = {}
+        # Heap of (ready_at, token, host) for hosts waiting out their delay.
+        self._waiting = []
+        # Heap of (-score, token, host) for hosts that are ready.
+        self._ready = []
+        self._sequence = itertools.count()
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def _at_limit(self, host, host_queue):
+        """Checks if a host has as many requests in flight as it may."""
+        return (self.host_limit is not None and
+                host_queue.in_flight >= self.host_limit(host))
+
+    def _push(self, host, host_queue):
+        """Adds a host with queued items to the waiting heap."""
+        if (host_queue.items and host_queue.token is None and
+                not host_queue.held and not self._at_limit(host, host_queue)):
+            host_queue.token = next(self._sequence)
+            host_queue.ready = False
+            heapq.heappush(self._waiting, (host_queue.ready_at, host_queue.token, host))
+
+    def _pop_ready(self):
+        """Pops the best ready host, skipping replaced entries.
+
+        Returns:
+            str: The host. `None` if no host is ready.
+
+        """
+        while self._ready:
+            _, token, host = heapq.heappop(self._ready)
+            host_queue = self._hosts.get(host)
+            if host_queue is not None and host_queue.token == token:
+                return host
+        return None
+
+    def _get_delay(self, url):
+        """Gets the delay for the URL's host. `None` if it is unknown."""
+        if self.host_delay is None:
+            return self.crawl_delay
+        host_delay = self.host_delay(url)
+        if host_delay is None:
+            return None
+        return max(self.crawl_delay, host_delay)
+
+    def put(self, url, depth, score=0):
+        """Adds a URL to the frontier.
+
+        Args:
+            url (str): The URL to crawl.
+            depth (int): The depth the URL was discovered at.
+            score (float, optional): The priority of the URL. Higher scores
+                are crawled first. Default 0.
+
+        """
+        host = link_utils.LinkUtils.get_host(url)
+        host_queue = self._hosts.get(host)
+        if host_queue is None:
+            host_queue = self._hosts[host] = _HostQueue()
+        if host_queue.ready and -score < host_queue.items[0][0]:
+            # The host's ready entry has a worse score. Replaces it.
+            host_queue.token = next(self._sequence)
+            heapq.heappush(self._ready, (-score, host_queue.token, host))
+        heapq.heappush(host_queue.items, (-score, next(self._sequence), url, depth))
+        self._len += 1
+        self._push(host, host_queue)
+
+    def delay_host(self, host, delay, now=None):
+        """Prevents requests to a host for a number of seconds.
+
+        Used to resume a host's crawl delay and to honor `Retry-After`.
+
+        Args:
+            host (str): The host, as returned by `LinkUtils.get_host`.
+            delay (float): Seconds until the host may be crawled.
+            now (float, optional): The current `time.monotonic()`.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        host_queue = self._hosts.get(host)
+        if host_queue is None:
+            host_queue = self._hosts[host] = _HostQueue()
+        host_queue.ready_at = max(host_queue.ready_at, now + delay)
+
+    def get(self, now=None):
+        """Removes the next item whose host is ready to be crawled.
+
+        Args:
+            now (float, optional): The current `time.monotonic()`.
+
+        Returns:
+            tuple(str, int): The next (url, depth) item. `None` if the
+                frontier is empty or no host is ready.
+
+        Examples:
+            >>> frontier = Frontier()
+            >>> frontier.put("http://python.org", 0)
+            >>> frontier.get()
+            ("http://python.org", 0)
+
+        """
+        if now is None:
+            now = time.monotonic()
+        # Moves the hosts whose delay has passed to the ready heap.
+        while self._waiting and self._waiting[0][0] <= now:
+            _, token, host = heapq.heappop(self._waiting)
+            host_queue = self._hosts.get(host)
+            if host_queue is None or host_queue.token != token:
+                continue
+            host_queue.ready = True
+            heapq.heappush(self._ready, (host_queue.items[0][0], token, host))
+
+        while True:
+            host = self._pop_ready()
+            if host is None:
+                return None
+            host_queue = self._hosts[host]
+            host_queue.token = None
+            host_queue.ready = False
+            if self._at_limit(host, host_queue):
+                # The limit dropped after the host was queued. `done` requeues it.
+                continue
+            if host_queue.ready_at <= now:
+                break
+            # `delay_host` pushed the host back after it was queued.
+            self._push(host, host_queue)
+
+        _, _, url, depth = heapq.heappop(host_queue.items)
+        self._len -= 1
+        host_queue.in_flight += 1
+
+        delay = self._get_delay(url)
+        if delay is None:
+            host_queue.held = True
+        else:
+            host_queue.ready_at = now + delay
+            self._push(host, host_queue)
+        return url, depth
+
+    def done(self, url, now=None):
+        """Marks a URL returned by `get` as finished.
+
+        Releases a held host once its crawl delay is known.
+
+        Args:
+            url (str): The URL that finished.
+            now (float, optional): The current `time.monotonic()`.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        host = link_utils.LinkUtils.get_host(url)
+        host_queue = self._hosts.get(host)
+        if host_queue is None:
+            return
+        host_queue.in_flight -= 1
+        if host_queue.held:
+            host_queue.held = False
+            delay = self._get_delay(url)
+            host_queue.ready_at = max(
+                host_queue.ready_at,
+                now + (self.crawl_delay if delay is None else delay))
+        # Requeues a host that was at its limit.
+        self._push(host, host_queue)
+        # Forget idle hosts once their delay has passed to bound memory.
+        if (not host_queue.items and not host_queue.in_flight and
+                host_queue.ready_at <= now):
+            del self._hosts[host]
+
+    def wait_time(self, now=None):
+        """Gets the time until the next host is ready.
+
+        Args:
+            now (float, optional): The current `time.monotonic()`.
+
+        Returns:
+            float: Seconds until `get` can return an item. `None` if no
+                queued host is waiting to become ready.
+
+        """
+        if self._ready:
+            return 0
+        if not self._waiting:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(self._waiting[0][0] - now, 0)
+
+
+class UrlPatternPriority:
+    """Scores URLs for the frontier by pattern and depth.
+
+    A URL scores the sum of the weights of the patterns it matches, minus
+    `depth_weight` per level of depth. Higher scores are crawled first.
+
+    Examples:
+        >>> priority = UrlPatternPriority({r"/docs/": 10, r"/tag/": -5})
+        >>> priority("http://python.org/docs/", 1)
+        9.0
+        >>> Crawler(priority=priority)
+
+    """
+    def __init__(self, patterns=None, depth_weight=1.0):
+        """Initializes UrlPatternPriority.
+
+        Args:
+            patterns (dict, optional): Regular expressions and their weights.
+                Searched anywhere in the URL. Default `None`.
+            depth_weight (float, optional): The score lost per level of depth.
+                Default 1.
+
+        """
+        self.patterns = [
+            (re.compile(pattern), weight) for pattern, weight in (patterns or {}).items()]
+        self.depth_weight = depth_weight
+
+    def __call__(self, url, depth, page=None):
+        """Scores a URL.
+
+        Args:
+            url (str): The URL.
+            depth (int): The depth the URL was discovered at.
+            page (webpage.Webpage, optional): The page the URL was found on.
+                `None` for start URLs.
+
+        Returns:
+            float: The score.
+
+        """
+        score = -self.depth_weight * depth
+        for pattern, weight in self.patterns:
+            if pattern.search(url):
+                score += weight
+        return float(score)
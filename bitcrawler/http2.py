@@ -0,0 +1,276 @@
+"""Provides an HTTP/2 transport for `WebpageBuilder`.
+
+Requests to a host are multiplexed over a few HTTP/2 connections instead
+of one HTTP/1.1 connection per request in flight. Servers that do not
+speak HTTP/2 are fetched with HTTP/1.1.
+
+Requires the optional httpx dependency with HTTP/2 support
+(`pip install bitcrawler[http2]`).
+
+"""
+import contextlib
+import datetime
+import logging
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.structures
+import requests.utils
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+log = logging.getLogger('bitcrawler')
+
+
+def require_httpx():
+    """Raises an ImportError if httpx with HTTP/2 support is not installed.
+
+    Raises:
+        ImportError: If httpx or h2 is not installed.
+
+    """
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        h2 = None
+    if httpx is None or h2 is None:
+        raise ImportError(
+            "The HTTP/2 transport requires httpx and h2. "
+            "Install them with `pip install bitcrawler[http2]`.")
+
+
+@contextlib.contextmanager
+def _translate_errors():
+    """Raises httpx errors as the requests errors the crawler expects."""
+    try:
+        yield
+    except httpx.ConnectTimeout as err:
+        raise requests.ConnectTimeout(str(err)) from err
+    except httpx.TimeoutException as err:
+        raise requests.ReadTimeout(str(err)) from err
+    except httpx.TransportError as err:
+        raise requests.ConnectionError(str(err)) from err
+    except httpx.HTTPError as err:
+        raise requests.RequestException(str(err)) from err
+
+
+class _Body:
+    """Reads the body of a streamed httpx response.
+
+    Stands in for the urllib3 response in `requests.Response.raw`, so
+    `iter_content` works the same for either transport.
+
+    Attributes:
+        version (int): The HTTP version, 11 or 20, as urllib3 reports it.
+
+    """
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = b""
+        self.version = 20 if response.http_version == "HTTP/2" else 11
+
+    def read(self, amt=None):
+        """Reads up to `amt` bytes of the decoded body. `b""` at the end."""
+        with _translate_errors():
+            while not self._buffer or (amt is None):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffer += chunk
+        if amt is None:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        """Closes the response, resetting its stream if it is unread."""
+        self._response.close()
+
+
+class Http2Session:
+    """A thread-safe session that fetches over HTTP/2.
+
+    Provides the `get` and `close` methods of `requests.Session` that the
+    crawler uses and returns `requests.Response` objects, so it can be
+    used wherever a session is. One session is shared by every thread and
+    concurrent requests to a host share its connections as HTTP/2 streams.
+
+    HTTPS servers choose HTTP/2 or HTTP/1.1 when the connection is made
+    (ALPN). Plain HTTP servers are fetched with HTTP/1.1 unless
+    `prior_knowledge` is True. Then HTTP/2 is tried first, and hosts that
+    refuse it are remembered and fetched with HTTP/1.1.
+
+    Examples:
+        >>> session = Http2Session()
+        >>> session.get("https://python.org").raw.version
+        20
+
+    """
+    SUPPORTED_KWARGS = frozenset(
+        ('headers', 'params', 'cookies', 'allow_redirects', 'timeout', 'verify', 'stream'))
+
+    def __init__(self, max_connections=100, prior_knowledge=False, verify=True):
+        """Initializes Http2Session.
+
+        Args:
+            max_connections (int, optional): The max number of open connections
+                across all hosts. Default 100.
+            prior_knowledge (bool, optional): Speak HTTP/2 to plain HTTP servers
+                without negotiating it first. Default False.
+            verify (bool, optional): Verify TLS certificates. Default True.
+
+        Raises:
+            ImportError: If httpx or h2 is not installed.
+
+        """
+        require_httpx()
+        self.prior_knowledge = prior_knowledge
+        self.verify = verify
+        limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(
+            http1=True, http2=True, verify=verify, limits=limits)
+        self._h2c_client = None
+        if prior_knowledge:
+            self._h2c_client = httpx.Client(
+                http1=False, http2=True, verify=verify, limits=limits)
+        # Plain HTTP hosts that refused HTTP/2 with prior knowledge.
+        self.http1_hosts = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_timeout(timeout):
+        """Converts a requests library timeout into an httpx.Timeout."""
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect, pool=connect)
+        return httpx.Timeout(timeout)
+
+    def _send(self, client, url, request_kwargs):
+        """Sends a GET request and reads the headers.
+
+        Returns:
+            tuple:
+                `obj` httpx.Response: The streamed response.
+                float: The seconds until the headers were read.
+
+        """
+        request = client.build_request(
+            "GET", url,
+            headers=request_kwargs.get('headers'),
+            params=request_kwargs.get('params'),
+            cookies=request_kwargs.get('cookies'),
+            timeout=self._to_timeout(request_kwargs.get('timeout')))
+        start = time.perf_counter()
+        response = client.send(
+            request, stream=True,
+            follow_redirects=request_kwargs.get('allow_redirects', True))
+        return response, time.perf_counter() - start
+
+    def get(self, url, **request_kwargs):
+        """Sends a GET request.
+
+        Args:
+            url (str): The URL.
+            **request_kwargs (kwargs, optional): requests library kwargs. Supports
+                `headers`, `params`, `cookies`, `allow_redirects`, `timeout` and
+                `stream`. Others are ignored with a warning.
+
+        Returns:
+            requests.Response: The response. Its body is read unless `stream`
+                is True. `raw.version` is 20 for HTTP/2.
+
+        Raises:
+            requests.RequestException: If the request fails.
+
+        """
+        for key, value in request_kwargs.items():
+            if key not in self.SUPPORTED_KWARGS or (key == 'verify' and value != self.verify):
+                log.warning("Request kwarg `%s` is not supported by Http2Session.", key)
+
+        url_obj = urllib.parse.urlsplit(url)
+        with _translate_errors():
+            if (self._h2c_client is not None and url_obj.scheme == "http" and
+                    url_obj.netloc not in self.http1_hosts):
+                try:
+                    response, elapsed = self._send(self._h2c_client, url, request_kwargs)
+                except httpx.RemoteProtocolError:
+                    log.info("%s does not support HTTP/2. Using HTTP/1.1.", url_obj.netloc)
+                    with self._lock:
+                        self.http1_hosts.add(url_obj.netloc)
+                    response, elapsed = self._send(self._client, url, request_kwargs)
+            else:
+                response, elapsed = self._send(self._client, url, request_kwargs)
+
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.reason = response.reason_phrase
+        converted.url = str(response.url)
+        converted.headers = requests.structures.CaseInsensitiveDict(response.headers.items())
+        converted.encoding = requests.utils.get_encoding_from_headers(converted.headers)
+        converted.elapsed = datetime.timedelta(seconds=elapsed)
+        converted.raw = _Body(response)
+        if not request_kwargs.get('stream'):
+            with contextlib.closing(converted):
+                converted.content  # Reads the body.
+        return converted
+
+    def close(self):
+        """Closes the connections of the session."""
+        self._client.close()
+        if self._h2c_client is not None:
+            self._h2c_client.close()
+
+
+class Http2SessionPool:
+    """Hands out a single shared Http2Session.
+
+    Has the interface of sessions.SessionPool, so it can be passed as the
+    `session_pool` of webpage.WebpageBuilder and robots.RobotsCache. Unlike
+    `requests.Session`, the session is not checked out exclusively.
+
+    """
+    def __init__(self, max_connections=100, prior_knowledge=False, verify=True):
+        """Initializes Http2SessionPool.
+
+        Args:
+            max_connections (int, optional): See Http2Session. Default 100.
+            prior_knowledge (bool, optional): See Http2Session. Default False.
+            verify (bool, optional): Verify TLS certificates. Default True.
+
+        Raises:
+            ImportError: If httpx or h2 is not installed.
+
+        """
+        self._session = Http2Session(max_connections, prior_knowledge, verify)
+
+    def __len__(self):
+        return 1
+
+    def acquire(self):
+        """Gets the shared session.
+
+        Returns:
+            Http2Session: The session.
+
+        """
+        return self._session
+
+    def release(self, session):
+        """Does nothing. Present for compatibility with sessions.SessionPool."""
+
+    @contextlib.contextmanager
+    def session(self):
+        """Gets the shared session for the duration of a with block."""
+        yield self._session
+
+    def close(self):
+        """Closes the session's connections."""
+        self._session.close()
@@ -2,8 +2,281 @@
 """Provides tools for interacting with links and URLs.
 
 """
+import fnmatch
+import functools
+import ipaddress
+import os
+import re
+import threading
 import urllib.parse
 
+import validators
+
+
+# The number of entries kept by each memoized link helper.
+LINK_CACHE_SIZE = 65536
+# Links with these schemes can never be crawled.
+IGNORED_SCHEMES = ("mailto:", "javascript:", "tel:", "data:")
+# The public suffix list bundled with the package.
+PUBLIC_SUFFIX_LIST_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "public_suffix_list.dat")
+
+
+@functools.lru_cache(maxsize=LINK_CACHE_SIZE)
+def _resolve_link(base_url, link):
+    """Resolves and validates a link. Memoized on (base_url, link).
+
+    Returns:
+        str: The absolute URL. `None` if the link is not a valid http(s) URL.
+
+    """
+    if link[:11].lstrip().lower().startswith(IGNORED_SCHEMES):
+        return None
+    try:
+        url_obj = urllib.parse.urlsplit(link)
+        if not url_obj.netloc:
+            link = urllib.parse.urljoin(base_url, link)
+            url_obj = urllib.parse.urlsplit(link)
+    except ValueError:
+        # Raised for malformed netlocs such as an unclosed IPv6 bracket.
+        return None
+    # Cheap checks first so the validators regex only sees plausible URLs.
+    if url_obj.scheme.lower() not in ("http", "https") or not url_obj.netloc:
+        return None
+    return link if validators.url(link) else None
+
+
+def _get_hostname(url):
+    """Gets the lowercased hostname of a URL without its port or trailing dot."""
+    try:
+        hostname = urllib.parse.urlsplit(url).hostname
+    except ValueError:
+        return ""
+    return (hostname or "").rstrip(".")
+
+
+@functools.lru_cache(maxsize=LINK_CACHE_SIZE)
+def _get_domain(url):
+    """Gets the registrable domain of a URL. Memoized on the URL."""
+    return PublicSuffixList.get_default().registrable_domain(_get_hostname(url))
+
+
+class PublicSuffixList:
+    """Finds the public suffix and registrable domain of a host.
+
+    Follows the algorithm of https://publicsuffix.org/list/: the longest
+    matching rule wins, `*` matches any label, `!` marks an exception to a
+    wildcard and hosts matching no rule use the last label. Rules are kept
+    in hash sets, so a lookup costs one set check per label of the host.
+
+    Examples:
+        >>> psl = PublicSuffixList(["uk", "co.uk", "*.ck", "!www.ck"])
+        >>> psl.registrable_domain("www.bbc.co.uk")
+        "bbc.co.uk"
+        >>> psl.public_suffix("www.ck")
+        "ck"
+
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, rules, include_private=True):
+        """Initializes PublicSuffixList.
+
+        Args:
+            rules (iterable(str)): The lines of a public suffix list file.
+                Comments and blank lines are ignored.
+            include_private (bool, optional): Use the rules of the private
+                domains section, such as "github.io", so each site under them
+                is its own domain. Default True.
+
+        """
+        self.rules = set()
+        self.wildcards = set()
+        self.exceptions = set()
+        for line in rules:
+            line = line.strip()
+            if line.startswith("// ===BEGIN PRIVATE DOMAINS===") and not include_private:
+                break
+            if not line or line.startswith("//"):
+                continue
+            rule = self._to_ascii(line.split()[0].lower())
+            if rule.startswith("!"):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith("*."):
+                self.wildcards.add(rule[2:])
+            else:
+                self.rules.add(rule)
+
+    @staticmethod
+    def _to_ascii(rule):
+        """Converts the internationalized labels of a rule to punycode."""
+        try:
+            return rule.encode("idna").decode("ascii")
+        except UnicodeError:
+            return rule
+
+    @classmethod
+    def from_file(cls, path, include_private=True):
+        """Loads a public suffix list file.
+
+        Args:
+            path (str): The file path, ex. a fresh copy of
+                https://publicsuffix.org/list/public_suffix_list.dat.
+            include_private (bool, optional): See `PublicSuffixList`.
+
+        Returns:
+            PublicSuffixList: The list.
+
+        """
+        with open(path, encoding="utf-8") as psl_file:
+            return cls(psl_file, include_private)
+
+    @classmethod
+    def get_default(cls):
+        """Gets the list used by `LinkUtils.get_domain`, loading it once.
+
+        Returns:
+            PublicSuffixList: The list set with `set_default`, or the bundled one.
+
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = cls.from_file(PUBLIC_SUFFIX_LIST_PATH)
+        return cls._default
+
+    @classmethod
+    def set_default(cls, psl):
+        """Sets the list used by `LinkUtils.get_domain`.
+
+        Args:
+            psl (PublicSuffixList): The list. `None` restores the bundled one.
+
+        """
+        cls._default = psl
+        _get_domain.cache_clear()
+
+    def public_suffix(self, host):
+        """Gets the public suffix of a host.
+
+        Args:
+            host (str): A lowercased hostname.
+
+        Returns:
+            str: The public suffix, ex. "co.uk" for "www.bbc.co.uk".
+
+        """
+        labels = host.split(".")
+        for index in range(len(labels)):
+            suffix = ".".join(labels[index:])
+            if suffix in self.exceptions:
+                return ".".join(labels[index + 1:])
+            if suffix in self.rules or ".".join(labels[index + 1:]) in self.wildcards:
+                return suffix
+        return labels[-1]
+
+    def registrable_domain(self, host):
+        """Gets the registrable domain of a host: its public suffix plus one label.
+
+        Args:
+            host (str): A lowercased hostname.
+
+        Returns:
+            str: The registrable domain. IP addresses and hosts that are
+                public suffixes themselves are returned unchanged.
+
+        """
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+        suffix = self.public_suffix(host)
+        if len(suffix) >= len(host):
+            return host
+        prefix = host[:-len(suffix) - 1]
+        return f"{prefix.rpartition('.')[2]}.{suffix}"
+
+
+class DomainMatcher:
+    """Matches URLs against a list of domains in constant time per URL.
+
+    "python.org" matches the host and its subdomains, and "*.python.org"
+    matches only the subdomains. The domains are kept in hash sets and a
+    URL is matched by looking up each suffix of its host, so the cost
+    depends on the number of labels in the host, not the number of domains.
+
+    Examples:
+        >>> matcher = DomainMatcher(["python.org", "*.pandas.org"])
+        >>> matcher.matches("http://docs.python.org/3/")
+        True
+        >>> matcher.matches("http://pandas.org/")
+        False
+
+    """
+    def __init__(self, domains=None):
+        """Initializes DomainMatcher.
+
+        Args:
+            domains (iterable(str), optional): The domains. Ports, schemes and
+                trailing dots are ignored.
+
+        """
+        self.domains = set()
+        self.subdomains = set()
+        for domain in domains or ():
+            domain = domain.strip().lower()
+            if "//" in domain:
+                domain = _get_hostname(domain)
+            domain = domain.split(":")[0].rstrip(".")
+            if domain.startswith("*."):
+                self.subdomains.add(domain[2:])
+            elif domain:
+                self.domains.add(domain)
+
+    @classmethod
+    def compile(cls, domains):
+        """Creates a matcher unless `domains` already is one.
+
+        Args:
+            domains (iterable(str) or DomainMatcher): The domains.
+
+        Returns:
+            DomainMatcher: The matcher.
+
+        """
+        if isinstance(domains, cls):
+            return domains
+        return cls(domains)
+
+    def __len__(self):
+        return len(self.domains) + len(self.subdomains)
+
+    def __bool__(self):
+        return bool(self.domains or self.subdomains)
+
+    def matches(self, url):
+        """Checks if a URL's host is one of the domains or a subdomain of one.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            bool: True if the URL matches.
+
+        """
+        host = _get_hostname(url)
+        if host in self.domains:
+            return True
+        index = host.find(".")
+        while index != -1:
+            suffix = host[index + 1:]
+            if suffix in self.domains or suffix in self.subdomains:
+                return True
+            index = host.find(".", index + 1)
+        return False
+
 
 class LinkUtils:
     """Utils for working with URLs and links."""
@@ -48,12 +321,31 @@ class LinkUtils:
         base_url = f"{url_obj.scheme}://{url_obj.netloc}"
         return base_url
 
+    @classmethod
+    def get_host(cls, url):
+        """Gets the host (netloc) from a url.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            str: The lowercased host and port of the URL.
+
+        Examples:
+            >>> get_host("http://www.Python.org:8000/test/link/path")
+            "www.python.org:8000"
+
+        """
+        return urllib.parse.urlparse(url).netloc.lower()
+
     @classmethod
     def get_domain(cls, url):
-        """Checks is two urls share the same domain.
+        """Gets the registrable domain of a URL.
 
-        Generates domains from the urllib.parse objects netloc. The domain is
-        extracted from the netloc by stripping the port and subdomain info.
+        The host's public suffix is found with the public suffix list, and
+        the domain is the suffix plus one label, so "bbc.co.uk" and
+        "gov.uk" are different domains. The port is dropped and IP
+        addresses are returned whole. See `PublicSuffixList`.
 
         Args:
             url (str): A URL.
@@ -65,10 +357,51 @@ class LinkUtils:
             >>> get_domain("http://subdomain.python.org:8000/test/link/path")
             "python.org"
 
+            >>> get_domain("http://www.bbc.co.uk/news")
+            "bbc.co.uk"
+
+        """
+        return _get_domain(url)
+
+    @classmethod
+    def resolve_links(cls, base_url, links):
+        """Resolves a batch of links into unique, valid absolute URLs.
+
+        Relative links are joined to `base_url`. Links with a scheme in
+        `IGNORED_SCHEMES` are rejected before any parsing, and everything
+        that is not a valid http(s) URL is dropped. Results are memoized on
+        (base_url, link), so links repeated on every page of a site, such as
+        navigation, are only resolved once.
+
+        Args:
+            base_url (str): The URL relative links are resolved against.
+            links (list(str)): The links.
+
+        Returns:
+            list(str): The unique valid absolute URLs, in the order they
+                first appear.
+
+        Examples:
+            >>> resolve_links(
+            >>>    "http://python.org",
+            >>>    ["/about", "mailto:help@python.org", "http://pandas.org"])
+            ["http://python.org/about", "http://pandas.org"]
+
         """
-        url_netloc = urllib.parse.urlparse(url).netloc
-        url_domain = ".".join(url_netloc.split(".")[-2:]).split(":")[0]
-        return url_domain
+        # A dict keeps the links unique and in page order.
+        resolved = {}
+        for link in links:
+            if link:
+                url = _resolve_link(base_url, link)
+                if url is not None:
+                    resolved[url] = None
+        return list(resolved)
+
+    @classmethod
+    def clear_cache(cls):
+        """Clears the memoized link resolution and domain results."""
+        _resolve_link.cache_clear()
+        _get_domain.cache_clear()
 
     @classmethod
     def is_same_domain(cls, url1, url2):
@@ -93,3 +426,171 @@ class LinkUtils:
 
         """
         return cls.get_domain(url1) == cls.get_domain(url2)
+
+
+class Canonicalizer:
+    """Rewrites URLs into a canonical form so duplicates can be detected.
+
+    Canonicalization lowercases the scheme and host, drops default ports
+    and fragments, normalizes percent-encoding and dot-segments and sorts
+    query parameters. Query parameters matching `strip_params` are removed.
+
+    Attributes:
+        strip_params (tuple(str)): Query parameter names to remove. Names are
+            matched case-insensitively and may contain shell-style wildcards.
+            Parameters with these names are also removed from path
+            segments (ex. ";jsessionid=...").
+        sort_query (bool): If true, query parameters are sorted.
+        strip_trailing_slash (bool): If true, a trailing slash is removed from
+            non-root paths. Not all servers treat "/a/" and "/a" the same.
+
+    """
+    DEFAULT_STRIP_PARAMS = (
+        "utm_*", "gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid",
+        "mc_eid", "_ga", "_hsenc", "_hsmi", "jsessionid", "phpsessid",
+        "sessionid", "aspsessionid*", "cfid", "cftoken")
+    DEFAULT_PORTS = {"http": "80", "https": "443"}
+    # RFC 3986 unreserved characters never need percent-encoding.
+    _UNRESERVED = frozenset(
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+    _PERCENT_ENCODED = re.compile(r"%([0-9A-Fa-f]{2})")
+
+    def __init__(
+            self,
+            strip_params=DEFAULT_STRIP_PARAMS,
+            sort_query=True,
+            strip_trailing_slash=False,
+            cache_size=LINK_CACHE_SIZE):
+        """Initializes Canonicalizer.
+
+        Args:
+            strip_params (list(str), optional): Query parameter names to remove.
+                Default `Canonicalizer.DEFAULT_STRIP_PARAMS`, which covers common
+                tracking and session parameters.
+            sort_query (bool, optional): Sort query parameters. Default True.
+            strip_trailing_slash (bool, optional): Remove trailing slashes
+                from non-root paths. Default False.
+            cache_size (int, optional): The number of canonicalized URLs to
+                memoize. Default `LINK_CACHE_SIZE`.
+
+        """
+        self.strip_params = tuple(param.lower() for param in strip_params or ())
+        self.sort_query = sort_query
+        self.strip_trailing_slash = strip_trailing_slash
+        self._cached_canonicalize = functools.lru_cache(maxsize=cache_size)(
+            self._canonicalize)
+
+    def _is_stripped(self, name):
+        """Checks if a query parameter name should be removed."""
+        name = urllib.parse.unquote_plus(name).lower()
+        return any(fnmatch.fnmatchcase(name, param) for param in self.strip_params)
+
+    @classmethod
+    def _normalize_percent_encoding(cls, component, safe):
+        """Decodes escaped unreserved characters and uppercases the rest.
+
+        Characters that are not allowed in the component are encoded.
+        """
+        def _normalize(match):
+            char = chr(int(match.group(1), 16))
+            return char if char in cls._UNRESERVED else "%" + match.group(1).upper()
+        component = cls._PERCENT_ENCODED.sub(_normalize, component)
+        return urllib.parse.quote(component, safe=safe + "%")
+
+    @classmethod
+    def _remove_dot_segments(cls, path):
+        """Resolves "." and ".." path segments (RFC 3986 section 5.2.4)."""
+        segments = path.split("/")
+        output = []
+        for segment in segments:
+            if segment == "..":
+                if len(output) > 1:
+                    output.pop()
+            elif segment != ".":
+                output.append(segment)
+        if segments[-1] in (".", ".."):
+            output.append("")
+        return "/".join(output)
+
+    def _canonical_netloc(self, url_obj):
+        """Lowercases the host and drops the port if it is the default."""
+        netloc = url_obj.netloc
+        userinfo, _, hostport = netloc.rpartition("@")
+        host, port = hostport, ""
+        if hostport.startswith("["):
+            close = hostport.find("]")
+            if close != -1 and hostport[close + 1:close + 2] == ":":
+                host, port = hostport[:close + 1], hostport[close + 2:]
+        elif ":" in hostport:
+            host, _, port = hostport.partition(":")
+        host = host.lower().rstrip(".")
+        if port == self.DEFAULT_PORTS.get(url_obj.scheme.lower()) or not port:
+            hostport = host
+        else:
+            hostport = f"{host}:{port}"
+        return f"{userinfo}@{hostport}" if userinfo else hostport
+
+    def _canonical_path(self, path):
+        """Normalizes percent-encoding and dot-segments of a path."""
+        if self.strip_params and ";" in path:
+            segments = []
+            for segment in path.split("/"):
+                segment, *params = segment.split(";")
+                params = [
+                    param for param in params
+                    if not self._is_stripped(param.partition("=")[0])]
+                segments.append(";".join([segment] + params))
+            path = "/".join(segments)
+        path = self._normalize_percent_encoding(path, safe="/:@!$&'()*+,;=")
+        path = self._remove_dot_segments(path) or "/"
+        if self.strip_trailing_slash and len(path) > 1:
+            path = path.rstrip("/") or "/"
+        return path
+
+    def _canonical_query(self, query):
+        """Normalizes, filters and sorts the query parameters."""
+        params = []
+        for param in query.split("&"):
+            if not param:
+                continue
+            name = param.partition("=")[0]
+            if self.strip_params and self._is_stripped(name):
+                continue
+            params.append(
+                self._normalize_percent_encoding(param, safe="/?:@!$'()*+,;=&"))
+        if self.sort_query:
+            params.sort()
+        return "&".join(params)
+
+    def canonicalize(self, url):
+        """Converts a URL to its canonical form.
+
+        URLs without a network location are returned unmodified.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            str: The canonical URL.
+
+        Examples:
+            >>> Canonicalizer().canonicalize("HTTP://Python.org:80/a/./b/../c?z=1&a=2#top")
+            "http://python.org/a/c?a=2&z=1"
+
+            >>> Canonicalizer().canonicalize("http://python.org/a?utm_source=x&b=1")
+            "http://python.org/a?b=1"
+
+        """
+        return self._cached_canonicalize(url)
+
+    def _canonicalize(self, url):
+        """Canonicalizes a URL without memoization."""
+        url_obj = urllib.parse.urlsplit(url.strip())
+        if not url_obj.netloc:
+            return url
+        return urllib.parse.urlunsplit((
+            url_obj.scheme.lower(),
+            self._canonical_netloc(url_obj),
+            self._canonical_path(url_obj.path),
+            self._canonical_query(url_obj.query),
+            ""))
@@ -0,0 +1,400 @@
+"""Provides crawl metrics.
+
+Records per-stage latency histograms, counters and gauges for a crawl.
+Metrics can be read as a snapshot, logged periodically, or exported in
+the Prometheus text format.
+
+Recording a value takes a lock and a few dictionary updates, so metrics
+are cheap enough to leave on.
+
+"""
+import bisect
+import contextlib
+import http.server
+import logging
+import threading
+import time
+
+
+log = logging.getLogger('bitcrawler')
+
+
+class Histogram:
+    """A histogram with fixed buckets.
+
+    Attributes:
+        buckets (tuple(float)): The upper bounds of the buckets.
+        counts (list(int)): The observations per bucket. The last count is
+            for observations above every bound.
+        count (int): The number of observations.
+        sum (float): The sum of the observations.
+
+    """
+    # Seconds, from half a millisecond to a minute.
+    DEFAULT_BUCKETS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+        0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Initializes Histogram.
+
+        Args:
+            buckets (tuple(float), optional): The sorted bucket upper bounds.
+                Default `Histogram.DEFAULT_BUCKETS`.
+
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Records an observation.
+
+        Args:
+            value (float): The observed value.
+
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimates a quantile by interpolating within its bucket.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimated value. `None` if there are no observations.
+
+        Examples:
+            >>> histogram.quantile(0.99)
+            0.25
+
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        """Gets a summary of the histogram.
+
+        Returns:
+            dict: The count, sum, mean, p50, p90 and p99.
+
+        """
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """A thread-safe collection of crawl metrics.
+
+    Counters and gauges are identified by a name and optional labels.
+    Stage latencies are recorded in one histogram per stage.
+
+    Examples:
+        >>> metrics = Metrics()
+        >>> with metrics.time("parse"):
+        >>>     parse(page)
+        >>> metrics.inc("pages_total")
+        >>> metrics.snapshot()["counters"]["pages_total"]
+        1
+
+    """
+    def __init__(self, buckets=Histogram.DEFAULT_BUCKETS):
+        """Initializes Metrics.
+
+        Args:
+            buckets (tuple(float), optional): The stage histogram buckets.
+                Default `Histogram.DEFAULT_BUCKETS`.
+
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._logger = None
+        self._server = None
+        self.reset()
+
+    def reset(self):
+        """Clears every metric and restarts the clock."""
+        with self._lock:
+            self.started = time.monotonic()
+            # Maps (name, labels) to values, where labels is a sorted tuple of pairs.
+            self._counters = {}
+            self._gauges = {}
+            self._stages = {}
+            self._hosts = {}
+
+    def inc(self, name, value=1, **labels):
+        """Increments a counter.
+
+        Args:
+            name (str): The counter name.
+            value (float, optional): The amount to add. Default 1.
+            **labels: The counter labels.
+
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Sets a gauge.
+
+        Args:
+            name (str): The gauge name.
+            value (float): The value.
+            **labels: The gauge labels.
+
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, stage, seconds):
+        """Records the latency of a stage.
+
+        Args:
+            stage (str): The stage name (ex. "parse").
+            seconds (float): The latency.
+
+        """
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        """Records the latency of a with block as a stage.
+
+        Args:
+            stage (str): The stage name.
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc_host(self, host):
+        """Counts a page crawled from a host.
+
+        Args:
+            host (str): The host.
+
+        """
+        with self._lock:
+            self._hosts[host] = self._hosts.get(host, 0) + 1
+
+    def get_counter(self, name, **labels):
+        """Gets the value of a counter.
+
+        Args:
+            name (str): The counter name.
+            **labels: The counter labels.
+
+        Returns:
+            float: The value. 0 if it was never incremented.
+
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @staticmethod
+    def _format_key(name, labels):
+        """Formats a metric key as name{label="value"}."""
+        if not labels:
+            return name
+        formatted = ",".join(
+            f'{label}="{str(value)}"' for label, value in labels)
+        return f"{name}{{{formatted}}}"
+
+    def snapshot(self, top_hosts=10):
+        """Gets the current value of every metric.
+
+        Args:
+            top_hosts (int, optional): The number of busiest hosts to report.
+                Default 10.
+
+        Returns:
+            dict: The elapsed seconds, pages per second, counters, gauges,
+                stage latency summaries, the pages per second of the
+                busiest hosts and the DNS cache hit rate (`None` if no
+                lookups went through the cache).
+
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            counters = {
+                self._format_key(name, labels): value
+                for (name, labels), value in self._counters.items()}
+            gauges = {
+                self._format_key(name, labels): value
+                for (name, labels), value in self._gauges.items()}
+            stages = {
+                stage: histogram.snapshot()
+                for stage, histogram in self._stages.items()}
+            hosts = sorted(self._hosts.items(), key=lambda item: -item[1])[:top_hosts]
+            dns_lookups = {
+                dict(labels).get("result"): value
+                for (name, labels), value in self._counters.items()
+                if name == "dns_lookups_total"}
+        dns_total = sum(dns_lookups.values())
+        return {
+            "elapsed": elapsed,
+            "pages_per_sec": counters.get("pages_total", 0) / elapsed,
+            "counters": counters,
+            "gauges": gauges,
+            "stages": stages,
+            "hosts": {host: pages / elapsed for host, pages in hosts},
+            "dns_hit_rate": (
+                (dns_total - dns_lookups.get("miss", 0)) / dns_total if dns_total else None),
+        }
+
+    def log_line(self):
+        """Formats a one line summary of the crawl.
+
+        Returns:
+            str: The summary.
+
+        """
+        snapshot = self.snapshot(top_hosts=0)
+        counters = snapshot["counters"]
+        errors = sum(
+            value for key, value in counters.items() if key.startswith("errors_total"))
+        stages = " ".join(
+            f"{stage}={summary['p50'] * 1000:.0f}/{summary['p99'] * 1000:.0f}ms"
+            for stage, summary in sorted(snapshot["stages"].items()))
+        dns = ""
+        if snapshot["dns_hit_rate"] is not None:
+            dns = f"dns_hits={snapshot['dns_hit_rate'] * 100:.0f}% "
+        return (
+            f"pages={counters.get('pages_total', 0)} "
+            f"rate={snapshot['pages_per_sec']:.1f}/s "
+            f"bytes={counters.get('bytes_total', 0)} "
+            f"errors={errors} "
+            f"timeouts={counters.get('timeouts_total', 0)} "
+            f"robots_denied={counters.get('robots_denied_total', 0)} "
+            f"queue={snapshot['gauges'].get('queue_depth', 0)} "
+            f"active={snapshot['gauges'].get('active_workers', 0)} "
+            f"{dns}"
+            f"p50/p99 {stages}").rstrip()
+
+    def start_logging(self, interval=10):
+        """Logs `log_line` every interval from a background thread.
+
+        Args:
+            interval (float, optional): Seconds between log lines. Default 10.
+
+        """
+        self.stop_logging()
+        stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(interval):
+                log.info("Crawl metrics: %s", self.log_line())
+
+        thread = threading.Thread(target=run, name="bitcrawler-metrics", daemon=True)
+        self._logger = (thread, stopped)
+        thread.start()
+
+    def stop_logging(self):
+        """Stops the periodic log line."""
+        if self._logger is not None:
+            thread, stopped = self._logger
+            stopped.set()
+            thread.join()
+            self._logger = None
+
+    def to_prometheus(self, prefix="bitcrawler"):
+        """Exports the metrics in the Prometheus text format.
+
+        Args:
+            prefix (str, optional): The metric name prefix. Default "bitcrawler".
+
+        Returns:
+            str: The metrics, one sample per line.
+
+        """
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                typed = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {prefix}_{name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{self._format_key(f'{prefix}_{name}', labels)} {value}")
+            if self._stages:
+                name = f"{prefix}_stage_seconds"
+                lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(
+                        histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """Serves `to_prometheus` over HTTP from a background thread.
+
+        Args:
+            port (int): The port. 0 picks a free port.
+            host (str, optional): The address to bind. Default "127.0.0.1".
+
+        Returns:
+            int: The port being served.
+
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.stop_http_server()
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=self._server.serve_forever, name="bitcrawler-prometheus",
+            daemon=True).start()
+        return self._server.server_port
+
+    def stop_http_server(self):
+        """Stops the Prometheus HTTP server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -2,10 +2,26 @@
 """Utilities for parsing html.
 
 Extends functionality of BeautifulSoup for added html parsing functionality.
+Also provides faster link extraction backends. lxml and selectolax backends
+are available when those packages are installed.
 
 """
+import html as html_lib
+import re
+
 from bs4 import BeautifulSoup
 
+try:
+    import lxml.etree as lxml_etree
+    import lxml.html as lxml_html
+except ImportError:
+    lxml_etree = lxml_html = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
 
 class HtmlParser(BeautifulSoup):
     """HtmlParser extends functionality provided by BeautifulSoup."""
@@ -25,4 +41,218 @@ class HtmlParser(BeautifulSoup):
             ["http://python.org/search", "/about", ..., "http://python.org/learn"]
 
         """
-        return list(set(a["href"] for a in self.find_all("a", href=True)))
+        return list(dict.fromkeys(a["href"] for a in self.find_all("a", href=True)))
+
+    def get_canonical_link(self):
+        """Finds the canonical link declared by a `<link rel="canonical">` tag.
+
+        Args:
+            None
+
+        Returns:
+            str: The canonical link. `None` if the page does not declare one.
+
+        Examples:
+            >>> HtmlParser('<link rel="canonical" href="/about">').get_canonical_link()
+            "/about"
+
+        """
+        link = self.find("link", rel="canonical", href=True)
+        return link["href"] if link else None
+
+
+class LinkExtractor:
+    """Base class for link extraction backends.
+
+    Backends find the `href` of every anchor tag and the canonical link of
+    an html document. They are selected by `name` with `get_link_extractor`.
+
+    """
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        """Checks if the backend's dependencies are installed.
+
+        Returns:
+            bool: True if the backend can be used.
+
+        """
+        return True
+
+    @classmethod
+    def get_links(cls, html):
+        """Finds links from anchor tags in the html.
+
+        Args:
+            html (str): The html document.
+
+        Returns:
+            list(str): A list of links discovered within the html.
+
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def get_canonical_link(cls, html):
+        """Finds the canonical link declared by a `<link rel="canonical">` tag.
+
+        Args:
+            html (str): The html document.
+
+        Returns:
+            str: The canonical link. `None` if the page does not declare one.
+
+        """
+        raise NotImplementedError
+
+
+class BeautifulSoupLinkExtractor(LinkExtractor):
+    """Extracts links by building a BeautifulSoup tree with `html.parser`."""
+    name = "bs4"
+
+    @classmethod
+    def get_links(cls, html):
+        return HtmlParser(html, "html.parser").get_links()
+
+    @classmethod
+    def get_canonical_link(cls, html):
+        return HtmlParser(html, "html.parser").get_canonical_link()
+
+
+class StreamingLinkExtractor(LinkExtractor):
+    """Extracts links with a streaming tokenizer that never builds a tree.
+
+    Scans the document for `<a>` and `<link>` start tags, skipping comments
+    and the contents of `<script>` and `<style>` elements.
+
+    """
+    name = "stream"
+    _TAGS = re.compile(
+        r"<!--.*?(?:-->|\Z)"
+        r"|<(script|style)\b[^>]*>.*?(?:</\1\s*>|\Z)"
+        r"|<(a|link)\b((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>",
+        re.IGNORECASE | re.DOTALL)
+    _ATTRIBUTES = re.compile(
+        r"([^\s\"'>/=]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+)))?")
+
+    @classmethod
+    def _iter_tags(cls, html):
+        """Yields (tag, attributes) for each `<a>` and `<link>` start tag."""
+        for match in cls._TAGS.finditer(html):
+            tag = match.group(2)
+            if tag is None:
+                continue
+            attributes = {}
+            for name, double, single, bare in cls._ATTRIBUTES.findall(match.group(3)):
+                name = name.lower()
+                if name not in attributes:
+                    attributes[name] = html_lib.unescape(double or single or bare)
+            yield tag.lower(), attributes
+
+    @classmethod
+    def get_links(cls, html):
+        return list(dict.fromkeys(
+            attributes["href"] for tag, attributes in cls._iter_tags(html)
+            if tag == "a" and "href" in attributes))
+
+    @classmethod
+    def get_canonical_link(cls, html):
+        for tag, attributes in cls._iter_tags(html):
+            if (tag == "link" and "href" in attributes and
+                    "canonical" in attributes.get("rel", "").lower().split()):
+                return attributes["href"]
+        return None
+
+
+class LxmlLinkExtractor(LinkExtractor):
+    """Extracts links with lxml's C html parser. Requires lxml."""
+    name = "lxml"
+
+    @classmethod
+    def is_available(cls):
+        return lxml_html is not None
+
+    @classmethod
+    def _parse(cls, html):
+        """Parses the html. Returns `None` for an empty document."""
+        try:
+            return lxml_html.fromstring(html)
+        except (lxml_etree.ParserError, ValueError):
+            return None
+
+    @classmethod
+    def get_links(cls, html):
+        document = cls._parse(html)
+        if document is None:
+            return []
+        return list(dict.fromkeys(str(href) for href in document.xpath("//a/@href")))
+
+    @classmethod
+    def get_canonical_link(cls, html):
+        document = cls._parse(html)
+        if document is None:
+            return None
+        hrefs = document.xpath(
+            "//link[contains(concat(' ', normalize-space(@rel), ' '), ' canonical ')]/@href")
+        return str(hrefs[0]) if hrefs else None
+
+
+class SelectolaxLinkExtractor(LinkExtractor):
+    """Extracts links with selectolax's lexbor parser. Requires selectolax."""
+    name = "selectolax"
+
+    @classmethod
+    def is_available(cls):
+        return LexborHTMLParser is not None
+
+    @classmethod
+    def get_links(cls, html):
+        tree = LexborHTMLParser(html)
+        # A bare `href` attribute has no value.
+        return list(dict.fromkeys(node.attributes["href"] or "" for node in tree.css("a[href]")))
+
+    @classmethod
+    def get_canonical_link(cls, html):
+        node = LexborHTMLParser(html).css_first('link[rel~="canonical"][href]')
+        return node.attributes["href"] if node is not None else None
+
+
+LINK_EXTRACTORS = {
+    extractor.name: extractor
+    for extractor in (
+        BeautifulSoupLinkExtractor,
+        StreamingLinkExtractor,
+        LxmlLinkExtractor,
+        SelectolaxLinkExtractor)
+}
+
+
+def get_link_extractor(name):
+    """Gets a link extraction backend by name.
+
+    Args:
+        name (str): "bs4", "stream", "lxml" or "selectolax".
+
+    Returns:
+        LinkExtractor: The backend class.
+
+    Raises:
+        ValueError: If the backend does not exist.
+        ImportError: If the backend's dependencies are not installed.
+
+    Examples:
+        >>> get_link_extractor("stream").get_links('<a href="/about">About</a>')
+        ["/about"]
+
+    """
+    try:
+        extractor = LINK_EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown link extractor {name!r}. "
+            f"Choose one of {sorted(LINK_EXTRACTORS)}.") from None
+    if not extractor.is_available():
+        raise ImportError(
+            f"The {name!r} link extractor requires {name} to be installed.")
+    return extractor
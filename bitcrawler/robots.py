@@ -5,22 +5,322 @@ for robots.txt fetching and parsing.
 
 """
 
+import collections
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
 import urllib.parse
+
+import requests
 import reppy.cache
-from reppy.robots import Robots
+import reppy.exceptions
+from reppy.robots import Robots, AllowNone, AllowAll
+from . import deadline as deadlines
 from . import link_utils
+from . import sessions
+
+
+log = logging.getLogger('bitcrawler')
+
+# Matches the reppy limit on the size of a robots.txt file.
+MAX_ROBOTS_SIZE = 1048576
+
+
+RobotsEntry = collections.namedtuple("RobotsEntry", ["expires", "robots", "source"])
+RobotsEntry.__doc__ = """A cached robots.txt file.
+
+Attributes:
+    expires (float): The `time.time()` the entry expires.
+    robots (reppy.Robots): The parsed rules. The exception raised by the
+        fetch if the cache policy reraises errors.
+    source (tuple(int, bytes)): The status code and body the rules were
+        parsed from. `None` for errors, which are never persisted.
+
+"""
+
+
+class _Fetch:
+    """A robots.txt fetch shared by every thread waiting on it."""
+    __slots__ = ("event", "entry")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+
+
+class RobotsCache:
+    """A thread-safe robots.txt cache.
+
+    Parsed rules are kept in a least recently used cache and expire per
+    the ttl policy. Concurrent lookups for the same robots.txt share one
+    fetch, so 100 threads reaching a new host make a single request.
 
+    With `persist_path` set, every fetched robots.txt file is also written
+    to a SQLite database and loaded from it on start up, so repeated runs
+    skip the fetches until the entries expire.
 
-class RobotsCache(reppy.cache.RobotsCache):
-    """Extends the reppy RobotsCache to include extra functionality.
+    Attributes:
+        capacity (int): The max number of cached robots.txt files.
+        cache_policy (`obj`): The reppy cache policy for fetch errors.
+        ttl_policy (`obj`): The reppy ttl policy.
+        session_pool (:obj:sessions.SessionPool): The pool of keep-alive
+            sessions to fetch with. May be `None`.
+        persist_path (str): The SQLite database path. May be `None`.
+        fetches (int): The number of robots.txt fetches made.
 
     """
+    DEFAULT_CACHE_POLICY = reppy.cache.RobotsCache.DEFAULT_CACHE_POLICY
+    DEFAULT_TTL_POLICY = Robots.DEFAULT_TTL_POLICY
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS robots "
+        "(robots_url TEXT PRIMARY KEY, expires REAL, status_code INTEGER, content BLOB)")
+
+    def __init__(
+            self, capacity, cache_policy=None, ttl_policy=None,
+            *args, session_pool=None, persist_path=None, **kwargs):
+        """Initializes RobotsCache.
+
+        Args:
+            capacity (int): The number of reppy.Robots objects to cache.
+            cache_policy (`obj`, optional): The reppy cache policy.
+                If `None` default is reppy.cache.RobotsCache.DEFAULT_CACHE_POLICY.
+            ttl_policy (`obj`, optional): The reppy ttl policy.
+                If `None` default is reppy.Robots.DEFAULT_TTL_POLICY.
+            *args: Additional args passed to requests.get.
+            session_pool (:obj:sessions.SessionPool, optional): A pool of
+                keep-alive sessions to fetch robots.txt files with.
+            persist_path (str, optional): A SQLite database to persist the
+                cache to. Default `None`.
+            **kwargs: Additional kwargs passed to requests.get.
+
+        """
+        self.capacity = capacity
+        self.cache_policy = cache_policy or self.DEFAULT_CACHE_POLICY
+        self.ttl_policy = ttl_policy or self.DEFAULT_TTL_POLICY
+        self.args = args
+        self.kwargs = kwargs
+        self.session_pool = session_pool
+        self.persist_path = persist_path
+        self.fetches = 0
+        # Maps robots.txt URLs to RobotsEntry in least recently used order.
+        self._cache = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        if persist_path:
+            self._connection = sqlite3.connect(
+                persist_path, check_same_thread=False, isolation_level=None)
+            self._connection.execute(self._SCHEMA)
+            self._load()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, url):
+        return self.get_entry(Robots.robots_url(url)) is not None
+
+    def _load(self):
+        """Loads the unexpired entries of the persisted cache."""
+        rows = self._connection.execute(
+            "SELECT robots_url, expires, status_code, content FROM robots "
+            "WHERE expires > ? ORDER BY expires DESC LIMIT ?",
+            (time.time(), self.capacity)).fetchall()
+        for robots_url, expires, status_code, content in reversed(rows):
+            try:
+                robots = ReppyUtils.parse_robots(
+                    robots_url, status_code, content, expires)
+            except Exception as err:
+                log.warning("Could not load robots.txt %s: %s", robots_url, err)
+                continue
+            self._cache[robots_url] = RobotsEntry(
+                expires, robots, (status_code, content))
+        log.info("Loaded %d robots.txt files from %s.", len(rows), self.persist_path)
+
+    def get_entry(self, robots_url):
+        """Gets a cached entry without fetching.
+
+        Args:
+            robots_url (str): The robots.txt URL.
+
+        Returns:
+            RobotsEntry: The entry. `None` if it is not cached or has expired.
+
+        """
+        with self._lock:
+            entry = self._cache.get(robots_url)
+            if entry is None or entry.expires <= time.time():
+                return None
+            self._cache.move_to_end(robots_url)
+            return entry
+
+    def store_entry(self, robots_url, entry):
+        """Caches an entry, persisting it if it was fetched successfully.
+
+        Args:
+            robots_url (str): The robots.txt URL.
+            entry (RobotsEntry): The entry.
+
+        """
+        with self._lock:
+            self._cache[robots_url] = entry
+            self._cache.move_to_end(robots_url)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+            if self._connection is not None and entry.source is not None:
+                status_code, content = entry.source
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO robots VALUES (?, ?, ?, ?)",
+                    (robots_url, entry.expires, status_code, content))
+
+    def fetch_entry(self, robots_url, request_kwargs=None, deadline=None):
+        """Fetches a robots.txt file, applying the cache policy to errors.
+
+        Args:
+            robots_url (str): The robots.txt URL.
+            request_kwargs (dict, optional): The request kwargs. Default the
+                kwargs the cache was initialized with.
+            deadline (deadline.Deadline, optional): The time the fetch must
+                finish by.
+
+        Returns:
+            RobotsEntry: The fetched entry.
+
+        """
+        with self._lock:
+            self.fetches += 1
+        try:
+            status_code, content, expires = ReppyUtils.download_robots(
+                robots_url,
+                self.kwargs if request_kwargs is None else request_kwargs,
+                session_pool=self.session_pool,
+                ttl_policy=self.ttl_policy,
+                deadline=deadline)
+            robots = ReppyUtils.parse_robots(robots_url, status_code, content, expires)
+            return RobotsEntry(expires, robots, (status_code, content))
+        except Exception as err:
+            log.error("Error fetching robots.txt %s: %s", robots_url, err)
+            expires, robots = self.cache_policy.exception(robots_url, err)
+            return RobotsEntry(expires, robots, None)
+
+    def fetch(self, url):
+        """Fetches the robots.txt file at the URL.
+
+        Args:
+            url (str): The robots.txt URL.
+
+        Returns:
+            tuple(float, reppy.Robots): The expiration time and robots object.
+
+        """
+        entry = self.fetch_entry(url)
+        return entry.expires, entry.robots
+
+    def get(self, url, request_kwargs=None, deadline=None):
+        """Gets the robots object for a URL, fetching it if needed.
+
+        Only one thread fetches a given robots.txt. Others asking for it at
+        the same time wait for that fetch.
+
+        Args:
+            url (str): A URL on the host.
+            request_kwargs (dict, optional): The request kwargs for a fetch.
+                Default the kwargs the cache was initialized with.
+            deadline (deadline.Deadline, optional): The time to fetch or wait
+                for the robots.txt file by.
+
+        Returns:
+            reppy.Robots: The parsed robots.txt.
+
+        Raises:
+            requests.Timeout: If the deadline passes while waiting for
+                another thread's fetch.
+            Exception: The fetch error, if the cache policy reraises errors.
+
+        """
+        robots_url = Robots.robots_url(url)
+        entry = self.get_entry(robots_url)
+        while entry is None:
+            with self._lock:
+                fetch = self._pending.get(robots_url)
+                leader = fetch is None
+                if leader:
+                    fetch = self._pending[robots_url] = _Fetch()
+            if leader:
+                try:
+                    fetch.entry = self.fetch_entry(robots_url, request_kwargs, deadline)
+                    self.store_entry(robots_url, fetch.entry)
+                finally:
+                    with self._lock:
+                        del self._pending[robots_url]
+                    fetch.event.set()
+            elif not fetch.event.wait(None if deadline is None else deadline.remaining()):
+                raise requests.Timeout(
+                    f"Waiting for {robots_url} exceeded the page deadline")
+            # Retried if the leading thread was interrupted.
+            entry = fetch.entry
+        if isinstance(entry.robots, BaseException):
+            raise entry.robots
+        return entry.robots
+
+    def allowed(self, url, user_agent, deadline=None):
+        """Determines if a URL is crawlable for a given user agent.
+
+        Args:
+            url (str): The url to check for crawlability.
+            user_agent (str): The user agent to check for in robots.txt.
+            deadline (deadline.Deadline, optional): The time to get the
+                robots.txt file by.
+
+        Returns:
+            bool: True if the page is allowed to be crawled.
+
+        """
+        return self.get(url, deadline=deadline).allowed(url, user_agent)
+
+    def partition_allowed(self, urls, user_agent):
+        """Splits URLs by the cached rules of their hosts, without fetching.
+
+        URLs are grouped by robots.txt URL so each host's rules are looked
+        up once. URLs whose robots.txt is not cached (or could not be
+        fetched) are kept, to be checked when they are fetched.
+
+        Args:
+            urls (list(str)): The URLs to check.
+            user_agent (str): The user agent to check for in robots.txt.
+
+        Returns:
+            tuple:
+                list(str): The URLs that are allowed or not yet known.
+                list(str): The URLs disallowed by robots.txt.
+
+        Examples:
+            >>> cache.partition_allowed(
+            >>>     ["http://python.org/", "http://python.org/private"], "bitcrawler")
+            (["http://python.org/"], ["http://python.org/private"])
+
+        """
+        by_host = collections.defaultdict(list)
+        for url in urls:
+            by_host[Robots.robots_url(url)].append(url)
+        allowed, disallowed = [], []
+        for robots_url, host_urls in by_host.items():
+            entry = self.get_entry(robots_url)
+            if entry is None or isinstance(entry.robots, BaseException):
+                allowed.extend(host_urls)
+                continue
+            for url in host_urls:
+                if entry.robots.allowed(url, user_agent):
+                    allowed.append(url)
+                else:
+                    disallowed.append(url)
+        return allowed, disallowed
 
     def crawl_delay(self, url, user_agent="python-requests"):
         """Gets a crawl delay for a given url and user_agent.
         Note: Crawl delay is the same for all pages under a robots.txt file for
             a given user agent.
-        Note: Going to open a PR on reppy to have this built in.
         Args:
             url (str): The target URL.
             user_agent (str, optional): The user agent. Default "python-requests"
@@ -36,10 +336,41 @@ class RobotsCache(reppy.cache.RobotsCache):
             delay = 0
         return delay
 
+    def cached_crawl_delay(self, url, user_agent="python-requests"):
+        """Gets a crawl delay only if the robots.txt file is already cached.
+
+        Never fetches, so it is safe to call from the crawl scheduler.
+
+        Args:
+            url (str): The target URL.
+            user_agent (str, optional): The user agent. Default "python-requests"
+        Returns:
+            int: The crawl delay in seconds. `None` if the robots.txt file is
+                not cached or has expired. 0 if it could not be fetched.
+        """
+        entry = self.get_entry(Robots.robots_url(url))
+        if entry is None:
+            return None
+        if isinstance(entry.robots, BaseException):
+            return 0
+        return entry.robots.agent(user_agent).delay or 0
+
+    def close(self):
+        """Closes the persisted cache database."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
 
 class ReppyUtils:
     """A set of reppy utilities.
     """
+    # The number of robots.txt files cached by `allowed` and `crawl_delay`.
+    CACHE_CAPACITY = 100
+    _cache = None
+    _cache_lock = threading.Lock()
+
     @classmethod
     def get_robots_url(cls, url):
         """ Gets the URL where the robots file should be stored.
@@ -55,30 +386,148 @@ class ReppyUtils:
             'http://python.org/robots.txt'_
         """
         base_url = link_utils.LinkUtils.get_base_url(url)
-        robots_url = urllib.parse.urljoin(base_url, "robots.txt")
-        print(robots_url)
-        return robots_url
+        return urllib.parse.urljoin(base_url, "robots.txt")
 
     @classmethod
-    def fetch_robots(cls, robots_url, request_kwargs=None):
+    def get_cache(cls):
+        """Gets the robots.txt cache shared by `allowed` and `crawl_delay`.
+
+        Returns:
+            RobotsCache: The shared cache.
+
+        """
+        with cls._cache_lock:
+            if cls._cache is None:
+                cls._cache = RobotsCache(cls.CACHE_CAPACITY)
+            return cls._cache
+
+    @classmethod
+    def download_robots(
+            cls, robots_url, request_kwargs=None, session_pool=None, ttl_policy=None,
+            deadline=None):
+        """Downloads a robots.txt file.
+
+        Args:
+            robots_url (str): The robots url to fetch.
+            request_kwargs (dict, optional): The keyword arguments to pass into
+                the requests.get call to the robots.txt url. Default `None`
+            session_pool (:obj:sessions.SessionPool, optional): A pool of
+                keep-alive sessions. If `None`, requests.get is used.
+            ttl_policy (`obj`, optional): The reppy ttl policy.
+                If `None` default is reppy.Robots.DEFAULT_TTL_POLICY.
+            deadline (deadline.Deadline, optional): The time the download
+                must finish by. The request timeouts are capped at the time
+                left and the connection is shut down when it passes.
+
+        Returns:
+            tuple:
+                int: The status code.
+                bytes: The body.
+                float: The expiration time.
+
+        Raises:
+            reppy.exceptions.ContentTooLong: If the file is larger than
+                `MAX_ROBOTS_SIZE`.
+            requests.Timeout: If the deadline passes.
+            Exception: Can raise a variety of exceptions from requests.
+        """
+        request_kwargs = {**(request_kwargs or {}), 'stream': True}
+        if deadline is not None:
+            request_kwargs['timeout'] = deadline.cap_timeout(request_kwargs.get('timeout'))
+        ttl_policy = ttl_policy or Robots.DEFAULT_TTL_POLICY
+        with contextlib.ExitStack() as stack:
+            if session_pool is not None:
+                get = stack.enter_context(session_pool.session()).get
+            elif deadline is not None:
+                # Its connections can be cut off at the deadline.
+                get = stack.enter_context(contextlib.closing(sessions.new_session())).get
+            else:
+                get = requests.get
+            handle = stack.enter_context(deadlines.watchdog.watching(deadline))
+            try:
+                res = stack.enter_context(
+                    contextlib.closing(get(robots_url, **request_kwargs)))
+                if handle is not None:
+                    deadlines.watchdog.attach(handle, res)
+                content = bytearray()
+                # Consuming the body fully lets the connection be reused.
+                for chunk in res.iter_content(chunk_size=65536):
+                    content += chunk
+                    if len(content) > MAX_ROBOTS_SIZE:
+                        raise reppy.exceptions.ContentTooLong(
+                            f"Content larger than {MAX_ROBOTS_SIZE} bytes")
+                    if deadline is not None and deadline.expired():
+                        raise requests.Timeout(
+                            f"Fetching {robots_url} exceeded the page deadline")
+            except requests.RequestException as err:
+                # The watchdog shut the connection down at the deadline.
+                if deadline is None or not deadline.expired() or isinstance(
+                        err, requests.Timeout):
+                    raise
+                raise requests.Timeout(
+                    f"Fetching {robots_url} exceeded the page deadline") from err
+            return res.status_code, bytes(content), ttl_policy.expires(res)
+
+    @classmethod
+    def parse_robots(cls, robots_url, status_code, content, expires):
+        """Builds the robots object for a downloaded robots.txt file.
+
+        Follows the reppy rules: a 200 is parsed, a 401 or 403 disallows
+        everything and any other 4xx allows everything.
+
+        Args:
+            robots_url (str): The robots url.
+            status_code (int): The response status code.
+            content (bytes): The response body.
+            expires (float): The expiration time.
+
+        Returns:
+            reppy.Robots: The robots object.
+
+        Raises:
+            reppy.exceptions.BadStatusCode: If the server returned a 5xx.
+        """
+        if status_code == 200:
+            return Robots.parse(robots_url, content, expires)
+        if status_code in (401, 403):
+            return AllowNone(robots_url, expires)
+        if 400 <= status_code < 500:
+            return AllowAll(robots_url, expires)
+        raise reppy.exceptions.BadStatusCode(
+            f"Got {status_code} for {robots_url}", status_code)
+
+    @classmethod
+    def fetch_robots(
+            cls, robots_url, request_kwargs=None, session_pool=None, ttl_policy=None):
         """Fetches the robots URL.
 
         Args:
             robots_url (str): The robots url to fetch.
-            requests_kwargs (dict, optional): The keyword arguments to pass into
+            request_kwargs (dict, optional): The keyword arguments to pass into
                 the requests.get call to the robots.txt url. Default `None`
+            session_pool (:obj:sessions.SessionPool, optional): A pool of
+                keep-alive sessions. If `None`, requests.get is used.
+            ttl_policy (`obj`, optional): The reppy ttl policy.
+                If `None` default is reppy.Robots.DEFAULT_TTL_POLICY.
         Returns:
             reppy.Robots: the reppy object from feting the robots.txt file.
+
+        Raises:
+            reppy.exceptions.ContentTooLong: If the file is larger than
+                `MAX_ROBOTS_SIZE`.
+            reppy.exceptions.BadStatusCode: If the server returned a 5xx.
+            Exception: Can raise a variety of exceptions from requests.
         """
-        if not request_kwargs:
-            request_kwargs = {}
-        robots = Robots.fetch(robots_url, **request_kwargs)
-        return robots
+        status_code, content, expires = cls.download_robots(
+            robots_url, request_kwargs, session_pool, ttl_policy)
+        return cls.parse_robots(robots_url, status_code, content, expires)
 
     @classmethod
     def crawl_delay(cls, url, user_agent, request_kwargs=None):
         """Determines the robots crawl delay for a given user agent.
 
+        The robots.txt file is cached between calls.
+
         Args:
             url (str): The url to get a crawl delay for.
             user_agent: The user agent to get the crawl delay for.
@@ -92,22 +541,23 @@ class ReppyUtils:
             >>> ReppyUtils.crawl_delay('http://python.org/test', 'python-requests')
             2
         """
-        if not request_kwargs:
-            request_kwargs = {}
-        robots_url = cls.get_robots_url(url)
-        robots = cls.fetch_robots(robots_url, **request_kwargs)
+        robots = cls.get_cache().get(url, request_kwargs or {})
         return robots.agent(user_agent).delay
 
     @classmethod
-    def allowed(cls, url, user_agent="python-requests", request_kwargs=None):
+    def allowed(cls, url, user_agent="python-requests", request_kwargs=None, deadline=None):
         """Determines if a URL is crawlable for a given user agent.
 
+        The robots.txt file is cached between calls.
+
         Args:
             url (str): The url to check for crawlability.
             user_agent (str, optional): The user agent to check for in robots.txt.
                 Default 'python-requests'.
             requests_kwargs (dict, optional): The keyword arguments to pass into
                 the requests.get call to the robots.txt url. Default `None`
+            deadline (deadline.Deadline, optional): The time to get the
+                robots.txt file by.
 
         Returns:
             bool: True if the page is allowed to be crawled.
@@ -117,8 +567,5 @@ class ReppyUtils:
             True
 
         """
-        if not request_kwargs:
-            request_kwargs = {}
-        robots_url = cls.get_robots_url(url)
-        robots = cls.fetch_robots(robots_url, **request_kwargs)
+        robots = cls.get_cache().get(url, request_kwargs or {}, deadline)
         return robots.allowed(url, user_agent)
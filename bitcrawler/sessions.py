@@ -0,0 +1,151 @@
+"""Provides a pool of keep-alive HTTP sessions.
+
+Reusing a `requests.Session` keeps TCP connections (and TLS sessions)
+open between requests to the same host.
+
+"""
+import contextlib
+import queue
+import threading
+
+import requests
+
+from . import deadline
+from . import dns
+
+
+def new_session(pool_connections=10, pool_maxsize=10, dns_cache=None, metrics=None):
+    """Creates a session whose connections can be cut off at a page deadline.
+
+    Args:
+        pool_connections (int, optional): The number of hosts to keep
+            connections open for. Default 10.
+        pool_maxsize (int, optional): The number of connections to keep open
+            per host. Default 10.
+        dns_cache (dns.DnsCache, optional): The DNS cache to resolve hosts
+            with. Default None.
+        metrics (metrics.Metrics, optional): Records the DNS lookups.
+
+    Returns:
+        requests.Session: A new session.
+
+    """
+    session = requests.Session()
+    adapter_kwargs = {'pool_connections': pool_connections, 'pool_maxsize': pool_maxsize}
+    if dns_cache is not None:
+        adapter = dns.DnsCachingAdapter(dns_cache, metrics, **adapter_kwargs)
+    else:
+        adapter = deadline.WatchedAdapter(**adapter_kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class SessionPool:
+    """A thread-safe pool of `requests.Session` objects.
+
+    A session is checked out by one thread at a time, because
+    `requests.Session` is not safe to share between threads. Sessions are
+    created lazily up to `size` and are reused most-recently-returned first,
+    so the sessions holding warm connections are preferred.
+
+    Attributes:
+        size (int): The max number of sessions in the pool.
+        pool_connections (int): The number of hosts each session keeps
+            connections open for.
+        pool_maxsize (int): The number of connections each session keeps
+            open per host.
+        dns_cache (dns.DnsCache): The DNS cache the sessions resolve hosts
+            with. `None` to use the system resolver directly.
+        metrics (metrics.Metrics): Records the DNS lookups of the sessions.
+
+    """
+    def __init__(
+            self, size=10, pool_connections=100, pool_maxsize=10, dns_cache=None,
+            metrics=None):
+        """Initializes SessionPool.
+
+        Args:
+            size (int, optional): The max number of sessions. Default 10.
+            pool_connections (int, optional): The number of hosts each session
+                keeps connections open for. Default 100.
+            pool_maxsize (int, optional): The number of connections each
+                session keeps open per host. Default 10.
+            dns_cache (dns.DnsCache, optional): The DNS cache shared by the
+                sessions. Default None.
+            metrics (metrics.Metrics, optional): Records the DNS lookups.
+                Default the cache's `metrics`.
+
+        """
+        self.size = max(1, size)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.dns_cache = dns_cache
+        self.metrics = metrics
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _new_session(self):
+        """Creates a session with connection pools sized for the crawl.
+
+        Returns:
+            requests.Session: A new session.
+
+        """
+        return new_session(
+            self.pool_connections, self.pool_maxsize, self.dns_cache, self.metrics)
+
+    def acquire(self):
+        """Checks a session out of the pool.
+
+        Blocks until a session is free if the pool is at `size`.
+
+        Returns:
+            requests.Session: A session for the exclusive use of the caller.
+
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._sessions) < self.size:
+                session = self._new_session()
+                self._sessions.append(session)
+                return session
+        return self._idle.get()
+
+    def release(self, session):
+        """Returns a session to the pool.
+
+        Args:
+            session (requests.Session): A session from `acquire`.
+
+        """
+        self._idle.put(session)
+
+    @contextlib.contextmanager
+    def session(self):
+        """Checks out a session for the duration of a with block.
+
+        Examples:
+            >>> pool = SessionPool()
+            >>> with pool.session() as session:
+            >>>     session.get("http://python.org")
+
+        """
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def close(self):
+        """Closes every session and the connections they hold."""
+        with self._lock:
+            for session in self._sessions:
+                session.close()
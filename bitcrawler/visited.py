@@ -0,0 +1,173 @@
+"""Provides sets for tracking the URLs a crawl has already scheduled.
+
+URLs are stored as fixed-width hash fingerprints rather than full strings.
+`VisitedSet` is exact up to fingerprint collisions. `BloomVisitedSet`
+bounds memory for very large crawls at the cost of a configurable
+false-positive rate.
+
+"""
+import hashlib
+import math
+import sys
+
+
+class VisitedSet:
+    """An exact set of URL fingerprints.
+
+    Each URL is reduced to a 64 bit blake2b fingerprint. With 64 bits the
+    chance of any collision across 100 million URLs is below 1 in 3000.
+
+    """
+    # Bytes used by one 64 bit fingerprint int.
+    _FINGERPRINT_SIZE = sys.getsizeof(2 ** 63)
+
+    def __init__(self):
+        """Initializes VisitedSet."""
+        self._fingerprints = set()
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def __contains__(self, url):
+        return self.fingerprint(url) in self._fingerprints
+
+    @classmethod
+    def fingerprint(cls, url):
+        """Hashes a URL to a 64 bit fingerprint.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            int: The URL fingerprint.
+
+        """
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, url):
+        """Adds a URL to the set.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            bool: True if the URL was not already in the set. Otherwise False.
+
+        Examples:
+            >>> visited = VisitedSet()
+            >>> visited.add("http://python.org")
+            True
+
+            >>> visited.add("http://python.org")
+            False
+
+        """
+        fingerprint = self.fingerprint(url)
+        if fingerprint in self._fingerprints:
+            return False
+        self._fingerprints.add(fingerprint)
+        return True
+
+    def memory_usage(self):
+        """Estimates the memory held by the set.
+
+        Returns:
+            int: The approximate size of the set in bytes.
+
+        """
+        return (
+            sys.getsizeof(self._fingerprints) +
+            len(self._fingerprints) * self._FINGERPRINT_SIZE)
+
+    @property
+    def bytes_per_url(self):
+        """float: The approximate memory used per stored URL."""
+        if not len(self):
+            return 0.0
+        return self.memory_usage() / len(self)
+
+
+class BloomVisitedSet(VisitedSet):
+    """A Bloom filter of URLs with bounded memory.
+
+    Memory is fixed at initialization from `capacity` and `error_rate`.
+    A URL that was never added is reported as present with a probability
+    of about `error_rate` while the set holds at most `capacity` URLs.
+    In a crawl that means a small fraction of new URLs are skipped.
+
+    """
+    def __init__(self, capacity=10_000_000, error_rate=0.001):
+        """Initializes BloomVisitedSet.
+
+        Args:
+            capacity (int, optional): The number of URLs the filter is sized for.
+                Default 10,000,000.
+            error_rate (float, optional): The false-positive rate at capacity.
+                Default 0.001.
+
+        Raises:
+            ValueError: If `capacity` is not positive or `error_rate` is
+                not between 0 and 1.
+
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be greater than 0.")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1.")
+        super().__init__()
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, url):
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(url))
+
+    def _positions(self, url):
+        """Generates the bit positions for a URL using double hashing."""
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        hash1 = int.from_bytes(digest[:8], "big")
+        hash2 = int.from_bytes(digest[8:], "big") | 1
+        for index in range(self.num_hashes):
+            yield (hash1 + index * hash2) % self.num_bits
+
+    def add(self, url):
+        """Adds a URL to the filter.
+
+        Args:
+            url (str): A URL.
+
+        Returns:
+            bool: True if the URL was not already in the filter. Otherwise
+                False. False may be a false positive.
+
+        """
+        bits = self._bits
+        is_new = False
+        for position in self._positions(url):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                is_new = True
+        if is_new:
+            self._count += 1
+        return is_new
+
+    def memory_usage(self):
+        """Gets the memory held by the filter.
+
+        Returns:
+            int: The size of the bit array in bytes.
+
+        """
+        return sys.getsizeof(self._bits)
@@ -1,15 +1,20 @@
 """This module provides functionality for fetching a webpage and stores
 relevant ojects from page retrieval.
 """
+import contextlib
 import urllib.parse
 import logging
+import time
+import zlib
 import requests
 
 import validators
 
+from . import deadline as deadlines
 from . import parsing
 from . import robots
 from . import link_utils
+from . import sessions
 
 log = logging.getLogger('bitcrawler')
 
@@ -23,11 +28,30 @@ class Webpage:
         response (`obj` requests.Response): The requests library Response
             object from fetching the page.
         links (list(str)): A list of the links found on the page.
+        canonical_url (str): The URL declared by the page's
+            `<link rel="canonical">` tag, if requested and present.
         allowed_by_robots (bool): If true, the page is crawlable by robots.txt.
         message (str): Message detailing any issues fetching the page.
         error (`obj` Exception): Any error that was raised during page retrieval.
 
     """
+    # Bytes read per chunk when streaming a response body.
+    CHUNK_SIZE = 65536
+    # Unwanted bodies up to this size are read so the connection can be reused.
+    DRAIN_LIMIT = 65536
+    _SIGNATURES = (
+        (b"%PDF-", "application/pdf"),
+        (b"PK\x03\x04", "application/zip"),
+        (b"\x1f\x8b", "application/gzip"),
+        (b"\x89PNG", "image/png"),
+        (b"GIF8", "image/gif"),
+        (b"\xff\xd8\xff", "image/jpeg"),
+        (b"\x1aE\xdf\xa3", "video/webm"),
+        (b"OggS", "application/ogg"),
+        (b"ID3", "audio/mpeg"),
+    )
+    _HTML_SIGNATURES = (b"<!doctype html", b"<html", b"<head", b"<body")
+
     def __init__(self):
         """ Initializes Webpage.
 
@@ -37,16 +61,20 @@ class Webpage:
         self.url = None
         self.response = None
         self.links = None
+        self.canonical_url = None
         self.allowed_by_robots = None
         self.message = None
         self.error = None
 
     @classmethod
-    def fetch(cls, url, **requests_kwargs):
+    def fetch(cls, url, session=None, **requests_kwargs):
         """Fetches the webpage for the URL using the requests library.
 
         Args:
             url (str): The target URL.
+            session (`obj` requests.Session, optional): The session to send the
+                request with. Reuses the session's open connections.
+                If `None`, a one-off request is made with `requests.get`.
             **requests_kwargs (kwargs, optional): Any additional parameters
                 to pass onto the reqeusts library.
 
@@ -60,6 +88,8 @@ class Webpage:
         """
         if not requests_kwargs:
             requests_kwargs = {}
+        if session is not None:
+            return session.get(url, **requests_kwargs)
         return requests.get(url, **requests_kwargs)
 
 
@@ -92,6 +122,148 @@ class Webpage:
         return None, None
 
 
+    @classmethod
+    def sniff_content_type(cls, data):
+        """Guesses a content type from the first bytes of a body.
+
+        Args:
+            data (bytes): The start of the body.
+
+        Returns:
+            str: The guessed content type. `None` if it is not recognized.
+
+        Examples:
+            >>> sniff_content_type(b"%PDF-1.7 ...")
+            "application/pdf"
+
+        """
+        for signature, content_type in cls._SIGNATURES:
+            if data.startswith(signature):
+                return content_type
+        if data[4:8] == b"ftyp":
+            return "video/mp4"
+        start = data[:512].lstrip().lower()
+        if start.startswith(cls._HTML_SIGNATURES) or b"<html" in start:
+            return "text/html"
+        return None
+
+
+    @classmethod
+    def check_headers(cls, headers, allowed_content_types=None, max_body_size=None):
+        """Checks response headers against the download limits.
+
+        Args:
+            headers (dict): The response headers.
+            allowed_content_types (list(str), optional): The content types to
+                download. `None` allows all.
+            max_body_size (int, optional): The max body size in bytes.
+                `None` for no limit.
+
+        Returns:
+            str: The reason the download should be aborted. `None` if it
+                should continue.
+
+        """
+        content_type, _ = cls.parse_mime_type(headers.get('content-type'))
+        if (allowed_content_types and content_type and
+                content_type.strip().lower() not in allowed_content_types):
+            return f"Content type {content_type} is not allowed"
+        content_length = headers.get('content-length', '')
+        if max_body_size and content_length.isdigit() and int(content_length) > max_body_size:
+            return (
+                f"Content length {content_length} exceeds the max body "
+                f"size of {max_body_size} bytes")
+        return None
+
+
+    @classmethod
+    def _discard(cls, response):
+        """Discards an unread body, keeping the connection if it is cheap to."""
+        content_length = response.headers.get('content-length', '')
+        if content_length.isdigit() and int(content_length) <= cls.DRAIN_LIMIT:
+            try:
+                for _ in response.iter_content(cls.CHUNK_SIZE):
+                    pass
+            except Exception:
+                pass
+        response.close()
+        response._content = b""
+        response._content_consumed = True
+
+
+    @classmethod
+    def download(
+            cls,
+            response,
+            allowed_content_types=None,
+            max_body_size=None,
+            max_download_time=None,
+            deadline=None):
+        """Reads the body of a streamed response, aborting if a limit is hit.
+
+        The content type is taken from the headers, or sniffed from the
+        first bytes if the header is missing. An aborted body is left empty.
+
+        Args:
+            response (`obj` requests.Response): A response requested with
+                `stream=True`.
+            allowed_content_types (list(str), optional): The content types to
+                download. `None` allows all.
+            max_body_size (int, optional): The max body size in bytes.
+                `None` for no limit.
+            max_download_time (float, optional): The max seconds to spend
+                reading the body. `None` for no limit.
+            deadline (deadline.Deadline, optional): The deadline of the page.
+                A read that fails once it has passed aborts the download.
+
+        Returns:
+            str: The reason the download was aborted. `None` if the whole
+                body was read.
+
+        """
+        if allowed_content_types:
+            allowed_content_types = [
+                content_type.lower() for content_type in allowed_content_types]
+        reason = cls.check_headers(
+            response.headers, allowed_content_types, max_body_size)
+        if reason:
+            cls._discard(response)
+            return reason
+
+        sniff = bool(allowed_content_types) and not response.headers.get('content-type')
+        start = time.monotonic()
+        body = bytearray()
+        try:
+            for chunk in response.iter_content(cls.CHUNK_SIZE):
+                if sniff:
+                    sniff = False
+                    content_type = cls.sniff_content_type(chunk)
+                    if content_type and content_type not in allowed_content_types:
+                        reason = f"Content type {content_type} is not allowed"
+                body += chunk
+                if max_body_size and len(body) > max_body_size:
+                    reason = f"Body exceeds the max body size of {max_body_size} bytes"
+                elif max_download_time and time.monotonic() - start > max_download_time:
+                    reason = f"Download exceeded the max download time of {max_download_time} sec"
+                elif deadline is not None and deadline.expired():
+                    reason = "Download exceeded the page deadline"
+                if reason:
+                    break
+        except Exception:
+            # The watchdog shut the connection down at the deadline.
+            if deadline is None or not deadline.expired():
+                raise
+            reason = "Download exceeded the page deadline"
+        if reason:
+            response.close()
+            response._content = b""
+            response._content_consumed = True
+            return reason
+        response._content = bytes(body)
+        response._content_consumed = True
+        return None
+
+
     @classmethod
     def _resolve_relative_links(cls, original_url, links):
         """Converts any relative links into full links.
@@ -117,36 +289,53 @@ class Webpage:
             ["http://python.org/about", "http://python.org/test", "http://pandas.com"]
 
         """
-        links = list(set(
+        links = list(dict.fromkeys(
             urllib.parse.urljoin(original_url, link)
             if link_utils.LinkUtils.is_relative(link) else link for link in links))
         return links
 
 
     @classmethod
-    def get_html_links(cls, url, html):
+    def get_html_links(cls, url, html, engine="bs4"):
         """Parses links from an html document.
 
         Args:
             url (str): The target URL.
             html (str): the html document.
+            engine (str, optional): The link extraction backend. See
+                parsing.get_link_extractor. Default "bs4".
 
         Returns:
             list: A list containing all valid urls found in the html.
 
         """
-        soup = parsing.HtmlParser(html, "html.parser")
-        discovered_links = soup.get_links()
+        discovered_links = parsing.get_link_extractor(engine).get_links(html)
 
-        # Append base url to relative links
+        # Resolve relative links against the base url and remove invalid links.
         base_url = link_utils.LinkUtils.get_base_url(url)
-        resolved_links = cls._resolve_relative_links(
-            base_url, discovered_links)
+        return link_utils.LinkUtils.resolve_links(base_url, discovered_links)
 
-        # Remove invalid links
-        valid_urls = list(set(
-            url for url in resolved_links if validators.url(url)))
-        return valid_urls
+
+    @classmethod
+    def get_html_canonical_link(cls, url, html, engine="bs4"):
+        """Parses the canonical link from an html document.
+
+        Args:
+            url (str): The target URL.
+            html (str): the html document.
+            engine (str, optional): The link extraction backend. See
+                parsing.get_link_extractor. Default "bs4".
+
+        Returns:
+            str: The absolute canonical URL. `None` if the document does not
+                declare a valid one.
+
+        """
+        canonical_link = parsing.get_link_extractor(engine).get_canonical_link(html)
+        if not canonical_link:
+            return None
+        canonical_url = urllib.parse.urljoin(url, canonical_link.strip())
+        return canonical_url if validators.url(canonical_url) else None
 
 
     @classmethod
@@ -155,7 +344,8 @@ class Webpage:
             url,
             user_agent,
             reppy=None,
-            request_kwargs=None):
+            request_kwargs=None,
+            deadline=None):
         """Determine if a page is crawlable by robots.txt.
 
         Leverages the Reppy library for retrieval and parsing of robots.txt.
@@ -166,6 +356,8 @@ i
             reppy (:obj:robots.RobotParser, optional): A robots parsing object.
             request_kwargs (dict, optional): requests.get kwargs for fetching the
                 robots.txt file.
+            deadline (:obj:deadline.Deadline, optional): The time to get the
+                robots.txt file by.
 
         Returns:
             bool: True if the page is allowed by robots.txt. Otherwise False.
@@ -175,9 +367,11 @@ i
 	    ### TODO See what errors can bubble up from this reppy api
 
         try:
-            if not reppy:
+            if reppy is None:
                 reppy = robots.ReppyUtils
-                allowed = reppy.allowed(url, user_agent, **request_kwargs)
+                allowed = reppy.allowed(url, user_agent, request_kwargs, deadline)
+            elif deadline is not None:
+                allowed = reppy.allowed(url, user_agent, deadline=deadline)
             else:
                 allowed = reppy.allowed(url, user_agent)
         except Exception as err:
@@ -186,12 +380,16 @@ i
         return allowed
 
 
-    def get_page_links(self):
+    def get_page_links(self, engine="bs4"):
         """Extracts links from a page.
 
         Only supports documents with a content type of 'text/html'.
         TODO: Add further support for other doc types.
 
+        Args:
+            engine (str, optional): The link extraction backend. See
+                parsing.get_link_extractor. Default "bs4".
+
         Returns:
             list(str): A list of links from the page.
 
@@ -204,7 +402,8 @@ i
                         self.response.headers.get('content-type')))
 
                 if content_type == 'text/html':
-                    self.links = self.get_html_links(self.url, self.response.text)
+                    self.links = self.get_html_links(
+                        self.url, self.response.text, engine)
 
                 # Other doc types.
         if not self.links:
@@ -212,6 +411,156 @@ i
         return self.links
 
 
+    def get_canonical_link(self, engine="bs4"):
+        """Extracts the canonical link from a page.
+
+        Only supports documents with a content type of 'text/html'.
+
+        Args:
+            engine (str, optional): The link extraction backend. See
+                parsing.get_link_extractor. Default "bs4".
+
+        Returns:
+            str: The canonical URL declared by the page. `None` if there is none.
+
+        """
+        if self.response and self.response.ok:
+            content_type, _ = (
+                self.parse_mime_type(
+                    self.response.headers.get('content-type')))
+            if content_type == 'text/html':
+                self.canonical_url = self.get_html_canonical_link(
+                    self.url, self.response.text, engine)
+        return self.canonical_url
+
+
+
+class PageRecord:
+    """A compact record of a crawled webpage.
+
+    Holds the results of fetching a page without the `requests.Response`
+    object, its connection or its redirect history. Depending on the
+    retention policy the body is dropped, kept compressed or kept in full.
+
+    Attributes:
+        url (str): The URL of the webpage.
+        status_code (int): The HTTP status code. `None` if the page was not fetched.
+        headers (dict): The retained response headers, with lowercase names.
+        links (list(str)): A list of the links found on the page.
+        canonical_url (str): The URL declared by the page's
+            `<link rel="canonical">` tag, if requested and present.
+        allowed_by_robots (bool): If true, the page is crawlable by robots.txt.
+        message (str): Message detailing any issues fetching the page.
+        error (`obj` Exception): Any error that was raised during page retrieval.
+        elapsed (float): Seconds between sending the request and receiving
+            the response headers.
+        encoding (str): The encoding of the body.
+        retention (str): The body retention policy the record was built with.
+
+    """
+    RETAIN_FULL = "full"
+    RETAIN_COMPRESSED = "compressed"
+    RETAIN_NONE = "none"
+    RETENTION_POLICIES = (RETAIN_FULL, RETAIN_COMPRESSED, RETAIN_NONE)
+    DEFAULT_HEADERS = (
+        "content-type", "content-length", "etag", "last-modified", "retry-after")
+
+    __slots__ = (
+        "url", "status_code", "headers", "links", "canonical_url",
+        "allowed_by_robots", "message", "error", "elapsed", "encoding",
+        "retention", "_body")
+
+    def __init__(self):
+        """Initializes PageRecord."""
+        self.url = None
+        self.status_code = None
+        self.headers = {}
+        self.links = None
+        self.canonical_url = None
+        self.allowed_by_robots = None
+        self.message = None
+        self.error = None
+        self.elapsed = None
+        self.encoding = None
+        self.retention = self.RETAIN_NONE
+        self._body = None
+
+    @classmethod
+    def from_webpage(cls, page, retention=RETAIN_NONE, headers=DEFAULT_HEADERS):
+        """Builds a record from a webpage whose links have been extracted.
+
+        Args:
+            page (Webpage): The webpage.
+            retention (str, optional): "full" keeps the body, "compressed" keeps
+                it zlib compressed and "none" drops it. Default "none".
+            headers (list(str), optional): The response headers to keep.
+                Default `PageRecord.DEFAULT_HEADERS`.
+
+        Returns:
+            PageRecord: The record.
+
+        Raises:
+            ValueError: If `retention` is not a known policy.
+
+        """
+        if retention not in cls.RETENTION_POLICIES:
+            raise ValueError(
+                f"retention must be one of {cls.RETENTION_POLICIES}, not {retention!r}")
+        record = cls()
+        record.url = page.url
+        record.links = page.links
+        record.canonical_url = page.canonical_url
+        record.allowed_by_robots = page.allowed_by_robots
+        record.message = page.message
+        record.error = page.error
+        record.retention = retention
+
+        response = page.response
+        if response is not None:
+            record.status_code = response.status_code
+            record.headers = {
+                name: response.headers[name]
+                for name in headers if name in response.headers}
+            if response.elapsed is not None:
+                record.elapsed = response.elapsed.total_seconds()
+            record.encoding = response.encoding
+            if retention == cls.RETAIN_FULL:
+                record._body = response.content
+            elif retention == cls.RETAIN_COMPRESSED:
+                record._body = zlib.compress(response.content)
+        return record
+
+    @property
+    def response(self):
+        """None: Records never hold a response. Present for compatibility
+        with Webpage."""
+        return None
+
+    @property
+    def ok(self):
+        """bool: True if the status code is less than 400."""
+        return self.status_code is not None and self.status_code < 400
+
+    @property
+    def body(self):
+        """bytes: The response body. `None` if it was not retained."""
+        if self._body is None:
+            return None
+        if self.retention == self.RETAIN_COMPRESSED:
+            return zlib.decompress(self._body)
+        return self._body
+
+    @property
+    def text(self):
+        """str: The decoded response body. `None` if it was not retained."""
+        body = self.body
+        if body is None:
+            return None
+        try:
+            return body.decode(self.encoding or "utf-8", errors="replace")
+        except LookupError:
+            return body.decode("utf-8", errors="replace")
+
 
 class WebpageBuilder:
     """Builds a Webpage object by intilizing the class and calling
@@ -224,7 +573,13 @@ class WebpageBuilder:
             user_agent,
             request_kwargs=None,
             respect_robots=True,
-            reppy=None):
+            reppy=None,
+            session_pool=None,
+            allowed_content_types=None,
+            max_body_size=None,
+            max_download_time=None,
+            metrics=None,
+            deadline=None):
         """Builds a Webpage by fetching the provided URL.
 
         Args:
@@ -233,13 +588,103 @@ class WebpageBuilder:
             request_kwargs (dict, optional): The page retrieval request kwargs.
             respect_robots (bool): If true, robots.txt will be honored.
             reppy (:obj:robots.RobotParser, optional): A robots parsing object.
+            session_pool (:obj:sessions.SessionPool, optional): A pool of
+                keep-alive sessions to fetch the page with.
+            allowed_content_types (list(str), optional): The content types to
+                download. Other bodies are not downloaded. `None` allows all.
+            max_body_size (int, optional): The max body size in bytes. Larger
+                bodies are not downloaded. `None` for no limit.
+            max_download_time (float, optional): The max seconds to spend reading
+                the body. `None` for no limit.
+            metrics (:obj:metrics.Metrics, optional): Records the robots.txt,
+                time to first byte and download latencies and the bytes read.
+            deadline (:obj:deadline.Deadline, optional): The time the whole
+                fetch must finish by. Request timeouts are capped at the time
+                left and a body still downloading at the deadline is cut off.
         Returns:
             this: The instance of the Webpage class.
 
         """
-        page = cls._get_page(url, user_agent, request_kwargs, respect_robots, reppy)
+        page = cls._get_page(
+            url, user_agent, request_kwargs, respect_robots, reppy, session_pool,
+            allowed_content_types, max_body_size, max_download_time, metrics,
+            deadline)
         return page
 
+    @classmethod
+    def _fetch_response(
+            cls,
+            webpage,
+            session,
+            request_kwargs,
+            allowed_content_types=None,
+            max_body_size=None,
+            max_download_time=None,
+            metrics=None,
+            deadline=None):
+        """Fetches the response for a webpage, streaming the body.
+
+        Sets `webpage.response`, and `webpage.message` if the download
+        was aborted.
+
+        Args:
+            webpage (Webpage): The webpage to fetch.
+            session (`obj` requests.Session): The session to use. May be `None`.
+            request_kwargs (dict): The page retrieval request kwargs.
+            allowed_content_types (list(str), optional): The content types to
+                download. `None` allows all.
+            max_body_size (int, optional): The max body size in bytes.
+            max_download_time (float, optional): The max seconds to spend
+                reading the body.
+            metrics (:obj:metrics.Metrics, optional): Records the time to
+                first byte and download latencies and the bytes read.
+            deadline (:obj:deadline.Deadline, optional): The time the fetch
+                must finish by. The connection is shut down if the request is
+                still connecting, waiting for the headers or downloading
+                the body then.
+
+        Raises:
+            requests.Timeout: If the deadline passes before the headers arrive.
+
+        """
+        request_kwargs = {**request_kwargs, 'stream': True}
+        with contextlib.ExitStack() as stack:
+            if session is None and deadline is not None:
+                # Its connections can be cut off at the deadline.
+                session = stack.enter_context(contextlib.closing(sessions.new_session()))
+            handle = stack.enter_context(deadlines.watchdog.watching(deadline))
+            try:
+                if session is not None:
+                    response = webpage.fetch(webpage.url, session=session, **request_kwargs)
+                else:
+                    response = webpage.fetch(webpage.url, **request_kwargs)
+            except requests.RequestException as err:
+                if deadline is None or not deadline.expired():
+                    raise
+                raise requests.Timeout(
+                    f"Fetching {webpage.url} exceeded the page deadline") from err
+            if deadline is not None and deadline.expired():
+                # Shutting the connection down mid-headers ends them early.
+                response.close()
+                raise requests.Timeout(f"Fetching {webpage.url} exceeded the page deadline")
+            webpage.response = response
+            start = time.perf_counter()
+            if handle is not None:
+                deadlines.watchdog.attach(handle, response)
+            reason = webpage.download(
+                response, allowed_content_types, max_body_size, max_download_time,
+                deadline)
+        if metrics is not None:
+            # requests measures from sending the request until the headers
+            # are parsed, which includes connecting.
+            metrics.observe("ttfb", response.elapsed.total_seconds())
+            metrics.observe("download", time.perf_counter() - start)
+            if isinstance(response._content, bytes):
+                metrics.inc("bytes_total", len(response._content))
+        if reason:
+            webpage.message = f"Aborted fetching {webpage.url}: {reason}"
+            log.info(webpage.message)
+
     @classmethod
     def _get_page(
             cls,
@@ -247,9 +692,18 @@ class WebpageBuilder:
             user_agent,
             request_kwargs=None,
             respect_robots=True,
-            reppy=None):
+            reppy=None,
+            session_pool=None,
+            allowed_content_types=None,
+            max_body_size=None,
+            max_download_time=None,
+            metrics=None,
+            deadline=None):
         """Fetches a webpage for the provided URL.
 
+        The body is streamed, so it can be abandoned as soon as a download
+        limit is hit. The reason is stored in `Webpage.message`.
+
         Args:
             url (str): The url for the webpage.
             user_agent (str): The user_agent to use during requests.
@@ -257,6 +711,18 @@ class WebpageBuilder:
             request_kwargs (dict, optional): The page retrieval request kwargs.
             respect_robots (bool): If true, robots.txt will be honored.
             reppy (:obj:robots.RobotParser, optional): A robots parsing object.
+            session_pool (:obj:sessions.SessionPool, optional): A pool of
+                keep-alive sessions to fetch the page with.
+            allowed_content_types (list(str), optional): The content types to
+                download. Other bodies are not downloaded. `None` allows all.
+            max_body_size (int, optional): The max body size in bytes. Larger
+                bodies are not downloaded. `None` for no limit.
+            max_download_time (float, optional): The max seconds to spend reading
+                the body. `None` for no limit.
+            metrics (:obj:metrics.Metrics, optional): Records the robots.txt,
+                time to first byte and download latencies and the bytes read.
+            deadline (:obj:deadline.Deadline, optional): The time the whole
+                fetch must finish by.
         Returns:
             Webpage: The instance of the Webpage class.
 
@@ -273,24 +739,83 @@ class WebpageBuilder:
             request_kwargs['headers'] = {**request_kwargs['headers'], **user_agent_header}
         else:
             request_kwargs['headers'] = user_agent_header
+        if deadline is not None:
+            request_kwargs = {
+                **request_kwargs,
+                'timeout': deadline.cap_timeout(request_kwargs.get('timeout'))}
 
         if respect_robots:
+            start = time.perf_counter()
             webpage.allowed_by_robots = webpage.is_allowed_by_robots(
-                webpage.url, user_agent, reppy=reppy, request_kwargs=request_kwargs)
+                webpage.url, user_agent, reppy=reppy, request_kwargs=request_kwargs,
+                deadline=deadline)
+            if metrics is not None:
+                metrics.observe("robots", time.perf_counter() - start)
 
         # Only False should prevent crawling (None should allow.)
         if webpage.allowed_by_robots is False:
             webpage.message = f"URL {webpage.url} is restricted by robots.txt"
+        elif deadline is not None and deadline.expired():
+            webpage.error = requests.Timeout(
+                f"Checking robots.txt for {webpage.url} exceeded the page deadline")
+            webpage.message = (
+                "An error occurred while attempting to fetch "
+                f"{webpage.url}: {webpage.error}")
+            log.info(webpage.message)
         else:
+            limits = (
+                allowed_content_types, max_body_size, max_download_time, metrics, deadline)
             try:
-                webpage.response = webpage.fetch(webpage.url, **request_kwargs)
+                if session_pool is not None:
+                    with session_pool.session() as session:
+                        cls._fetch_response(webpage, session, request_kwargs, *limits)
+                else:
+                    cls._fetch_response(webpage, None, request_kwargs, *limits)
             except Exception as err:
                 webpage.message = (
                     "An error occurred while attempting to fetch "
                     f"{webpage.url}: {err}")
                 logging.error(webpage.message)
                 webpage.error = err
-            if webpage.response and not webpage.response.ok:
-                webpage.message = f"URL %s returned a {webpage.response.status_code} status code."
+            if (webpage.response is not None and not webpage.response.ok
+                    and not webpage.message):
+                webpage.message = (
+                    f"URL {webpage.url} returned a "
+                    f"{webpage.response.status_code} status code.")
 
         return webpage
+
+
+def extract_links(url, content, headers, encoding=None, engine="bs4", canonical=False):
+    """Extracts the links of a page from its raw body and headers.
+
+    A module level function so it can run in a process pool. Only the body
+    and headers are sent to the worker process and only the links come back.
+
+    Args:
+        url (str): The page URL.
+        content (bytes): The response body.
+        headers (dict): The response headers.
+        encoding (str, optional): The response encoding. Detected from the
+            body if `None`.
+        engine (str, optional): The link extraction backend. See
+            parsing.get_link_extractor. Default "bs4".
+        canonical (bool, optional): Also extract the canonical link.
+            Default False.
+
+    Returns:
+        tuple:
+            list(str): The links on the page.
+            str: The canonical URL. `None` if not requested or not declared.
+
+    """
+    page = Webpage()
+    page.url = url
+    page.response = requests.Response()
+    page.response.status_code = 200
+    page.response.headers = requests.structures.CaseInsensitiveDict(headers)
+    page.response.encoding = encoding
+    page.response._content = content
+    links = page.get_page_links(engine)
+    canonical_url = page.get_canonical_link(engine) if canonical else None
+    return links, canonical_url
@@ -13,6 +13,7 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/austynherman112994/bitcrawler",
     packages=setuptools.find_packages(),
+    package_data={'bitcrawler': ['data/*.dat']},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: Apache Software License",
@@ -24,5 +25,11 @@ setuptools.setup(
         'beautifulsoup4',
         'validators'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'http2': ['httpx[http2]'],
+        'lxml': ['lxml'],
+        'selectolax': ['selectolax'],
+    },
     python_requires='>=3.6',
 )
@@ -0,0 +1,96 @@
+import asyncio
+import http.server
+import threading
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from bitcrawler import crawler
+
+PAGES = {
+    "/": '<a href="/a">A</a><a href="/b">B</a><a href="/private/c">C</a>',
+    "/a": '<a href="/b">B</a><a href="/d">D</a>',
+    "/b": '<a href="/">Home</a>',
+    "/d": '',
+    "/private/c": '',
+}
+ROBOTS = "User-agent: *\nDisallow: /private\n"
+
+
+class SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path == "/robots.txt":
+            status, content_type, body = 200, "text/plain", ROBOTS
+        elif self.path in PAGES:
+            status, content_type, body = 200, "text/html", PAGES[self.path]
+        else:
+            status, content_type, body = 404, "text/html", ""
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    SiteHandler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_acrawl(site):
+    crawl = crawler.Crawler()
+    pages = asyncio.run(crawl.acrawl(site))
+    by_url = {page.url: page for page in pages}
+    # Disallowed links are dropped before they are scheduled.
+    assert sorted(by_url) == sorted(
+        site + path for path in PAGES if not path.startswith("/private"))
+    assert by_url[site + "/a"].response.status_code == 200
+    assert "/private/c" not in SiteHandler.requests
+    assert crawl.robots_disallowed == 1
+    assert SiteHandler.requests.count("/robots.txt") == 1
+    counters = crawl.metrics.snapshot()["counters"]
+    assert counters["pages_total"] == len(pages)
+    assert counters["robots_denied_total"] == 1
+    assert counters["bytes_total"] > 0
+
+
+def test_acrawl__depth(site):
+    pages = asyncio.run(crawler.Crawler(
+        respect_robots=False, crawl_depth=2).acrawl(site))
+    assert sorted(page.url for page in pages) == sorted(
+        site + path for path in ["/", "/a", "/b", "/private/c"])
+
+
+def test_aiter_crawl(site):
+    async def collect():
+        return [page.url async for page in crawler.Crawler(
+            respect_robots=False).aiter_crawl(site)]
+    assert sorted(asyncio.run(collect())) == sorted(site + path for path in PAGES)
+
+
+def test_acrawl__max_body_size(site):
+    pages = asyncio.run(crawler.Crawler(
+        respect_robots=False, max_body_size=10).acrawl(site))
+    assert [page.url for page in pages] == [site + "/"]
+    assert "max body size" in pages[0].message
+
+
+def test_acrawl__max_pages(site):
+    crawl = crawler.Crawler(respect_robots=False, max_pages=2)
+    pages = asyncio.run(crawl.acrawl(site))
+    assert len(pages) == 2
+    assert crawl.budget_exhausted == "max_pages"
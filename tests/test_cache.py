@@ -0,0 +1,114 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+from bitcrawler import cache
+from bitcrawler import crawler
+from bitcrawler import webpage
+
+PAGES = {
+    "/": '<a href="/a">A</a><a href="/b">B</a>',
+    "/a": '<a href="/b">B</a>',
+    "/b": '',
+}
+
+
+class SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+    cache_control = "no-cache"
+
+    def do_GET(self):
+        etag = f'"{hash(PAGES.get(self.path))}"'
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path not in PAGES:
+            status, body = 404, b""
+        elif self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        else:
+            status, body = 200, PAGES[self.path].encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", self.cache_control)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    SiteHandler.requests = []
+    SiteHandler.cache_control = "no-cache"
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def crawl(site, path):
+    return sorted(
+        (page.url, page.response.status_code, sorted(page.links))
+        for page in crawler.Crawler(
+            respect_robots=False, http_cache=path).crawl(site))
+
+
+def test_parse_cache_control():
+    assert cache.HttpCache.parse_cache_control("Public, max-age=600") == {
+        "public": True, "max-age": "600"}
+    assert cache.HttpCache.parse_cache_control(None) == {}
+
+
+def test_get_expires():
+    get_expires = cache.HttpCache.get_expires
+    assert get_expires({"cache-control": "max-age=60"}, now=100) == 160
+    assert get_expires({"cache-control": "no-cache, max-age=60"}, now=100) == 100
+    assert get_expires({"cache-control": "no-store"}, now=100) is None
+    assert get_expires({"expires": "Thu, 01 Jan 1970 00:01:40 GMT"}, now=0) == 100
+    assert get_expires({}, now=100) == 100
+
+
+def test_store__skips_errors(tmp_path):
+    http_cache = cache.HttpCache(str(tmp_path / "cache.db"))
+    page = webpage.Webpage()
+    page.url = "http://python.org"
+    page.response = requests.Response()
+    page.response.status_code = 500
+    assert http_cache.store(page) is False
+    assert len(http_cache) == 0
+
+
+def test_crawl__revalidates(site, tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = crawl(site, path)
+    SiteHandler.requests = []
+    second = crawl(site, path)
+
+    assert second == first
+    assert len(second) == 3
+    # Every page was revalidated and none was downloaded again.
+    assert all(etag is not None for _, etag in SiteHandler.requests)
+    http_cache = cache.HttpCache(path)
+    assert len(http_cache) == 3
+
+
+def test_crawl__fresh(site, tmp_path):
+    SiteHandler.cache_control = "max-age=600"
+    path = str(tmp_path / "cache.db")
+    first = crawl(site, path)
+    SiteHandler.requests = []
+    http_cache = cache.HttpCache(path)
+    pages = crawler.Crawler(respect_robots=False, http_cache=http_cache).crawl(site)
+
+    assert sorted(
+        (page.url, page.response.status_code, sorted(page.links))
+        for page in pages) == first
+    assert SiteHandler.requests == []
+    assert http_cache.stats()["hits"] == 3
@@ -0,0 +1,31 @@
+from bitcrawler import checkpoint
+
+
+def test_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    store = checkpoint.Checkpoint(path)
+    assert store.get_meta() is None
+    store.start({"original_domains": ["python.org"]})
+    store.scheduled("http://python.org/", 0)
+    store.scheduled("http://python.org/a", 1)
+    store.seen("http://python.org/canonical")
+    store.done("http://python.org/")
+    assert store.flush(timeout=5)
+
+    assert store.get_meta() == {"original_domains": ["python.org"]}
+    assert sorted(store.get_urls()) == [
+        ("http://python.org/", 0, checkpoint.Checkpoint.DONE),
+        ("http://python.org/a", 1, checkpoint.Checkpoint.QUEUED),
+        ("http://python.org/canonical", None, checkpoint.Checkpoint.SEEN),
+    ]
+    assert list(store.get_hosts()) == ["python.org"]
+    store.close()
+
+
+def test_checkpoint__close_commits(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    store = checkpoint.Checkpoint(path)
+    store.scheduled("http://python.org/", 0)
+    store.close()
+    assert checkpoint.Checkpoint(path).get_urls() == [
+        ("http://python.org/", 0, checkpoint.Checkpoint.QUEUED)]
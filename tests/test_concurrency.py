@@ -0,0 +1,60 @@
+import email.utils
+
+import pytest
+
+from bitcrawler import concurrency
+
+
+def test_adaptive_concurrency__additive_increase():
+    controller = concurrency.AdaptiveConcurrency(max_limit=4, initial_limit=1)
+    assert controller.limit("python.org") == 1
+    for _ in range(10):
+        controller.observe("python.org", latency=0.1, status_code=200)
+    assert controller.limit("python.org") == 4
+    assert controller.limits() == {"python.org": 4}
+
+def test_adaptive_concurrency__multiplicative_decrease():
+    controller = concurrency.AdaptiveConcurrency(max_limit=8, initial_limit=8)
+    controller.observe("python.org", status_code=503)
+    assert controller.limit("python.org") == 4
+    # Requests sent before the decrease do not decrease it again.
+    controller.observe("python.org", congested=True)
+    assert controller.limit("python.org") == 4
+    for _ in range(3):
+        controller.observe("python.org", congested=True)
+    assert controller.limit("python.org") == 2
+    for _ in range(10):
+        controller.observe("python.org", congested=True)
+    assert controller.limit("python.org") == 1
+
+def test_adaptive_concurrency__latency():
+    controller = concurrency.AdaptiveConcurrency(
+        max_limit=8, initial_limit=8, smoothing=1)
+    controller.observe("python.org", latency=0.1, status_code=200)
+    assert controller.limit("python.org") == 8
+    controller.observe("python.org", latency=0.5, status_code=200)
+    assert controller.limit("python.org") == 4
+
+def test_adaptive_concurrency__hosts_are_independent():
+    controller = concurrency.AdaptiveConcurrency(initial_limit=4)
+    controller.observe("python.org", status_code=429)
+    assert controller.limit("python.org") == 2
+    assert controller.limit("pandas.org") == 4
+
+def test_adaptive_concurrency__retry_after():
+    controller = concurrency.AdaptiveConcurrency(max_retry_after=60)
+    assert controller.observe("python.org", status_code=429, retry_after="30") == 30
+    assert controller.observe("python.org", status_code=503, retry_after="3600") == 60
+    assert controller.observe("python.org", status_code=200, retry_after="30") is None
+    assert controller.observe("python.org", status_code=429, retry_after="soon") is None
+
+def test_parse_retry_after__date():
+    retry_at = email.utils.formatdate(1000 + 120, usegmt=True)
+    assert concurrency.AdaptiveConcurrency.parse_retry_after(retry_at, now=1000) == 120
+    assert concurrency.AdaptiveConcurrency.parse_retry_after(None) is None
+
+def test_adaptive_concurrency__invalid_limits():
+    with pytest.raises(ValueError):
+        concurrency.AdaptiveConcurrency(min_limit=4, max_limit=2)
+    with pytest.raises(ValueError):
+        concurrency.AdaptiveConcurrency(min_limit=0)
@@ -0,0 +1,327 @@
+import time
+
+import pytest
+import requests
+
+from bitcrawler import crawler
+from bitcrawler import frontier
+from bitcrawler import webpage
+
+SITE = {
+    "http://python.org/": ["http://python.org/a", "http://python.org/b"],
+    "http://python.org/a": ["http://python.org/b", "http://python.org/c"],
+    "http://python.org/b": ["http://python.org/a", "http://pandas.org/"],
+    "http://python.org/c": ["http://python.org/d"],
+    "http://python.org/d": [],
+}
+
+
+class FakeWebpage(webpage.Webpage):
+    def get_page_links(self, engine="bs4"):
+        self.links = SITE.get(self.url, [])
+        return self.links
+
+
+class FakeWebpageBuilder(webpage.WebpageBuilder):
+    built = []
+
+    @classmethod
+    def build(cls, url, user_agent, **kwargs):
+        cls.built.append(url)
+        page = FakeWebpage()
+        page.url = url
+        return page
+
+
+def make_crawler(**kwargs):
+    FakeWebpageBuilder.built = []
+    return crawler.Crawler(
+        respect_robots=False,
+        webpage_builder=FakeWebpageBuilder,
+        **kwargs)
+
+def test_crawl():
+    pages = make_crawler(multithreading=True, max_threads=4).crawl("http://python.org")
+    assert sorted(page.url for page in pages) == sorted(SITE)
+
+def test_crawl__depth():
+    pages = make_crawler(crawl_depth=2).crawl("http://python.org")
+    assert sorted(page.url for page in pages) == [
+        "http://python.org/", "http://python.org/a", "http://python.org/b"]
+
+def test_crawl__error_page():
+    class ErrorBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, *args, **kwargs):
+            raise ValueError("boom")
+
+    pages = crawler.Crawler(
+        respect_robots=False, webpage_builder=ErrorBuilder).crawl("http://python.org")
+    assert len(pages) == 1
+    assert isinstance(pages[0].error, ValueError)
+
+def test_crawl__timeout_page():
+    class SlowBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, *args, **kwargs):
+            time.sleep(0.2)
+            return super().build(url, *args, **kwargs)
+
+    pages = crawler.Crawler(
+        respect_robots=False, webpage_builder=SlowBuilder).crawl(
+            "http://python.org", page_timeout=0.05)
+    assert len(pages) == 1
+    assert pages[0].message.startswith("A timeout")
+
+def test_crawl__fetches_each_url_once():
+    make_crawler(multithreading=True).crawl("http://python.org")
+    assert sorted(FakeWebpageBuilder.built) == sorted(SITE)
+
+def test_crawl__bloom_visited_mode():
+    crawl = make_crawler(visited_mode="bloom", bloom_capacity=1000)
+    pages = crawl.crawl("http://python.org")
+    assert sorted(page.url for page in pages) == sorted(SITE)
+    assert len(crawl.visited) == len(SITE)
+
+def test_crawl__canonicalizes_links():
+    class DuplicateLinksWebpage(FakeWebpage):
+        def get_page_links(self, engine="bs4"):
+            self.links = [
+                "http://Python.org:80/a#top",
+                "http://python.org/a?utm_source=test",
+                "http://python.org/./a",
+            ] if self.url == "http://python.org/" else []
+            return self.links
+
+    class DuplicateLinksBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, *args, **kwargs):
+            cls.built.append(url)
+            page = DuplicateLinksWebpage()
+            page.url = url
+            return page
+
+    DuplicateLinksBuilder.built = []
+    crawler.Crawler(
+        respect_robots=False,
+        webpage_builder=DuplicateLinksBuilder).crawl("http://python.org")
+    assert DuplicateLinksBuilder.built == ["http://python.org/", "http://python.org/a"]
+
+def test_crawl__crawl_delay_per_host():
+    class TwoHostWebpage(FakeWebpage):
+        def get_page_links(self, engine="bs4"):
+            self.links = [
+                "http://python.org/1", "http://pandas.org/1", "http://pandas.org/2",
+            ] if self.url == "http://python.org/" else []
+            return self.links
+
+    class TwoHostBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, *args, **kwargs):
+            cls.built.append((url, time.monotonic()))
+            page = TwoHostWebpage()
+            page.url = url
+            return page
+
+    TwoHostBuilder.built = []
+    crawler.Crawler(
+        respect_robots=False, cross_site=True, crawl_delay=0.2,
+        multithreading=True, webpage_builder=TwoHostBuilder).crawl("http://python.org")
+    times = dict(TwoHostBuilder.built)
+    assert len(times) == 4
+    assert times["http://python.org/1"] - times["http://python.org/"] >= 0.19
+    assert abs(times["http://pandas.org/2"] - times["http://pandas.org/1"]) >= 0.19
+    # pandas.org is not held back by the delay on python.org.
+    assert times["http://pandas.org/1"] < times["http://python.org/1"]
+
+def test_iter_crawl():
+    pages = make_crawler().iter_crawl("http://python.org")
+    assert next(pages).url == "http://python.org/"
+    assert sorted(page.url for page in pages) == sorted(SITE)[1:]
+
+def test_iter_crawl__backpressure():
+    pages = make_crawler(multithreading=True, max_threads=2).iter_crawl("http://python.org")
+    next(pages)
+    time.sleep(0.1)
+    # Only the pages in flight when the consumer stopped have been fetched.
+    assert len(FakeWebpageBuilder.built) <= 3
+    pages.close()
+
+def test_crawl__body_retention():
+    pages = make_crawler(body_retention="none").crawl("http://python.org")
+    assert all(isinstance(page, webpage.PageRecord) for page in pages)
+    assert sorted(page.url for page in pages) == sorted(SITE)
+
+def test_crawl__invalid_body_retention():
+    with pytest.raises(ValueError):
+        make_crawler(body_retention="everything")
+
+def test_crawl__resume_from(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    pages = make_crawler().iter_crawl("http://python.org", resume_from=path)
+    first = [next(pages).url, next(pages).url]
+    pages.close()
+
+    resumed = make_crawler().crawl("http://python.org", resume_from=path)
+    assert sorted(first + [page.url for page in resumed]) == sorted(SITE)
+    assert not set(first) & set(FakeWebpageBuilder.built)
+
+def test_crawl__resume_from_finished(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    make_crawler().crawl("http://python.org", resume_from=path)
+    assert make_crawler().crawl("http://python.org", resume_from=path) == []
+
+class HtmlWebpageBuilder(webpage.WebpageBuilder):
+    @classmethod
+    def build(cls, url, user_agent, **kwargs):
+        page = webpage.Webpage()
+        page.url = url
+        page.response = requests.Response()
+        page.response.status_code = 200
+        page.response.headers = requests.structures.CaseInsensitiveDict(
+            {"Content-Type": "text/html; charset=utf-8"})
+        page.response.encoding = "utf-8"
+        page.response._content = "".join(
+            f'<a href="{link}">link</a>' for link in SITE.get(url, [])).encode()
+        return page
+
+def test_crawl__parse_processes():
+    crawl = crawler.Crawler(
+        respect_robots=False, webpage_builder=HtmlWebpageBuilder,
+        multithreading=True, max_threads=4, parse_processes=2)
+    pages = crawl.crawl("http://python.org")
+    assert sorted(page.url for page in pages) == sorted(SITE)
+    # Links come back in page order from every worker process.
+    assert {page.url: page.links for page in pages} == SITE
+    assert crawl._process_pool is None
+
+class RecordingPool:
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, *args):
+        self.submitted += 1
+        raise AssertionError("Sent to the process pool")
+
+def test_extract_links__non_html_skips_process_pool():
+    crawl = crawler.Crawler(respect_robots=False, parse_processes=2)
+    crawl._process_pool = pool = RecordingPool()
+    page = HtmlWebpageBuilder.build("http://python.org/", "test")
+    page.response.headers["Content-Type"] = "application/pdf"
+    assert crawl._extract_links(page).links == []
+    assert pool.submitted == 0
+
+def test_crawl__metrics():
+    crawl = crawler.Crawler(
+        respect_robots=False, webpage_builder=HtmlWebpageBuilder,
+        multithreading=True, max_threads=4)
+    pages = crawl.crawl("http://python.org")
+    snapshot = crawl.metrics.snapshot()
+    assert snapshot["counters"]["pages_total"] == len(pages)
+    assert snapshot["counters"]['responses_total{status="200"}'] == len(pages)
+    assert snapshot["stages"]["parse"]["count"] == len(pages)
+    assert snapshot["stages"]["fetch"]["count"] == len(pages)
+    assert snapshot["gauges"]["active_workers"] >= 0
+    assert set(snapshot["hosts"]) == {"python.org"}
+
+def test_crawl__metrics_errors():
+    class ErrorBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, *args, **kwargs):
+            raise requests.ConnectTimeout("slow")
+
+    crawl = crawler.Crawler(respect_robots=False, webpage_builder=ErrorBuilder)
+    crawl.crawl("http://python.org")
+    assert crawl.metrics.get_counter("errors_total", type="ConnectTimeout") == 1
+    assert crawl.metrics.get_counter("timeouts_total") == 1
+
+def test_crawl__adaptive_concurrency():
+    class ThrottledBuilder(HtmlWebpageBuilder):
+        @classmethod
+        def build(cls, url, user_agent, **kwargs):
+            page = super().build(url, user_agent, **kwargs)
+            if url == "http://python.org/a":
+                page.response.status_code = 429
+                page.response.headers["Retry-After"] = "0"
+            return page
+
+    crawl = crawler.Crawler(
+        respect_robots=False, webpage_builder=ThrottledBuilder,
+        multithreading=True, max_threads=8, adaptive_concurrency=True,
+        max_host_concurrency=4)
+    pages = crawl.crawl("http://python.org")
+    assert "http://python.org/a" in [page.url for page in pages]
+    limits = crawl.host_concurrency.limits()
+    assert set(limits) == {"python.org"}
+    assert 1 <= limits["python.org"] <= 4
+    assert crawl.metrics.snapshot()["gauges"]['host_concurrency{host="python.org"}'] == (
+        limits["python.org"])
+
+def test_crawl__priority():
+    pages = make_crawler(
+        priority=frontier.UrlPatternPriority({r"/b$": 10})).iter_crawl("http://python.org")
+    assert [page.url for page in pages][:2] == ["http://python.org/", "http://python.org/b"]
+
+def test_crawl__max_pages():
+    class UrlCrawler(crawler.Crawler):
+        def parse(self, webpages):
+            return [page.url for page in webpages]
+
+    crawl = UrlCrawler(
+        respect_robots=False, webpage_builder=FakeWebpageBuilder, max_pages=2)
+    assert crawl.crawl("http://python.org") == ["http://python.org/", "http://python.org/a"]
+    assert crawl.budget_exhausted == "max_pages"
+
+def test_crawl__max_pages_not_reached():
+    crawl = make_crawler(max_pages=len(SITE))
+    assert len(crawl.crawl("http://python.org")) == len(SITE)
+    # The crawl ran out of URLs, not budget.
+    assert crawl.budget_exhausted is None
+
+def test_crawl__max_pages_per_host():
+    crawl = make_crawler(cross_site=True, max_pages_per_host=2)
+    pages = crawl.crawl("http://python.org")
+    assert [page.url for page in pages] == ["http://python.org/", "http://python.org/a"]
+    assert crawl.budget_exhausted is None
+
+def test_crawl__max_bytes():
+    class CountingBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, user_agent, metrics=None, **kwargs):
+            metrics.inc("bytes_total", 100)
+            return super().build(url, user_agent, **kwargs)
+
+    crawl = crawler.Crawler(
+        respect_robots=False, webpage_builder=CountingBuilder, max_bytes=250)
+    assert len(crawl.crawl("http://python.org")) == 3
+    assert crawl.budget_exhausted == "max_bytes"
+
+def test_crawl__max_time():
+    class SlowBuilder(FakeWebpageBuilder):
+        @classmethod
+        def build(cls, url, *args, **kwargs):
+            time.sleep(0.1)
+            return super().build(url, *args, **kwargs)
+
+    crawl = crawler.Crawler(
+        respect_robots=False, webpage_builder=SlowBuilder, max_time=0.15)
+    pages = crawl.crawl("http://python.org")
+    assert 1 <= len(pages) < len(SITE)
+    assert crawl.budget_exhausted == "max_time"
+
+def test_crawl__allowed_domains():
+    crawl = make_crawler(cross_site=True)
+    domains = crawl._compile_domains(["python.org"], ["*.pandas.org"], None)
+    assert crawl._is_crawlable_domain("http://docs.python.org/", *domains)
+    assert crawl._is_crawlable_domain("http://docs.pandas.org/", *domains)
+    assert not crawl._is_crawlable_domain("http://pandas.org/", *domains)
+    domains = crawl._compile_domains(["python.org"], None, ["pandas.org"])
+    assert not crawl._is_crawlable_domain("http://docs.pandas.org/", *domains)
+    assert crawl._is_crawlable_domain("http://numpy.org/", *domains)
+
+def test_crawl__disallowed_domains():
+    pages = make_crawler(cross_site=True).crawl(
+        "http://python.org", disallowed_domains=["pandas.org"])
+    assert sorted(page.url for page in pages) == sorted(SITE)
+    pages = make_crawler(cross_site=True).crawl("http://python.org")
+    assert "http://pandas.org/" in [page.url for page in pages]
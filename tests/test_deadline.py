@@ -0,0 +1,153 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from bitcrawler import crawler
+from bitcrawler import deadline
+from bitcrawler import robots
+from bitcrawler import sessions
+from bitcrawler import webpage
+
+
+class TarpitHandler(http.server.BaseHTTPRequestHandler):
+    """Sends the headers at once, then the body a byte at a time.
+
+    Paths starting with /slow-headers send the headers a line at a time
+    instead, and /robots.txt is the only slow page under /fast-robots.
+
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/slow-headers"):
+            self._send_slow_headers()
+            return
+        if self.path.startswith("/fast-robots"):
+            body = b"<html></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", "100000")
+        self.end_headers()
+        try:
+            for _ in range(200):
+                self.wfile.write(b"a")
+                self.wfile.flush()
+                time.sleep(0.05)
+        except OSError:
+            pass
+
+    def _send_slow_headers(self):
+        try:
+            self.wfile.write(b"HTTP/1.1 200 OK\r\n")
+            for index in range(200):
+                self.wfile.write(f"X-Slow-{index}: a\r\n".encode())
+                self.wfile.flush()
+                time.sleep(0.05)
+            self.wfile.write(b"Content-Length: 0\r\n\r\n")
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def tarpit():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TarpitHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+def test_deadline__cap_timeout():
+    page_deadline = deadline.Deadline.after(10, now=0)
+    assert page_deadline.cap_timeout((5, 30), now=0) == (5, 10)
+    assert page_deadline.cap_timeout(None, now=4) == 6
+    assert page_deadline.cap_timeout(3, now=9) == 1
+    assert page_deadline.expired(now=10)
+    assert not page_deadline.expired(now=9)
+
+def test_build__deadline(tarpit):
+    start = time.monotonic()
+    page = webpage.WebpageBuilder.build(
+        tarpit, "test", respect_robots=False,
+        deadline=deadline.Deadline.after(0.3))
+    # The read timeout never fires since a byte arrives every 0.05 sec.
+    assert time.monotonic() - start < 2
+    assert page.message.endswith("Download exceeded the page deadline")
+    assert page.response.content == b""
+
+def test_crawl__page_timeout(tarpit):
+    crawl = crawler.Crawler(respect_robots=False)
+    assert crawl.request_kwargs["timeout"] == (10, 30)
+    start = time.monotonic()
+    pages = crawl.crawl(tarpit, page_timeout=0.3)
+    assert time.monotonic() - start < 2
+    assert pages[0].message.startswith("A timeout")
+    assert crawl.metrics.get_counter("timeouts_total") == 1
+
+def test_crawl__max_time_cuts_off_pages(tarpit):
+    start = time.monotonic()
+    pages = crawler.Crawler(respect_robots=False, max_time=0.3).crawl(
+        tarpit, page_timeout=30)
+    assert time.monotonic() - start < 2
+    assert pages[0].message.startswith("A timeout")
+
+def test_build__deadline_slow_headers(tarpit):
+    for session_pool in (None, sessions.SessionPool()):
+        start = time.monotonic()
+        page = webpage.WebpageBuilder.build(
+            tarpit + "slow-headers", "test", respect_robots=False,
+            session_pool=session_pool, deadline=deadline.Deadline.after(0.3))
+        # The read timeout never fires since a header line arrives every 0.05 sec.
+        assert time.monotonic() - start < 2
+        assert isinstance(page.error, requests.Timeout)
+        assert page.response is None
+
+def test_build__deadline_slow_robots(tarpit):
+    robots_cache = robots.RobotsCache(10)
+    start = time.monotonic()
+    page = webpage.WebpageBuilder.build(
+        tarpit + "fast-robots", "test", reppy=robots_cache,
+        deadline=deadline.Deadline.after(0.3))
+    # Depending on the cache policy the failed robots.txt fetch disallows
+    # the page or is ignored, and then the deadline has passed.
+    assert time.monotonic() - start < 2
+    assert page.response is None
+
+def test_crawl__page_timeout_slow_robots(tarpit):
+    start = time.monotonic()
+    pages = crawler.Crawler().crawl(tarpit + "fast-robots", page_timeout=0.3)
+    assert time.monotonic() - start < 2
+    assert pages[0].message.startswith("A timeout")
+
+def test_watchdog__cancel_releases_response():
+    watchdog = deadline.Watchdog()
+    response = requests.Response()
+    handle = watchdog.watch(deadline.Deadline.after(60), response)
+    watchdog.cancel(handle)
+    assert not watchdog._watches
+    (_, _, watch), = watchdog._heap
+    assert watch.target is None
+
+def test_watchdog__forgets_fired_watches():
+    watchdog = deadline.Watchdog()
+    response = requests.Response()
+    closed = threading.Event()
+    response.close = closed.set
+    watchdog.watch(deadline.Deadline.after(0.05), response)
+    assert closed.wait(2)
+    time.sleep(0.05)
+    assert not watchdog._watches
+    assert not watchdog._heap
@@ -0,0 +1,183 @@
+import collections
+import concurrent.futures as cf
+import http.server
+import threading
+
+import pytest
+
+from bitcrawler import crawler
+from bitcrawler import distributed
+from bitcrawler import webpage
+
+SITE = {
+    "http://python.org/": ["http://python.org/a", "http://pandas.org/"],
+    "http://python.org/a": ["http://numpy.org/", "http://scipy.org/"],
+    "http://pandas.org/": ["http://numpy.org/", "http://python.org/a"],
+    "http://numpy.org/": ["http://scipy.org/", "http://numpy.org/b"],
+    "http://numpy.org/b": ["http://python.org/"],
+    "http://scipy.org/": ["http://pandas.org/", "http://docs.scipy.org/"],
+    "http://docs.scipy.org/": [],
+}
+
+
+class FakeWebpage(webpage.Webpage):
+    def get_page_links(self, engine="bs4"):
+        self.links = SITE.get(self.url, [])
+        return self.links
+
+
+class FakeWebpageBuilder(webpage.WebpageBuilder):
+    built = collections.Counter()
+    lock = threading.Lock()
+
+    @classmethod
+    def build(cls, url, user_agent, **kwargs):
+        with cls.lock:
+            cls.built[url] += 1
+        page = FakeWebpage()
+        page.url = url
+        return page
+
+
+def test_hash_ring():
+    ring = distributed.HashRing(4)
+    shards = [ring.get_shard(f"http://site{index}.com/") for index in range(1000)]
+    assert set(shards) == {0, 1, 2, 3}
+    assert min(collections.Counter(shards).values()) > 150
+    # Hosts of one domain share a shard.
+    assert ring.get_shard("http://docs.python.org/") == ring.get_shard("http://python.org/a")
+
+def test_hash_ring__adding_shard_moves_few_domains():
+    ring, bigger = distributed.HashRing(4), distributed.HashRing(5)
+    urls = [f"http://site{index}.com/" for index in range(1000)]
+    moved = sum(ring.get_shard(url) != bigger.get_shard(url) for url in urls)
+    assert moved < 350
+
+def test_hash_ring__invalid():
+    with pytest.raises(ValueError):
+        distributed.HashRing(0)
+
+def test_sqlite_backend(tmp_path):
+    backend = distributed.SqliteBackend(str(tmp_path / "crawl.db"))
+    backend.register(0)
+    backend.register(1)
+    backend.push(1, [("http://python.org/", 0), ("http://python.org/a", 1)])
+    assert backend.set_idle(0)
+    assert not backend.set_idle(1)
+    assert not backend.is_finished(2)
+    assert backend.pop(1, 1) == [("http://python.org/", 0)]
+    assert backend.pop(1, 10) == [("http://python.org/a", 1)]
+    assert backend.set_idle(1)
+    assert backend.is_finished(2)
+    assert not backend.is_finished(3)
+
+def test_shard_workers(tmp_path):
+    FakeWebpageBuilder.built = collections.Counter()
+    path = str(tmp_path / "crawl.db")
+    shards = 3
+    workers = [
+        distributed.ShardWorker(
+            crawler.Crawler(
+                respect_robots=False, cross_site=True,
+                webpage_builder=FakeWebpageBuilder),
+            shard, shards, distributed.SqliteBackend(path), poll_interval=0.01)
+        for shard in range(shards)]
+    with cf.ThreadPoolExecutor(shards) as pool:
+        results = list(pool.map(
+            lambda worker: worker.crawl("http://python.org"), workers))
+
+    assert sorted(page.url for pages in results for page in pages) == sorted(SITE)
+    assert all(count == 1 for count in FakeWebpageBuilder.built.values())
+    for worker, pages in zip(workers, results):
+        assert all(worker.ring.get_shard(page.url) == worker.shard for page in pages)
+
+def test_shard_workers__max_pages(tmp_path):
+    FakeWebpageBuilder.built = collections.Counter()
+    path = str(tmp_path / "crawl.db")
+    workers = [
+        distributed.ShardWorker(
+            crawler.Crawler(
+                respect_robots=False, cross_site=True, max_pages=1,
+                webpage_builder=FakeWebpageBuilder),
+            shard, 2, distributed.SqliteBackend(path), poll_interval=0.01)
+        for shard in range(2)]
+    with cf.ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(
+            lambda worker: worker.crawl("http://python.org"), workers))
+
+    # Each worker fetches at most one page and the crawl still finishes.
+    assert all(len(pages) <= 1 for pages in results)
+    assert sum(FakeWebpageBuilder.built.values()) == sum(map(len, results))
+    owner = workers[workers[0].ring.get_shard("http://python.org/")]
+    assert owner.crawler.budget_exhausted == "max_pages"
+
+
+# 127.0.0.1 and 127.0.0.3 are on different shards of a 2 shard ring.
+PAGES = {
+    "/": '<a href="/a">A</a><a href="http://127.0.0.3:{port}/">B</a>',
+    "/a": '<a href="http://127.0.0.3:{port}/b">B</a>',
+    "/b": '',
+}
+
+
+class SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path in PAGES:
+            status = 200
+            body = PAGES[self.path].format(port=self.server.server_port).encode()
+        else:
+            status, body = 404, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_run_local(tmp_path):
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", 0), SiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        results = distributed.run_local(
+            f"http://127.0.0.1:{server.server_port}", 2,
+            distributed.SqliteBackend(str(tmp_path / "crawl.db")),
+            crawler_kwargs={
+                'respect_robots': False, 'cross_site': True,
+                'body_retention': 'none'})
+    finally:
+        server.shutdown()
+    port = server.server_port
+    assert sorted(page.url for page in results[0]) == [
+        f"http://127.0.0.1:{port}/", f"http://127.0.0.1:{port}/a"]
+    assert sorted(page.url for page in results[1]) == [
+        f"http://127.0.0.3:{port}/", f"http://127.0.0.3:{port}/a",
+        f"http://127.0.0.3:{port}/b"]
+    assert all(page.status_code == 200 for pages in results for page in pages)
+
+class PoolRecordingCrawler(crawler.Crawler):
+    def _start_process_pool(self):
+        super()._start_process_pool()
+        self.started_pool = self._process_pool
+
+def test_shard_worker__parse_processes(tmp_path):
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    crawl = PoolRecordingCrawler(
+        respect_robots=False, cross_site=True, multithreading=True, max_threads=4,
+        parse_processes=1)
+    worker = distributed.ShardWorker(
+        crawl, 0, 1, distributed.SqliteBackend(str(tmp_path / "crawl.db")),
+        poll_interval=0.01)
+    try:
+        pages = worker.crawl(f"http://127.0.0.1:{server.server_port}")
+    finally:
+        server.shutdown()
+    assert len(pages) == 5
+    assert crawl.started_pool is not None
+    assert crawl._process_pool is None
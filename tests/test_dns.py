@@ -0,0 +1,177 @@
+import asyncio
+import http.server
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from bitcrawler import aio
+from bitcrawler import crawler
+from bitcrawler import dns
+from bitcrawler import sessions
+
+
+class CountingResolver:
+    """Stands in for socket.getaddrinfo, counting the lookups."""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, host, port, family=0, type=0, *args):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if host.endswith(".invalid"):
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))]
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    counting = CountingResolver()
+    monkeypatch.setattr(dns.socket, "getaddrinfo", counting)
+    return counting
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    pages = {
+        "/": b'<a href="/a">A</a><a href="/b">B</a>',
+        "/a": b'<a href="/b">B</a>',
+        "/b": b'',
+    }
+
+    def do_GET(self):
+        body = self.pages.get(self.path, b"")
+        self.send_response(200 if self.path in self.pages else 404)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        # A new connection, and so a new lookup, for every request.
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_dns_cache__ttl(resolver, monkeypatch):
+    now = [0]
+    monkeypatch.setattr(dns.time, "monotonic", lambda: now[0])
+    dns_cache = dns.DnsCache(ttl=10)
+    first = dns_cache.getaddrinfo("Example.com", 80)
+    assert dns_cache.getaddrinfo("example.com", 80) == first
+    assert resolver.calls == 1
+    now[0] = 11
+    dns_cache.getaddrinfo("example.com", 80)
+    assert resolver.calls == 2
+    stats = dns_cache.stats()
+    assert (stats["hit"], stats["miss"], stats["total"]) == (1, 2, 3)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+def test_dns_cache__negative_ttl(resolver, monkeypatch):
+    now = [0]
+    monkeypatch.setattr(dns.time, "monotonic", lambda: now[0])
+    dns_cache = dns.DnsCache(ttl=300, negative_ttl=5)
+    for _ in range(3):
+        with pytest.raises(socket.gaierror):
+            dns_cache.getaddrinfo("missing.invalid", 80)
+    assert resolver.calls == 1
+    assert dns_cache.stats()["negative_hit"] == 2
+    now[0] = 6
+    with pytest.raises(socket.gaierror):
+        dns_cache.getaddrinfo("missing.invalid", 80)
+    assert resolver.calls == 2
+
+def test_dns_cache__single_flight(monkeypatch):
+    resolver = CountingResolver(delay=0.2)
+    monkeypatch.setattr(dns.socket, "getaddrinfo", resolver)
+    dns_cache = dns.DnsCache()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(dns_cache.getaddrinfo("example.com", 80)))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert resolver.calls == 1
+    assert len(results) == 8
+    assert dns_cache.stats()["shared"] == 7
+
+def test_dns_cache__max_size(resolver):
+    dns_cache = dns.DnsCache(max_size=2)
+    for host in ("a.com", "b.com", "c.com"):
+        dns_cache.getaddrinfo(host, 80)
+    assert len(dns_cache) == 2
+    dns_cache.getaddrinfo("a.com", 80)
+    assert resolver.calls == 4
+
+def test_session_pool__dns_cache(site):
+    site = site.replace("127.0.0.1", "localhost")
+    dns_cache = dns.DnsCache()
+    pool = sessions.SessionPool(dns_cache=dns_cache)
+    with pool.session() as session:
+        for _ in range(3):
+            assert session.get(site + "/a").status_code == 200
+        with pytest.raises(requests.ConnectionError):
+            session.get("http://missing.invalid/")
+    pool.close()
+    stats = dns_cache.stats()
+    assert (stats["miss"], stats["hit"]) == (2, 2)
+
+def test_crawl__dns_hit_rate(site):
+    crawl = crawler.Crawler(respect_robots=False, multithreading=True, max_threads=4)
+    pages = crawl.crawl(site)
+    assert len(pages) == 3
+    assert crawl.dns_cache.stats()["miss"] == 1
+    hit_rate = crawl.metrics.snapshot()["dns_hit_rate"]
+    assert hit_rate == pytest.approx(2 / 3)
+    assert "dns_hits=67%" in crawl.metrics.log_line()
+
+def test_crawl__dns_cache_disabled(site):
+    crawl = crawler.Crawler(respect_robots=False, dns_cache=False)
+    assert len(crawl.crawl(site)) == 3
+    assert crawl.dns_cache is None
+    assert crawl.metrics.snapshot()["dns_hit_rate"] is None
+
+def test_dns_cache_resolver(resolver):
+    pytest.importorskip("aiohttp")
+    dns_cache = dns.DnsCache()
+    cache_resolver = aio.DnsCacheResolver(dns_cache)
+    for _ in range(2):
+        results = asyncio.run(cache_resolver.resolve("example.com", 80))
+        assert [(result["host"], result["port"]) for result in results] == [("127.0.0.1", 80)]
+    assert resolver.calls == 1
+    with pytest.raises(OSError):
+        asyncio.run(cache_resolver.resolve("missing.invalid", 80))
+
+def test_acrawl__dns_cache(site):
+    pytest.importorskip("aiohttp")
+    dns_cache = dns.DnsCache()
+    crawl = crawler.Crawler(respect_robots=False, dns_cache=dns_cache)
+    assert crawl.dns_cache is dns_cache
+    assert len(asyncio.run(crawl.acrawl(site))) == 3
+
+def test_crawl__shared_dns_cache(site):
+    dns_cache = dns.DnsCache()
+    first = crawler.Crawler(respect_robots=False, dns_cache=dns_cache)
+    second = crawler.Crawler(respect_robots=False, dns_cache=dns_cache)
+    assert len(first.crawl(site)) == 3
+    assert len(second.crawl(site)) == 3
+    assert first.metrics.snapshot()["dns_hit_rate"] == pytest.approx(2 / 3)
+    # The host is still cached from the first crawl.
+    assert second.metrics.snapshot()["dns_hit_rate"] == 1
+    assert dns_cache.stats()["total"] == 6
@@ -0,0 +1,116 @@
+from bitcrawler import frontier
+
+def test_frontier_fifo():
+    queue = frontier.Frontier()
+    queue.put("http://python.org", 0)
+    queue.put("http://python.org/about", 1)
+    assert len(queue) == 2
+    assert queue.get() == ("http://python.org", 0)
+    assert queue.get() == ("http://python.org/about", 1)
+
+def test_frontier_empty():
+    queue = frontier.Frontier()
+    assert not queue
+    assert queue.get() is None
+
+def test_frontier_per_host_delay():
+    queue = frontier.Frontier(crawl_delay=10)
+    queue.put("http://python.org/1", 0)
+    queue.put("http://python.org/2", 0)
+    queue.put("http://pandas.org/1", 0)
+    assert queue.get(now=0) == ("http://python.org/1", 0)
+    # python.org is delayed but pandas.org is ready.
+    assert queue.get(now=0) == ("http://pandas.org/1", 0)
+    assert queue.get(now=5) is None
+    assert queue.wait_time(now=5) == 5
+    assert queue.get(now=10) == ("http://python.org/2", 0)
+    assert not queue
+
+def test_frontier_host_delay():
+    delays = {"python.org": 5, "pandas.org": 1}
+    queue = frontier.Frontier(
+        crawl_delay=2, host_delay=lambda url: delays[url.split("/")[2]])
+    for host in delays:
+        queue.put(f"http://{host}/1", 0)
+        queue.put(f"http://{host}/2", 0)
+    assert queue.get(now=0) == ("http://python.org/1", 0)
+    assert queue.get(now=0) == ("http://pandas.org/1", 0)
+    # pandas.org uses `crawl_delay` because it is larger.
+    assert queue.get(now=2) == ("http://pandas.org/2", 0)
+    assert queue.get(now=4) is None
+    assert queue.get(now=5) == ("http://python.org/2", 0)
+
+def test_frontier_unknown_host_delay():
+    delays = {}
+    queue = frontier.Frontier(host_delay=lambda url: delays.get("python.org"))
+    queue.put("http://python.org/1", 0)
+    queue.put("http://python.org/2", 0)
+    assert queue.get(now=0) == ("http://python.org/1", 0)
+    # The host is held until the delay is known.
+    assert queue.get(now=100) is None
+    assert queue.wait_time(now=100) is None
+    delays["python.org"] = 3
+    queue.done("http://python.org/1", now=100)
+    assert queue.get(now=102) is None
+    assert queue.get(now=103) == ("http://python.org/2", 0)
+
+def test_frontier_host_limit():
+    limits = {"python.org": 2}
+    queue = frontier.Frontier(host_limit=lambda host: limits.get(host, 1))
+    for index in range(3):
+        queue.put(f"http://python.org/{index}", 0)
+    queue.put("http://pandas.org/0", 0)
+    queue.put("http://pandas.org/1", 0)
+    assert queue.get(now=0) == ("http://python.org/0", 0)
+    assert queue.get(now=0) == ("http://pandas.org/0", 0)
+    assert queue.get(now=0) == ("http://python.org/1", 0)
+    # Both hosts are at their limit.
+    assert queue.get(now=0) is None
+    queue.done("http://pandas.org/0", now=0)
+    assert queue.get(now=0) == ("http://pandas.org/1", 0)
+    limits["python.org"] = 1
+    queue.done("http://python.org/0", now=0)
+    assert queue.get(now=0) is None
+    queue.done("http://python.org/1", now=0)
+    assert queue.get(now=0) == ("http://python.org/2", 0)
+
+def test_frontier_delay_host_while_queued():
+    queue = frontier.Frontier()
+    queue.put("http://python.org/1", 0)
+    queue.put("http://python.org/2", 0)
+    assert queue.get(now=0) == ("http://python.org/1", 0)
+    queue.delay_host("python.org", 30, now=0)
+    assert queue.get(now=10) is None
+    assert queue.wait_time(now=10) == 20
+    assert queue.get(now=30) == ("http://python.org/2", 0)
+
+def test_frontier_score_order():
+    queue = frontier.Frontier()
+    queue.put("http://python.org/low", 0, score=1)
+    queue.put("http://python.org/high", 0, score=5)
+    queue.put("http://python.org/also-low", 0, score=1)
+    assert queue.get(now=0) == ("http://python.org/high", 0)
+    # Equal scores are crawled in the order they were added.
+    assert queue.get(now=0) == ("http://python.org/low", 0)
+    assert queue.get(now=0) == ("http://python.org/also-low", 0)
+
+def test_frontier_score_order_across_hosts():
+    queue = frontier.Frontier()
+    queue.put("http://python.org/1", 0, score=1)
+    queue.put("http://pandas.org/1", 0, score=2)
+    assert queue.get(now=0) == ("http://pandas.org/1", 0)
+    # A better item replaces the ready entry of its host.
+    queue.put("http://python.org/2", 0, score=10)
+    queue.put("http://pandas.org/2", 0, score=5)
+    assert queue.get(now=0) == ("http://python.org/2", 0)
+    assert queue.get(now=0) == ("http://pandas.org/2", 0)
+    assert queue.get(now=0) == ("http://python.org/1", 0)
+    assert queue.get(now=0) is None
+    assert not queue
+
+def test_url_pattern_priority():
+    priority = frontier.UrlPatternPriority({r"/docs/": 10, r"\?page=": -5}, depth_weight=2)
+    assert priority("http://python.org/docs/", 1) == 8
+    assert priority("http://python.org/docs/?page=2", 0) == 5
+    assert priority("http://python.org/", 3) == -6
+    assert frontier.UrlPatternPriority()("http://python.org/", 1) == -1
@@ -0,0 +1,141 @@
+import http.server
+import socket
+import threading
+
+import pytest
+import requests
+
+h2 = pytest.importorskip("h2")
+pytest.importorskip("httpx")
+import h2.config  # noqa: E402
+import h2.connection  # noqa: E402
+import h2.events  # noqa: E402
+
+from bitcrawler import crawler  # noqa: E402
+from bitcrawler import http2  # noqa: E402
+from bitcrawler import webpage  # noqa: E402
+
+PAGES = {
+    "/": b'<a href="/a">A</a><a href="/b">B</a><a href="/c">C</a>',
+    "/a": b'<a href="/b">B</a><a href="/d">D</a>',
+    "/b": b'<a href="/e">E</a>',
+    "/c": b'',
+    "/d": b'',
+    "/e": b'',
+}
+
+
+class H2Server:
+    """A cleartext HTTP/2 server for the pages, speaking HTTP/2 only."""
+    def __init__(self):
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        h2_conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False))
+        h2_conn.initiate_connection()
+        conn.sendall(h2_conn.data_to_send())
+        with conn:
+            while True:
+                try:
+                    data = conn.recv(65535)
+                except OSError:
+                    return
+                if not data:
+                    return
+                for event in h2_conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers)[b":path"].decode()
+                        body = PAGES.get(path)
+                        status = "200" if body is not None else "404"
+                        body = body or b""
+                        h2_conn.send_headers(event.stream_id, [
+                            (":status", status), ("content-type", "text/html"),
+                            ("content-length", str(len(body)))])
+                        h2_conn.send_data(event.stream_id, body, end_stream=True)
+                conn.sendall(h2_conn.data_to_send())
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def h2_site():
+    server = H2Server()
+    yield server, f"http://127.0.0.1:{server.port}"
+    server.close()
+
+
+class Http1Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = PAGES.get(self.path, b"")
+        self.send_response(200 if self.path in PAGES else 404)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http1_site():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Http1Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_build__http2(h2_site):
+    _, site = h2_site
+    pool = http2.Http2SessionPool(prior_knowledge=True)
+    page = webpage.WebpageBuilder.build(
+        site + "/a", "test", respect_robots=False, session_pool=pool)
+    pool.close()
+    assert page.response.status_code == 200
+    assert page.response.raw.version == 20
+    assert page.response.content == PAGES["/a"]
+    assert page.response.elapsed.total_seconds() >= 0
+
+def test_crawl__http2_multiplexes(h2_site):
+    server, site = h2_site
+    crawl = crawler.Crawler(
+        http2=True, http2_prior_knowledge=True, multithreading=True, max_threads=8)
+    pages = crawl.crawl(site)
+    crawl.session_pool.close()
+    assert sorted(page.url for page in pages) == sorted(site + path for path in PAGES)
+    assert all(page.response.raw.version == 20 for page in pages)
+    # Every page and the robots.txt request share a few connections.
+    assert server.connections <= 2
+
+def test_http2_session__falls_back_to_http1(http1_site):
+    session = http2.Http2Session(prior_knowledge=True)
+    response = session.get(http1_site + "/a")
+    assert response.status_code == 200
+    assert response.content == PAGES["/a"]
+    assert response.raw.version == 11
+    assert session.http1_hosts == {http1_site[len("http://"):]}
+    # Later requests go straight to HTTP/1.1.
+    assert session.get(http1_site + "/b", stream=True).raw.version == 11
+    session.close()
+
+def test_http2_session__errors():
+    session = http2.Http2Session()
+    with pytest.raises(requests.ConnectionError):
+        session.get("http://127.0.0.1:1/")
+    session.close()
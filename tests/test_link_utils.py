@@ -22,6 +22,56 @@ def test_get_domain():
     assert link_utils.LinkUtils.get_domain(url1) == "python.org"
     assert link_utils.LinkUtils.get_domain(url2) == "python.org"
 
+def test_get_domain__public_suffix():
+    assert link_utils.LinkUtils.get_domain("http://www.bbc.co.uk/news") == "bbc.co.uk"
+    assert link_utils.LinkUtils.get_domain("http://gov.uk/") == "gov.uk"
+    assert link_utils.LinkUtils.get_domain("http://user.github.io/") == "user.github.io"
+    assert link_utils.LinkUtils.get_domain("http://127.0.0.1:8000/") == "127.0.0.1"
+    assert link_utils.LinkUtils.get_domain("http://localhost/") == "localhost"
+    assert not link_utils.LinkUtils.is_same_domain(
+        "http://bbc.co.uk", "http://guardian.co.uk")
+
+def test_public_suffix_list():
+    psl = link_utils.PublicSuffixList(
+        ["// ===BEGIN ICANN DOMAINS===", "uk", "co.uk", "*.ck", "!www.ck",
+         "// ===BEGIN PRIVATE DOMAINS===", "blogspot.co.uk"])
+    assert psl.public_suffix("www.bbc.co.uk") == "co.uk"
+    assert psl.registrable_domain("a.b.blog.blogspot.co.uk") == "blog.blogspot.co.uk"
+    assert psl.registrable_domain("a.b.ck") == "a.b.ck"
+    assert psl.registrable_domain("a.www.ck") == "www.ck"
+    assert psl.registrable_domain("co.uk") == "co.uk"
+    # Hosts matching no rule use the last label.
+    assert psl.registrable_domain("a.python.org") == "python.org"
+    public = link_utils.PublicSuffixList(
+        ["co.uk", "// ===BEGIN PRIVATE DOMAINS===", "blogspot.co.uk"],
+        include_private=False)
+    assert public.registrable_domain("blog.blogspot.co.uk") == "blogspot.co.uk"
+
+def test_public_suffix_list__set_default():
+    link_utils.PublicSuffixList.set_default(link_utils.PublicSuffixList(["org"]))
+    try:
+        assert link_utils.LinkUtils.get_domain("http://a.bbc.co.uk/") == "co.uk"
+    finally:
+        link_utils.PublicSuffixList.set_default(None)
+    assert link_utils.LinkUtils.get_domain("http://a.bbc.co.uk/") == "bbc.co.uk"
+
+def test_domain_matcher():
+    matcher = link_utils.DomainMatcher(["python.org", "*.pandas.org", "HTTP://Numpy.org:80/"])
+    assert matcher.matches("http://python.org/")
+    assert matcher.matches("http://docs.python.org:8000/3/")
+    assert not matcher.matches("http://notpython.org/")
+    assert matcher.matches("http://docs.pandas.org/")
+    assert not matcher.matches("http://pandas.org/")
+    assert matcher.matches("http://numpy.org/")
+    assert len(matcher) == 3
+    assert not link_utils.DomainMatcher()
+    assert link_utils.DomainMatcher.compile(matcher) is matcher
+
+def test_domain_matcher__large():
+    matcher = link_utils.DomainMatcher(f"site{index}.com" for index in range(100000))
+    assert matcher.matches("http://www.site99999.com/")
+    assert not matcher.matches("http://www.site100000.com/")
+
 def test_is_same_domain():
     url1 = "http://python.org/test/1?some_param=some_val"
     url2 = "http://python.org/search/123"
@@ -34,3 +84,64 @@ def test_not_is_same_domain():
     url1 = "http://python.org/test/1?some_param=some_val"
     url2 = "http://pandas.org/search/123"
     assert not link_utils.LinkUtils.is_same_domain(url1, url2)
+
+def test_canonicalize():
+    canonicalizer = link_utils.Canonicalizer()
+    urls = [
+        "http://Example.com:80/a#top",
+        "http://example.com/a",
+        "http://example.com/./b/../a",
+        "HTTP://EXAMPLE.COM/%61",
+    ]
+    for url in urls:
+        assert canonicalizer.canonicalize(url) == "http://example.com/a"
+
+def test_canonicalize__query():
+    canonicalizer = link_utils.Canonicalizer()
+    url = "https://example.com:443/a?b=2&utm_source=x&a=1&fbclid=abc"
+    assert canonicalizer.canonicalize(url) == "https://example.com/a?a=1&b=2"
+
+def test_canonicalize__percent_encoding():
+    canonicalizer = link_utils.Canonicalizer()
+    url = "http://example.com/%7euser/a%2fb?q=%e2%82%ac"
+    assert canonicalizer.canonicalize(url) == "http://example.com/~user/a%2Fb?q=%E2%82%AC"
+
+def test_canonicalize__session_path_params():
+    canonicalizer = link_utils.Canonicalizer()
+    url = "http://example.com/a;jsessionid=1234?PHPSESSID=5678"
+    assert canonicalizer.canonicalize(url) == "http://example.com/a"
+
+def test_canonicalize__custom_rules():
+    canonicalizer = link_utils.Canonicalizer(
+        strip_params=["ref"], sort_query=False, strip_trailing_slash=True)
+    url = "http://example.com:8080/a/?z=1&ref=home&a=2"
+    assert canonicalizer.canonicalize(url) == "http://example.com:8080/a?z=1&a=2"
+
+def test_canonicalize__relative():
+    assert link_utils.Canonicalizer().canonicalize("/about") == "/about"
+
+def test_resolve_links():
+    links = [
+        "/about",
+        "about",
+        "http://pandas.org/search",
+        "mailto:help@python.org",
+        " JavaScript:void(0)",
+        "tel:+15555555555",
+        "ftp://python.org/file",
+        "http://[python.org",
+        "",
+        None,
+    ]
+    resolved = link_utils.LinkUtils.resolve_links("http://python.org", links)
+    assert sorted(resolved) == [
+        "http://pandas.org/search", "http://python.org/about"]
+
+def test_resolve_links__memoized():
+    link_utils.LinkUtils.clear_cache()
+    links = ["/about", "/search"]
+    link_utils.LinkUtils.resolve_links("http://python.org", links)
+    link_utils.LinkUtils.resolve_links("http://python.org", links)
+    info = link_utils._resolve_link.cache_info()
+    assert info.misses == 2
+    assert info.hits == 2
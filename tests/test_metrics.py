@@ -0,0 +1,86 @@
+import logging
+import time
+import urllib.request
+
+import pytest
+
+from bitcrawler import metrics
+
+
+def test_histogram__quantile():
+    histogram = metrics.Histogram((1, 2, 4))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1) == 4
+    assert histogram.snapshot()["mean"] == pytest.approx(1.625)
+
+def test_histogram__overflow():
+    histogram = metrics.Histogram((1, 2))
+    histogram.observe(10)
+    assert histogram.counts == [0, 0, 1]
+    assert histogram.quantile(0.99) == 2
+
+def test_metrics__snapshot():
+    crawl_metrics = metrics.Metrics()
+    crawl_metrics.inc("pages_total")
+    crawl_metrics.inc("pages_total")
+    crawl_metrics.inc("errors_total", type="ConnectionError")
+    crawl_metrics.set_gauge("queue_depth", 5)
+    crawl_metrics.inc_host("python.org")
+    with crawl_metrics.time("parse"):
+        pass
+    snapshot = crawl_metrics.snapshot()
+    assert snapshot["counters"] == {
+        "pages_total": 2, 'errors_total{type="ConnectionError"}': 1}
+    assert snapshot["gauges"] == {"queue_depth": 5}
+    assert snapshot["stages"]["parse"]["count"] == 1
+    assert set(snapshot["hosts"]) == {"python.org"}
+    assert snapshot["pages_per_sec"] > 0
+    assert crawl_metrics.get_counter("errors_total", type="ConnectionError") == 1
+
+    line = crawl_metrics.log_line()
+    assert "pages=2" in line and "errors=1" in line and "queue=5" in line
+
+    crawl_metrics.reset()
+    assert crawl_metrics.snapshot()["counters"] == {}
+
+def test_metrics__to_prometheus():
+    crawl_metrics = metrics.Metrics(buckets=(0.1, 1))
+    crawl_metrics.inc("errors_total", type="Timeout")
+    crawl_metrics.set_gauge("active_workers", 3)
+    crawl_metrics.observe("download", 0.5)
+    crawl_metrics.observe("download", 5)
+    assert crawl_metrics.to_prometheus().splitlines() == [
+        "# TYPE bitcrawler_errors_total counter",
+        'bitcrawler_errors_total{type="Timeout"} 1',
+        "# TYPE bitcrawler_active_workers gauge",
+        "bitcrawler_active_workers 3",
+        "# TYPE bitcrawler_stage_seconds histogram",
+        'bitcrawler_stage_seconds_bucket{stage="download",le="0.1"} 0',
+        'bitcrawler_stage_seconds_bucket{stage="download",le="1"} 1',
+        'bitcrawler_stage_seconds_bucket{stage="download",le="+Inf"} 2',
+        'bitcrawler_stage_seconds_sum{stage="download"} 5.5',
+        'bitcrawler_stage_seconds_count{stage="download"} 2',
+    ]
+
+def test_metrics__http_server():
+    crawl_metrics = metrics.Metrics()
+    crawl_metrics.inc("pages_total", 3)
+    port = crawl_metrics.start_http_server(0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        crawl_metrics.stop_http_server()
+    assert "bitcrawler_pages_total 3" in body
+
+def test_metrics__start_logging(caplog):
+    crawl_metrics = metrics.Metrics()
+    with caplog.at_level(logging.INFO, logger="bitcrawler"):
+        crawl_metrics.start_logging(0.01)
+        time.sleep(0.1)
+        crawl_metrics.stop_logging()
+    assert any("Crawl metrics: pages=0" in message for message in caplog.messages)
@@ -36,3 +36,52 @@ def test_get_links():
     links = soup.get_links()
 
     assert links.sort() == result_links.sort()
+
+def test_get_canonical_link():
+    html = r"""
+        <html>
+        <head><link rel="canonical" href="http://python.org/about"></head>
+        <body><a href="/about?ref=nav">About</a></body>
+        </html>
+    """
+    soup = parsing.HtmlParser(html, "html.parser")
+    assert soup.get_canonical_link() == "http://python.org/about"
+
+def test_get_canonical_link__missing():
+    soup = parsing.HtmlParser("<a href='/about'>About</a>", "html.parser")
+    assert soup.get_canonical_link() is None
+
+EXTRACTOR_HTML = r"""
+    <html>
+    <head><link rel="canonical" href="/canonical?a=1&amp;b=2"></head>
+    <body>
+      <!-- <a href="/commented">Hidden</a> -->
+      <script>var link = '<a href="/script">';</script>
+      <a class=nav HREF='/single'>Single</a>
+      <a href=/unquoted>Unquoted</a>
+      <a name="anchor">No href</a>
+      <a href="/entity?a=1&amp;b=2">Entity</a>
+      <A href = "http://python.org/upper">Upper</A>
+    </body>
+    </html>
+"""
+
+@pytest.mark.parametrize("name", sorted(parsing.LINK_EXTRACTORS))
+def test_link_extractor_get_links(name):
+    extractor = parsing.LINK_EXTRACTORS[name]
+    if not extractor.is_available():
+        pytest.skip(f"{name} is not installed")
+    assert sorted(extractor.get_links(EXTRACTOR_HTML)) == [
+        "/entity?a=1&b=2", "/single", "/unquoted", "http://python.org/upper"]
+
+@pytest.mark.parametrize("name", sorted(parsing.LINK_EXTRACTORS))
+def test_link_extractor_get_canonical_link(name):
+    extractor = parsing.LINK_EXTRACTORS[name]
+    if not extractor.is_available():
+        pytest.skip(f"{name} is not installed")
+    assert extractor.get_canonical_link(EXTRACTOR_HTML) == "/canonical?a=1&b=2"
+    assert extractor.get_canonical_link("<a href='/about'>About</a>") is None
+
+def test_get_link_extractor__unknown():
+    with pytest.raises(ValueError):
+        parsing.get_link_extractor("regex")
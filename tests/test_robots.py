@@ -0,0 +1,124 @@
+import concurrent.futures as cf
+import http.server
+import threading
+import time
+
+import pytest
+
+from bitcrawler import robots
+from bitcrawler import webpage
+
+ROBOTS = "User-agent: *\nDisallow: /private\nCrawl-delay: 2\n"
+
+
+class RobotsHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+    delay = 0
+
+    def do_GET(self):
+        self.requests.append((self.headers.get("Host"), self.path))
+        time.sleep(self.delay)
+        if self.path == "/robots.txt":
+            status, body = 200, ROBOTS.encode()
+        else:
+            status, body = 404, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ExpiredPolicy:
+    def expires(self, response):
+        return time.time() - 1
+
+
+@pytest.fixture
+def site():
+    RobotsHandler.requests = []
+    RobotsHandler.delay = 0
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", 0), RobotsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_robots_cache__allowed(site):
+    cache = robots.RobotsCache(10)
+    assert cache.allowed(site + "/page", "bitcrawler")
+    assert not cache.allowed(site + "/private/page", "bitcrawler")
+    assert cache.crawl_delay(site + "/page", "bitcrawler") == 2
+    assert cache.cached_crawl_delay(site + "/page", "bitcrawler") == 2
+    assert len(RobotsHandler.requests) == 1
+
+def test_robots_cache__single_flight(site):
+    RobotsHandler.delay = 0.2
+    cache = robots.RobotsCache(10)
+    with cf.ThreadPoolExecutor(20) as pool:
+        allowed = list(pool.map(
+            lambda index: cache.allowed(f"{site}/{index}", "bitcrawler"), range(20)))
+    assert all(allowed)
+    assert RobotsHandler.requests == [(site[len("http://"):], "/robots.txt")]
+    assert cache.fetches == 1
+
+def test_robots_cache__lru(site):
+    cache = robots.RobotsCache(1)
+    other_site = site.replace("127.0.0.1", "127.0.0.2")
+    cache.get(site)
+    cache.get(other_site)
+    assert len(cache) == 1
+    assert site not in cache
+    assert other_site in cache
+
+def test_robots_cache__ttl(site):
+    cache = robots.RobotsCache(10, ttl_policy=ExpiredPolicy())
+    cache.get(site)
+    assert cache.cached_crawl_delay(site, "bitcrawler") is None
+    cache.get(site)
+    assert cache.fetches == 2
+
+def test_robots_cache__fetch_error():
+    cache = robots.RobotsCache(10)
+    # Nothing listens on port 9 (discard), so the fetch fails.
+    assert not cache.allowed("http://127.0.0.1:9/page", "bitcrawler")
+    assert cache.cached_crawl_delay("http://127.0.0.1:9/page", "bitcrawler") == 0
+
+def test_robots_cache__persist(site, tmp_path):
+    path = str(tmp_path / "robots.db")
+    cache = robots.RobotsCache(10, persist_path=path)
+    cache.get(site)
+    cache.close()
+
+    cache = robots.RobotsCache(10, persist_path=path)
+    assert not cache.allowed(site + "/private", "bitcrawler")
+    assert cache.fetches == 0
+    assert len(RobotsHandler.requests) == 1
+
+def test_reppy_utils__allowed(site, capsys):
+    robots.ReppyUtils._cache = None
+    assert not robots.ReppyUtils.allowed(site + "/private", "bitcrawler")
+    assert robots.ReppyUtils.allowed(site + "/page", "bitcrawler")
+    assert len(RobotsHandler.requests) == 1
+    assert capsys.readouterr().out == ""
+
+def test_is_allowed_by_robots__request_kwargs(site):
+    robots.ReppyUtils._cache = None
+    assert not webpage.Webpage.is_allowed_by_robots(
+        site + "/private", "bitcrawler", request_kwargs={'timeout': 5})
+
+def test_robots_cache__partition_allowed(site):
+    cache = robots.RobotsCache(10)
+    other_site = site.replace("127.0.0.1", "127.0.0.2")
+    cache.get(site)
+    allowed, disallowed = cache.partition_allowed(
+        [site + "/a", site + "/private/b", other_site + "/private/c"], "bitcrawler")
+    # The other site's robots.txt is not cached, so its link is kept.
+    assert sorted(allowed) == [site + "/a", other_site + "/private/c"]
+    assert disallowed == [site + "/private/b"]
+    assert cache.fetches == 1
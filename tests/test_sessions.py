@@ -0,0 +1,29 @@
+import threading
+
+from bitcrawler import sessions
+
+def test_session_pool_reuses_sessions():
+    pool = sessions.SessionPool(size=2)
+    with pool.session() as session1:
+        pass
+    with pool.session() as session2:
+        pass
+    assert session1 is session2
+    assert len(pool) == 1
+
+def test_session_pool_max_size():
+    pool = sessions.SessionPool(size=2)
+    session1 = pool.acquire()
+    session2 = pool.acquire()
+    assert session1 is not session2
+
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    thread.join(timeout=0.1)
+    assert not acquired
+
+    pool.release(session1)
+    thread.join(timeout=1)
+    assert acquired == [session1]
+    assert len(pool) == 2
@@ -0,0 +1,40 @@
+import pytest
+
+from bitcrawler import visited
+
+def test_visited_set_add():
+    urls = visited.VisitedSet()
+    assert urls.add("http://python.org")
+    assert not urls.add("http://python.org")
+    assert "http://python.org" in urls
+    assert "http://python.org/about" not in urls
+    assert len(urls) == 1
+
+def test_visited_set_memory():
+    urls = visited.VisitedSet()
+    assert urls.bytes_per_url == 0.0
+    for index in range(1000):
+        urls.add(f"http://python.org/page/{index}")
+    assert 0 < urls.bytes_per_url < 100
+
+def test_bloom_visited_set_add():
+    urls = visited.BloomVisitedSet(capacity=1000, error_rate=0.01)
+    assert urls.add("http://python.org")
+    assert not urls.add("http://python.org")
+    assert "http://python.org" in urls
+    assert len(urls) == 1
+
+def test_bloom_visited_set_error_rate():
+    urls = visited.BloomVisitedSet(capacity=10000, error_rate=0.01)
+    for index in range(10000):
+        urls.add(f"http://python.org/page/{index}")
+    false_positives = sum(
+        f"http://pandas.org/page/{index}" in urls for index in range(10000))
+    assert false_positives < 300
+    assert urls.memory_usage() < 15000
+
+def test_bloom_visited_set_invalid():
+    with pytest.raises(ValueError):
+        visited.BloomVisitedSet(capacity=0)
+    with pytest.raises(ValueError):
+        visited.BloomVisitedSet(error_rate=1)
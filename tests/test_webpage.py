@@ -1,5 +1,9 @@
+import io
+
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+import requests
 
 from bitcrawler import parsing
 from bitcrawler import webpage
@@ -122,3 +126,121 @@ def test_get_html_links__invalid_url(mock_get_links):
 #             cache_kwargs=cache_test,
 #             request_kwargs=request_test)
 #     assert allowed == False
+
+
+def test_fetch__with_session():
+    session = MagicMock()
+    url = "http://python.org"
+    webpage.Webpage.fetch(url, session=session, timeout=5)
+
+    session.get.assert_called_with(url, timeout=5)
+
+
+def make_response(body=b"<a href='/about'>About</a>"):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = requests.structures.CaseInsensitiveDict({
+        "Content-Type": "text/html; charset=utf-8",
+        "Set-Cookie": "session=1",
+    })
+    response.encoding = "utf-8"
+    response._content = body
+    return response
+
+def make_page():
+    page = webpage.Webpage()
+    page.url = "http://python.org"
+    page.response = make_response()
+    page.links = ["http://python.org/about"]
+    return page
+
+def test_page_record__none():
+    record = webpage.PageRecord.from_webpage(make_page())
+    assert record.url == "http://python.org"
+    assert record.status_code == 200
+    assert record.ok
+    assert record.headers == {"content-type": "text/html; charset=utf-8"}
+    assert record.links == ["http://python.org/about"]
+    assert record.body is None
+    assert record.response is None
+
+def test_page_record__full():
+    record = webpage.PageRecord.from_webpage(make_page(), "full")
+    assert record.body == b"<a href='/about'>About</a>"
+    assert record.text == "<a href='/about'>About</a>"
+
+def test_page_record__compressed():
+    body = b"<p>python</p>" * 1000
+    page = make_page()
+    page.response = make_response(body)
+    record = webpage.PageRecord.from_webpage(page, "compressed")
+    assert len(record._body) < len(body)
+    assert record.body == body
+
+def test_page_record__invalid_retention():
+    with pytest.raises(ValueError):
+        webpage.PageRecord.from_webpage(make_page(), "everything")
+
+def test_page_record__slots():
+    record = webpage.PageRecord()
+    with pytest.raises(AttributeError):
+        record.extra = True
+
+def make_stream(body, headers):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.raw = io.BytesIO(body)
+    return response
+
+def test_sniff_content_type():
+    assert webpage.Webpage.sniff_content_type(b"%PDF-1.7") == "application/pdf"
+    assert webpage.Webpage.sniff_content_type(b"  <!DOCTYPE html><p>") == "text/html"
+    assert webpage.Webpage.sniff_content_type(b"plain text") is None
+
+def test_download():
+    response = make_stream(b"<p>python</p>", {"Content-Type": "text/html"})
+    reason = webpage.Webpage.download(response, ["text/html"], max_body_size=100)
+    assert reason is None
+    assert response.content == b"<p>python</p>"
+
+def test_download__content_type():
+    response = make_stream(b"%PDF-1.7", {"Content-Type": "application/pdf"})
+    reason = webpage.Webpage.download(response, ["text/html"])
+    assert "application/pdf" in reason
+    assert response.content == b""
+
+def test_download__sniffed_content_type():
+    response = make_stream(b"%PDF-1.7", {})
+    assert "application/pdf" in webpage.Webpage.download(response, ["text/html"])
+
+def test_download__content_length():
+    response = make_stream(b"x" * 10, {"Content-Length": "10"})
+    assert "Content length" in webpage.Webpage.download(response, max_body_size=5)
+
+def test_download__body_size():
+    response = make_stream(b"x" * 10, {})
+    assert "max body size" in webpage.Webpage.download(response, max_body_size=5)
+    assert response.content == b""
+
+def test_build__aborted():
+    response = make_stream(b"%PDF-1.7", {"Content-Type": "application/pdf"})
+    with patch('requests.get', return_value=response) as requests_get_mock:
+        page = webpage.WebpageBuilder.build(
+            "http://python.org/file.pdf", "bitcrawler", respect_robots=False,
+            allowed_content_types=["text/html"])
+    assert requests_get_mock.call_args.kwargs['stream'] is True
+    assert page.message.startswith("Aborted fetching http://python.org/file.pdf")
+    assert page.get_page_links() == []
+
+def test_extract_links():
+    links, canonical_url = webpage.extract_links(
+        "http://python.org/docs/",
+        b'<link rel="canonical" href="/docs"><a href="/about">About</a>',
+        {"Content-Type": "text/html"}, "utf-8", canonical=True)
+    assert links == ["http://python.org/about"]
+    assert canonical_url == "http://python.org/docs"
+
+def test_extract_links__not_html():
+    assert webpage.extract_links(
+        "http://python.org", b"%PDF", {"Content-Type": "application/pdf"}) == ([], None)